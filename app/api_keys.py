@@ -1,54 +1,106 @@
+import logging
 import sqlite3
+import threading
 import uuid
-from expiringdict import ExpiringDict
 
 DEFAULT_DB_PATH = "api_keys.db"
 
 class Database:
-    def __init__(self, db_path = DEFAULT_DB_PATH, max_cache_len=1000, max_cache_age=30):
+    """API keys and their request limits.
+
+    Lookups are served from an in-memory snapshot of the whole table, so
+    rate limiting never touches SQLite. The snapshot is loaded on the first
+    lookup and reloaded by a background thread when another process (such as
+    manage.py) commits a change, which SQLite reports through
+    PRAGMA data_version. Each thread uses its own connection in WAL mode.
+
+    Args:
+        db_path (str): SQLite file of the keys.
+        refresh_interval (float): Seconds between checks for changes made
+            by other processes.
+
+    """
+
+    def __init__(self, db_path = DEFAULT_DB_PATH, refresh_interval=5):
         self.db_path = db_path
-        self.cache = ExpiringDict(max_len=max_cache_len, max_age_seconds=max_cache_age)
+        self.refresh_interval = refresh_interval
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.refresher = None
 
-        # Make sure to do data synchronization on writes!
-        self.c = sqlite3.connect(db_path, check_same_thread=False)
-        self.c.execute('''CREATE TABLE IF NOT EXISTS api_keys (
+        c = self.connection()
+        c.execute('PRAGMA journal_mode=WAL')
+        c.execute('''CREATE TABLE IF NOT EXISTS api_keys (
             "api_key"	TEXT NOT NULL,
             "req_limit"	INTEGER NOT NULL,
             PRIMARY KEY("api_key")
         );''')
+        c.commit()
+
+    def connection(self):
+        c = getattr(self.local, 'c', None)
+        if c is None:
+            c = self.local.c = sqlite3.connect(self.db_path, timeout=30)
+        return c
 
     def lookup(self, api_key):
-        req_limit = self.cache.get(api_key)
-        if req_limit is None:
-            # DB Lookup
-            stmt = self.c.execute('SELECT req_limit FROM api_keys WHERE api_key = ?', (api_key, ))
-            row = stmt.fetchone()
-            if row is not None:
-                self.cache[api_key] = row[0]
-                req_limit = row[0]
-            else:
-                self.cache[api_key] = False
-                req_limit = False
-        
-        if isinstance(req_limit, bool):
-            req_limit = None
-        
-        return req_limit
-    
+        snapshot = self.snapshot
+        if snapshot is None:
+            snapshot = self.load()
+        return snapshot.get(api_key)
+
+    def load(self):
+        """Reads the whole table into a new snapshot and starts watching for changes"""
+        with self.lock:
+            self.snapshot = dict(self.all())
+            if self.refresher is None and self.refresh_interval > 0:
+                self.refresher = threading.Thread(target=self.refresh, daemon=True)
+                self.refresher.start()
+            return self.snapshot
+
+    def refresh(self):
+        c = self.connection()
+        version = c.execute('PRAGMA data_version').fetchone()[0]
+        while not threading.Event().wait(self.refresh_interval):
+            try:
+                current = c.execute('PRAGMA data_version').fetchone()[0]
+                if current != version:
+                    version = current
+                    self.load()
+                    logging.info("Reloaded %s API keys" % len(self.snapshot))
+            except sqlite3.Error:
+                logging.exception("Unable to reload API keys")
+
     def add(self, req_limit, api_key = "auto"):
         if api_key == "auto":
             api_key = str(uuid.uuid4())
 
-        self.remove(api_key)
-        self.c.execute("INSERT INTO api_keys (api_key, req_limit) VALUES (?, ?)", (api_key, req_limit))
-        self.c.commit()
+        c = self.connection()
+        c.execute("INSERT OR REPLACE INTO api_keys (api_key, req_limit) VALUES (?, ?)", (api_key, req_limit))
+        c.commit()
+        self.update_snapshot(api_key, req_limit)
         return (api_key, req_limit)
-    
+
     def remove(self, api_key):
-        self.c.execute('DELETE FROM api_keys WHERE api_key = ?', (api_key, ))
-        self.c.commit()
+        c = self.connection()
+        c.execute('DELETE FROM api_keys WHERE api_key = ?', (api_key, ))
+        c.commit()
+        self.update_snapshot(api_key, None)
         return api_key
 
+    def update_snapshot(self, api_key, req_limit):
+        # Snapshots are replaced, never modified, so lookups need no lock
+        with self.lock:
+            if self.snapshot is None:
+                return
+            snapshot = dict(self.snapshot)
+            if req_limit is None:
+                snapshot.pop(api_key, None)
+            else:
+                snapshot[api_key] = req_limit
+            self.snapshot = snapshot
+
     def all(self):
-        row = self.c.execute("SELECT api_key, req_limit FROM api_keys")
-        return row.fetchall()
\ No newline at end of file
+        row = self.connection().execute("SELECT api_key, req_limit FROM api_keys")
+        return row.fetchall()
@@ -1,18 +1,31 @@
 import os
-from flask import Flask, render_template, jsonify, request, abort, send_from_directory, redirect
+from flask import Flask, render_template, jsonify, request, abort, send_file, redirect, Response, stream_with_context, g
 from flask_swagger import swagger
 from flask_swagger_ui import get_swaggerui_blueprint
-from langdetect import detect_langs
-from langdetect import DetectorFactory
 from pkg_resources import resource_filename
 from .api_keys import Database
-from pathlib import Path
+from .translator_cache import TranslatorCache
+from .batching import release_translation, translate_batch
+from .translation_cache import TranslationCache
+from .scheduler import BatchScheduler
+from .workers import WorkerPool
+from .stream import SentenceSplitter, iter_text_chunks, encode_stream_item
+from .detect import create_detector, group_by_language, CachedDetector
+from .jobs import JobQueue, TranscriptionWorkers
+from .projects import ProjectIndex, SORT_COLUMNS
+from .uploads import UploadStore, OffsetMismatch
+from .media import MediaProbePool, PROBE_PENDING
+from .downloads import DownloadCache
+from .language import load_languages
+from .readiness import ModelLoader
+from .stt import load_model
+from .metrics import REGISTRY, STAGE_BUCKETS, CONTENT_TYPE
+# Also registers the sqlite:// storage with Flask-Limiter
+from .limiter_storage import create_character_counter
 import json
 import uuid
 import shutil
-import ffmpeg
 from datetime import datetime, timedelta
-from deepspeech import Model, version
 from timeit import default_timer as timer
 import wave
 import numpy as np
@@ -21,13 +34,18 @@ import srt
 import glob
 import re
 import zipfile
-import subprocess
 import sys
+import mimetypes
+import threading
 
 home_dir=os.getcwd()
-DetectorFactory.seed = 0  # deterministic
 
 ALLOWED_EXTENSIONS = {'mp4', 'mkv', 'mp3'}
+PROJECTS_PAGE_SIZE = 50
+# Translated once per language pair by --preload-translators
+PRELOAD_TEXT = "Hello."
+# Endpoints reading the request body as a stream, their parameters come from the query string
+STREAMING_ENDPOINTS = {'translate_stream'}
 
 api_keys_db = None
 
@@ -50,19 +68,6 @@ class LoggerWriter:
         # to work properly for me.
         self.level(sys.stderr)
 
-def timeit(method):
-    def timed(*args, **kw):
-        ts = timer()
-        result = method(*args, **kw)
-        te = timer()
-        if 'log_time' in kw:
-            name = kw.get('log_name', method.__name__.upper())
-            kw['log_time'][name] = int((te - ts) * 1000)
-        else:
-            logging.info('%r  %2.2f ms' % (method.__name__, (te - ts) * 1000))
-        return result
-    return timed
-
 
 def get_remote_address():
     if request.headers.getlist("X-Forwarded-For"):
@@ -73,6 +78,19 @@ def get_remote_address():
     return ip
 
 
+def get_request_params():
+    """Returns the JSON body or the form and query values of the request, parsed once and shared by the limiter and the handler"""
+    if 'request_params' not in g:
+        if request.endpoint in STREAMING_ENDPOINTS:
+            # Parsing a form or JSON body would consume the streamed document
+            g.request_params = request.args
+        elif request.is_json:
+            g.request_params = request.get_json()
+        else:
+            g.request_params = request.values
+    return g.request_params
+
+
 def get_routes_limits(default_req_limit, api_keys_db):
     if default_req_limit == -1:
         # TODO: better way?
@@ -82,12 +100,7 @@ def get_routes_limits(default_req_limit, api_keys_db):
         req_limit = default_req_limit
 
         if api_keys_db:
-            if request.is_json:
-                json = request.get_json()
-                api_key = json.get('api_key')
-            else:
-                api_key = request.values.get("api_key")
-
+            api_key = get_request_params().get("api_key")
             if api_key:
                 db_req_limit = api_keys_db.lookup(api_key)
                 if db_req_limit is not None:
@@ -102,25 +115,148 @@ def create_app(args):
     logging.basicConfig(level=logging.DEBUG)
     sys.stdout = LoggerWriter(logging.debug)
     sys.stderr = LoggerWriter(logging.warning)
-    if not args.offline:
-        from app.init import boot
-        boot()
 
-    from app.language import languages
+    def load_argos_languages():
+        if not args.offline:
+            from app.init import boot
+            boot()
+        return load_languages()
+
+    def load_stt_model():
+        ds, path = load_model(os.path.join(home_dir, "models"), args.stt_model_format)
+        logging.info('Loaded ' + path)
+        logging.info('Model optimized for a sample rate of ' +
+                     str(ds.sampleRate()))
+        return ds
+
+    # Independent models load in parallel, /health/ready reports when they are done
+    models = ModelLoader()
+    models.submit("languages", load_argos_languages)
+    if args.stt_model == "skip":
+        # Transcription runs in scripts/batch.py, which loads its own model
+        models.skip("deepspeech")
+    else:
+        # Only checks that the model loads, nothing in this process needs it to serve
+        models.submit("deepspeech", load_stt_model, required=False)
+        if args.stt_model == "startup":
+            models.get("deepspeech")
+
     app = Flask(__name__)
 
     project_directory = args.project_directory
     if not os.path.exists(project_directory):
         os.makedirs(project_directory)
-
+    project_index = ProjectIndex(args.projects_db, project_directory)
+    logging.info("Indexed %s projects" % project_index.rebuild())
+    uploads = UploadStore(project_directory, ALLOWED_EXTENSIONS)
+    if args.upload_expiry > 0:
+        uploads.start_expiry(args.upload_expiry)
+    downloads = DownloadCache(project_directory)
+    # Probing and thumbnails run here so uploads return once the file is on disk
+    probe_pool = MediaProbePool(project_directory, size=args.probe_workers,
+                                thumbnail_widths=args.thumbnail_sizes, on_done=project_index.refresh)
+    for project in project_index.list(limit=-1)[0]:
+        if project.get('probe') == PROBE_PENDING:
+            probe_pool.submit(project['id'])
+
+    # The routes need the languages, so the server only starts serving once they are loaded
+    languages = models.get("languages")
     # For faster access
     language_map = {}
     for l in languages:
         language_map[l.code] = l.name
 
+    translators = TranslatorCache(languages, max_size=args.translator_cache_size, release=release_translation)
+
+    translation_cache = TranslationCache(max_size=args.cache_size, ttl=args.cache_ttl,
+                                         db_path=args.cache_db, db_max_size=args.cache_db_size)
+
+    if args.translation_workers > 0:
+        # Models are loaded by the worker processes, the translator passed
+        # around in this process is just the language pair
+        worker_pool = WorkerPool(args.translation_workers, args.max_batch_tokens,
+                                 detector=(args.detector, list(language_map.keys())),
+                                 translator_cache_size=args.translator_cache_size)
+        scheduler = BatchScheduler(
+            lambda pair, texts: worker_pool.translate(pair[0], pair[1], texts),
+            window=args.batch_window_ms / 1000.0, max_batch_size=args.batch_max_size)
+        # Results are memoized here so repeated texts never leave this process
+        detector = CachedDetector(worker_pool, max_chars=args.detect_max_chars, cache_size=args.detect_cache_size)
+    else:
+        worker_pool = None
+        scheduler = BatchScheduler(
+            lambda translator, texts: translate_batch(translator, texts, args.max_batch_tokens),
+            window=args.batch_window_ms / 1000.0, max_batch_size=args.batch_max_size)
+        detector = create_detector(args.detector, list(language_map.keys()), max_chars=args.detect_max_chars,
+                                   cache_size=args.detect_cache_size)
+
+    def load_pair(source_lang, target_lang, translator):
+        # A short translation loads the model, tokenizer and sentence splitter of the pair
+        if worker_pool is not None:
+            worker_pool.translate(source_lang, target_lang, [PRELOAD_TEXT])
+        else:
+            translate_batch(translator, [PRELOAD_TEXT], args.max_batch_tokens)
+
+    if args.preload_translators:
+        models.submit("translators", lambda: translators.warm(load=load_pair))
+
+    request_count = REGISTRY.counter("libretranslate_requests_total", "Requests served",
+                                     ["route", "method", "status"])
+    request_seconds = REGISTRY.histogram("libretranslate_request_seconds", "Time to build the response of a request",
+                                         ["route"])
+    translate_seconds = REGISTRY.histogram("libretranslate_translate_seconds",
+                                           "Time to translate texts of a language pair, cache lookups included",
+                                           ["source", "target"])
+    translated_characters = REGISTRY.counter("libretranslate_translated_characters_total",
+                                             "Characters submitted for translation", ["source", "target"])
+    detect_seconds = REGISTRY.histogram("libretranslate_detect_seconds", "Time to detect the language of texts")
+    batch_stage_seconds = REGISTRY.histogram("libretranslate_batch_stage_seconds",
+                                             "Duration of the transcription pipeline functions, measured by the workers",
+                                             ["stage"], buckets=STAGE_BUCKETS)
+
+    def detect_languages(texts):
+        start = timer()
+        detections = detector.detect_batch(texts)
+        detect_seconds.observe(timer() - start)
+        return detections
+
+    def detect_source_languages(texts):
+        """Returns the most likely source language of each text, en if nothing matches"""
+        source_langs = []
+        for candidate_langs in detect_languages(texts):
+            if args.debug:
+                print(candidate_langs)
+            source_langs.append(candidate_langs[0].lang if len(candidate_langs) > 0 else 'en')
+
+        if args.debug:
+            print("Auto detected: %s" % source_langs)
+        return source_langs
+
+    def detect_source_language(q):
+        return detect_source_languages([q])[0]
+
+    def translate_texts(source_lang, target_lang, texts):
+        if worker_pool is not None:
+            translator = (source_lang, target_lang)
+        else:
+            translator = translators.get(source_lang, target_lang)
+        if args.debug:
+            print("Translator cache: %s" % translators.stats())
+            print("Translation cache: %s" % translation_cache.stats())
+
+        def translate_fn(texts):
+            return scheduler.translate(source_lang, target_lang, translator, texts)
+
+        start = timer()
+        translated = translation_cache.translate(source_lang, target_lang, texts, translate_fn)
+        translate_seconds.observe(timer() - start, source_lang, target_lang)
+        translated_characters.inc(source_lang, target_lang, amount=sum(len(text) for text in texts))
+        return translated
+
     if args.debug:
         app.config['TEMPLATES_AUTO_RELOAD'] = True
     app.config['MAX_CONTENT_LENGTH'] = 64 * 1024 * 1024
+    app.config['USE_X_SENDFILE'] = args.x_sendfile
     # Map userdefined frontend languages to argos language object.
     if args.frontend_language_source == "auto":
         frontend_argos_language_source = type('obj', (object,), {
@@ -148,19 +284,91 @@ def create_app(args):
             app,
             key_func=get_remote_address,
             default_limits=get_routes_limits(
-                args.req_limit, Database() if args.api_keys else None)
+                args.req_limit, Database() if args.api_keys else None),
+            storage_uri=args.limiter_storage,
+            strategy="moving-window"
         )
-    model_load_start = timer()
-    ds = Model(os.path.join(home_dir,"models","deepspeech-0.9.3-models.pbmm"))
-    ds.enableExternalScorer(os.path.join(home_dir,"models","deepspeech-0.9.3-models.scorer"))
-    model_load_end = timer() - model_load_start
-    logging.info('Loaded model in {:.3}s.'.format(model_load_end))
-    desired_sample_rate = ds.sampleRate()
-    logging.info('Model optimized for a sample rate of ' +
-                 str(desired_sample_rate))
+    character_counter = create_character_counter(args.limiter_storage) if args.chars_per_minute > 0 else None
+
+    def within_character_limit(chars):
+        """Counts chars against the --chars-per-minute budget of the client, False once it is used up"""
+        if character_counter is None:
+            return True
+        key = get_request_params().get("api_key") or get_remote_address()
+        return character_counter.hit(key, chars, args.chars_per_minute)
+
+    jobs = JobQueue(args.jobs_db)
+    transcription_workers = TranscriptionWorkers(args.transcription_workers, jobs,
+                                                 os.path.join(home_dir, 'scripts', 'batch.py'), home_dir,
+                                                 worker_args=["--projects-db", os.path.abspath(args.projects_db),
+                                                              "--stt-workers", str(args.stt_workers),
+                                                              "--stt-model-format", args.stt_model_format,
+                                                              "--translate-workers", str(args.subtitle_translate_workers),
+                                                              "--vad-min-rms", str(args.vad_min_rms)]
+                                                 + (["--keep-wav"] if args.keep_wav else []))
+    transcription_workers.start()
+
+    def cache_stats():
+        stats = {'translator': translators.stats(), 'detection': detector.stats()}
+        for tier, tier_stats in translation_cache.stats().items():
+            stats['translation_' + tier] = tier_stats
+        return stats
+
+    def cache_hit_ratio(stats):
+        lookups = stats['hits'] + stats['misses']
+        return stats['hits'] / lookups if lookups > 0 else 0.0
+
+    REGISTRY.gauge("libretranslate_cache_size", "Entries held by each cache",
+                   lambda: {(name, ): stats['size'] for name, stats in cache_stats().items()}, ["cache"])
+    REGISTRY.gauge("libretranslate_cache_hits", "Lookups answered by each cache",
+                   lambda: {(name, ): stats['hits'] for name, stats in cache_stats().items()}, ["cache"])
+    REGISTRY.gauge("libretranslate_cache_misses", "Lookups missed by each cache",
+                   lambda: {(name, ): stats['misses'] for name, stats in cache_stats().items()}, ["cache"])
+    REGISTRY.gauge("libretranslate_cache_hit_ratio", "Share of the lookups answered by each cache",
+                   lambda: {(name, ): cache_hit_ratio(stats) for name, stats in cache_stats().items()}, ["cache"])
+    REGISTRY.gauge("libretranslate_batch_queue_depth", "Translation requests waiting to be grouped into a batch",
+                   scheduler.queue_depth, ["source", "target"])
+    REGISTRY.gauge("libretranslate_transcription_queue_depth", "Transcription jobs waiting for a worker",
+                   jobs.queue_depth)
+
+    # Timings are stored in the jobs database by the workers, observe those
+    # stored since startup and not seen yet
+    timings_lock = threading.Lock()
+    last_timing = {'id': jobs.last_timing_id()}
+
+    def collect_batch_timings():
+        with timings_lock:
+            for timing_id, stage, seconds in jobs.timings_since(last_timing['id']):
+                batch_stage_seconds.observe(seconds, stage)
+                last_timing['id'] = timing_id
+            # Kept for a while for other servers sharing --jobs-db
+            jobs.prune_timings()
+
+    REGISTRY.add_collector("batch_timings", collect_batch_timings)
+
     uuid4hex = re.compile(
         '[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\Z', re.I)
 
+    if args.metrics:
+        @app.before_request
+        def start_request_timer():
+            g.request_start = timer()
+
+        @app.after_request
+        def observe_request(response):
+            if 'request_start' in g:
+                # The rule rather than the path, so project ids do not make a series each
+                route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+                request_seconds.observe(timer() - g.request_start, route)
+                request_count.inc(route, request.method, str(response.status_code))
+            return response
+
+        @app.route("/metrics")
+        @limiter.exempt
+        def metrics():
+            """Metrics in the Prometheus text format"""
+            return Response(REGISTRY.exposition(), content_type=CONTENT_TYPE)
+
     @app.errorhandler(400)
     def invalid_api(e):
         return jsonify({"error": str(e.description)}), 400
@@ -173,6 +381,13 @@ def create_app(args):
     def slow_down_error(e):
         return jsonify({"error": "Slowdown: " + str(e.description)}), 429
 
+    @app.route("/health/ready")
+    @limiter.exempt
+    def health_ready():
+        """Readiness of the models, 503 until all of them are loaded"""
+        ready = models.ready()
+        return jsonify({'ready': ready, 'models': models.status()}), 200 if ready else 503
+
     @app.route("/")
     @limiter.exempt
     def index():
@@ -181,7 +396,13 @@ def create_app(args):
     @app.route("/projects")
     @limiter.exempt
     def projects():
-        return render_template('projects.html', gaId=args.ga_id, frontendTimeout=args.frontend_timeout, offline=args.offline, api_keys=args.api_keys, projects=loadAllProjects(), web_version=os.environ.get('LT_WEB') is not None)
+        page = request.args.get("page", default=1, type=int)
+        if page < 1:
+            page = 1
+        projects, total = project_index.list(offset=(page - 1) * PROJECTS_PAGE_SIZE, limit=PROJECTS_PAGE_SIZE,
+                                             q=request.args.get("q"))
+        return render_template('projects.html', gaId=args.ga_id, frontendTimeout=args.frontend_timeout, offline=args.offline, api_keys=args.api_keys, projects=projects,
+                               page=page, has_next=page * PROJECTS_PAGE_SIZE < total, q=request.args.get("q", ""), web_version=os.environ.get('LT_WEB') is not None)
 
     @app.route("/project/<id>")
     @limiter.exempt
@@ -189,7 +410,8 @@ def create_app(args):
         if not uuid4hex.match(id):
             logging.error("Invalid project id")
             return redirect("/projects")
-        return render_template('project.html', gaId=args.ga_id, frontendTimeout=args.frontend_timeout, offline=args.offline, api_keys=args.api_keys, project=loadProjectDetails(id), web_version=os.environ.get('LT_WEB') is not None)
+        # Re-read from disk so subtitles show up while a transcription runs
+        return render_template('project.html', gaId=args.ga_id, frontendTimeout=args.frontend_timeout, offline=args.offline, api_keys=args.api_keys, project=project_index.refresh(id), web_version=os.environ.get('LT_WEB') is not None)
 
     @app.route("/project/<id>/delete")
     @limiter.exempt
@@ -201,24 +423,85 @@ def create_app(args):
     @limiter.exempt
     def projectTranscribe(id):
         if not uuid4hex.match(id):
-            flash("Invalid project id")
+            logging.error("Invalid project id")
             return redirect("/projects")
-        logging.info("Starting the transcription job for project ID "+id)
-        cmd = [sys.executable, os.path.join(home_dir,'scripts', 'batch.py', "--target-dir", os.path.join(project_directory, id))]
-        subprocess.Popen(cmd,
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.STDOUT)
+        job_id, created = jobs.enqueue(id, os.path.join(project_directory, id))
+        if created:
+            logging.info("Queued transcription job %s for project ID %s" % (job_id, id))
+        else:
+            logging.info("Transcription job %s for project ID %s is already queued or running" % (job_id, id))
+        transcription_workers.ensure_running()
         return redirect("/project/"+id)
 
+    @app.route("/project/<id>/status")
+    @limiter.exempt
+    def projectStatus(id):
+        """
+        Retrieve the progress of the latest transcription job of a project
+        ---
+        tags:
+          - list
+        responses:
+          200:
+            description: Job status
+            schema:
+              id: job-status
+              type: object
+              properties:
+                status:
+                  type: string
+                  description: queued, running, done, failed or none if the project was never transcribed
+                stage:
+                  type: string
+                  description: Stage currently running
+                percent:
+                  type: integer
+                  description: Overall progress
+                stages:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      name:
+                        type: string
+                        description: audio, stt, chunking, translate:<language code> or zip
+                      percent:
+                        type: integer
+                        description: Progress of the stage
+                error:
+                  type: string
+                  description: Error message of a failed job
+        """
+        if not uuid4hex.match(id):
+            abort(400, description="Invalid project id")
+        status = jobs.status(id)
+        if status is None:
+            return jsonify({"status": "none", "stage": None, "percent": 0, "stages": [], "error": None})
+        return jsonify(status)
+
     @app.route("/project/<id>/download/<file>")
     def download(id, file):
-        # todo validate the file part
-
-        metadata = loadProjectDetails(id)
-        if metadata is None:
-            logging.info("Unable to find metdata for project ID: "+id)
+        if not uuid4hex.match(id):
+            abort(400, description="Invalid project id")
+        found = downloads.lookup(id, file)
+        if found is None:
+            logging.info("Unable to find file %s of project ID: %s" % (file, id))
             return redirect("/projects")
-        return send_from_directory(directory=metadata['project_dir'], filename=file, as_attachment=True)
+
+        if args.x_accel_redirect:
+            # The reverse proxy serves the file, ranges included
+            response = Response(mimetype=mimetypes.guess_type(file)[0] or 'application/octet-stream')
+            response.headers['X-Accel-Redirect'] = args.x_accel_redirect.rstrip('/') + '/' + id + '/' + file
+            response.headers['Content-Disposition'] = 'attachment; filename="%s"' % file
+            response.last_modified = found.mtime
+        else:
+            response = send_file(found.path, as_attachment=True, add_etags=False, conditional=False,
+                                 last_modified=found.mtime)
+        response.set_etag(found.etag)
+        if args.x_sendfile or args.x_accel_redirect:
+            return response.make_conditional(request)
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response.make_conditional(request, accept_ranges=True, complete_length=found.size)
 
     @app.route("/create-project")
     @limiter.exempt
@@ -246,40 +529,166 @@ def create_app(args):
                 fileending = file.filename.rsplit('.', 1)[1].lower()
                 file.save(os.path.join(project_directory,
                                        project_id, "rawMedia."+fileending))
-                # TODO store original file name
-                metadata = createMetadata(
-                    project_id, request.form['name'], fileending)
+                metadata = {"name": request.form['name'], "fileEnding": fileending,
+                            "originalFilename": file.filename, "created": datetime.now().timestamp(),
+                            "probe": PROBE_PENDING}
                 with open(os.path.join(project_directory, project_id, "metadata.json"), 'w') as f:
                     json.dump(metadata, f)
+                project_index.refresh(project_id)
+                probe_pool.submit(project_id)
 
                 return redirect("./project/"+project_id)
-        
-
-    @timeit
-    def createMetadata(project_id, name, ending):
-        metadata = {"name": name, "fileEnding": ending}
-        in_filename = os.path.join(
-            project_directory, project_id, "rawMedia."+ending)
-        probe = ffmpeg.probe(in_filename)
-        video_stream = next(
-            (stream for stream in probe['streams'] if stream['codec_type'] == 'video'), None)
-        logging.debug(str(video_stream))
-        metadata['width'] = int(video_stream['width'])
-        metadata['height'] = int(video_stream['height'])
-        metadata['durationSeconds'] = float(video_stream['duration'])
-        (
-            ffmpeg
-            .input(in_filename, ss=3)
-            .filter('scale', 512, -1)
-            .output(os.path.join(project_directory, project_id, "thumbnail.png"), vframes=1)
-            .run()
-        )
-        return metadata
+
+    @app.route("/project/upload", methods=['POST'])
+    @limiter.exempt
+    def uploadStart():
+        """
+        Start a resumable upload of a new project
+        ---
+        tags:
+          - upload
+        parameters:
+          - in: formData
+            name: name
+            schema:
+              example: My lecture
+            required: true
+            description: Project name
+          - in: formData
+            name: filename
+            schema:
+              example: lecture.mp4
+            required: true
+            description: Name of the media file, its extension gives the file type
+          - in: formData
+            name: size
+            type: integer
+            required: true
+            description: Size of the media file in bytes
+        responses:
+          200:
+            description: Upload state
+            schema:
+              id: upload-state
+              type: object
+              properties:
+                id:
+                  type: string
+                  description: Project id, used to send the chunks
+                offset:
+                  type: integer
+                  description: Number of bytes received, the next chunk starts here
+                size:
+                  type: integer
+                  description: Size of the media file in bytes
+                chunkSize:
+                  type: integer
+                  description: Largest chunk accepted
+                complete:
+                  type: boolean
+                  description: Whether all bytes were received
+          400:
+            description: Invalid request
+        """
+        params = get_request_params()
+        name = params.get("name")
+        filename = params.get("filename")
+        size = params.get("size")
+        if not filename:
+            abort(400, description="Invalid request: missing filename parameter")
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            abort(400, description="Invalid request: missing or invalid size parameter")
+        try:
+            state = uploads.create(name, filename, size)
+        except ValueError as e:
+            abort(400, description=str(e))
+        return jsonify(upload_response(state))
+
+    @app.route("/project/upload/<id>", methods=['GET'])
+    @limiter.exempt
+    def uploadState(id):
+        """
+        Retrieve the state of a resumable upload, to know where to resume it
+        ---
+        tags:
+          - upload
+        responses:
+          200:
+            description: Upload state
+            schema:
+              $ref: '#/definitions/upload-state'
+          404:
+            description: Unknown upload
+        """
+        if not uuid4hex.match(id):
+            abort(400, description="Invalid project id")
+        state = uploads.state(id)
+        if state is None:
+            abort(404, description="Unknown upload")
+        return jsonify(upload_response(state))
+
+    @app.route("/project/upload/<id>", methods=['PUT'])
+    @limiter.exempt
+    def uploadChunk(id):
+        """
+        Send the next chunk of a resumable upload as the raw request body
+        ---
+        tags:
+          - upload
+        parameters:
+          - in: query
+            name: offset
+            type: integer
+            required: true
+            description: Position of the chunk in the file, must be the offset of the upload state
+          - in: header
+            name: X-Chunk-SHA256
+            type: string
+            required: true
+            description: Hex sha256 of the chunk, the chunk is discarded if it does not match
+        responses:
+          200:
+            description: Upload state
+            schema:
+              $ref: '#/definitions/upload-state'
+          400:
+            description: Invalid chunk, resend it
+          404:
+            description: Unknown upload
+          409:
+            description: The chunk does not start at the offset of the upload, the response holds the upload state
+        """
+        if not uuid4hex.match(id):
+            abort(400, description="Invalid project id")
+        offset = request.args.get("offset", type=int)
+        if offset is None:
+            abort(400, description="Invalid request: missing offset parameter")
+        try:
+            state = uploads.write_chunk(id, offset, request.stream, request.content_length,
+                                        request.headers.get("X-Chunk-SHA256"))
+        except OffsetMismatch:
+            return jsonify(upload_response(uploads.state(id))), 409
+        except ValueError as e:
+            abort(400, description=str(e))
+        if state is None:
+            abort(404, description="Unknown upload")
+        if state["complete"]:
+            logging.info("Upload of project %s complete" % id)
+            project_index.refresh(id)
+            probe_pool.submit(id)
+        return jsonify(upload_response(state))
+
+    def upload_response(state):
+        return {"id": state["id"], "offset": state["offset"], "size": state["size"],
+                "chunkSize": uploads.chunk_size, "complete": state["complete"]}
 
     def delete_project(project_id):
         logging.info("Deleting a project with ID: "+project_id)
         # TODO make sure tha ID is a valid ID an not just some bad path
         shutil.rmtree(os.path.join(project_directory, project_id))
+        project_index.remove(project_id)
 
     @app.route("/languages", methods=['GET', 'POST'])
     @limiter.exempt
@@ -321,9 +730,9 @@ def create_app(args):
     def after_request(response):
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.headers.add('Access-Control-Allow-Headers',
-                             "Authorization, Content-Type")
+                             "Authorization, Content-Type, X-Chunk-SHA256")
         response.headers.add('Access-Control-Expose-Headers', "Authorization")
-        response.headers.add('Access-Control-Allow-Methods', "GET, POST")
+        response.headers.add('Access-Control-Allow-Methods', "GET, POST, PUT")
         response.headers.add('Access-Control-Allow-Credentials', "true")
         response.headers.add('Access-Control-Max-Age', 60 * 60 * 24 * 20)
         return response
@@ -335,36 +744,72 @@ def create_app(args):
         ---
         tags:
           - list
+        parameters:
+          - in: query
+            name: offset
+            type: integer
+            default: 0
+            description: Number of projects to skip
+          - in: query
+            name: limit
+            type: integer
+            default: 50
+            description: Maximum number of projects to return (-1 for all)
+          - in: query
+            name: sort
+            type: string
+            enum: [created, name, duration]
+            default: created
+            description: Sort key
+          - in: query
+            name: order
+            type: string
+            enum: [asc, desc]
+            default: desc
+            description: Sort order
+          - in: query
+            name: q
+            type: string
+            description: Only projects whose name contains this text
+          - in: query
+            name: transcribed
+            type: boolean
+            description: Only projects with (true) or without (false) subtitles
+        responses:
+          200:
+            description: Page of projects
+            schema:
+              type: object
+              properties:
+                projects:
+                  type: array
+                  items:
+                    type: object
+                total:
+                  type: integer
+                  description: Number of projects matching the filters
+          400:
+            description: Invalid request
         """
-        return jsonify({"projects": loadAllProjects()})
-
-    def loadAllProjects():
-        output = []
-        for project_id in os.listdir(project_directory):
-            project_details = loadProjectDetails(project_id)
-            if project_details is not None:
-                output.append(project_details)
-        return output
-
-    def loadProjectDetails(project_id):
-        metadata_path = os.path.join(
-            project_directory, project_id, "metadata.json")
-        if not os.path.exists(metadata_path):
-            return None
-        metadata = json.loads(Path(metadata_path).read_text())
-        metadata["id"] = project_id
-        metadata['project_dir'] = os.path.join(project_directory, project_id)
-        # TODO rely on this data for everything
-        metadata['subtitles'] = []
-        for file in os.listdir(metadata['project_dir']):
-            if file.endswith(".srt"):
-                metadata['subtitles'].append(file)
-        if os.path.exists(os.path.join(project_directory,"subtitles.zip")):
-            metadata['subtitles'].insert(0, 'subtitles.zip')
-        metadata['inputVideo'] = "rawMedia."+metadata['fileEnding']
-
-        metadata['audio'] = "audio.wav"
-        return metadata
+        offset = request.args.get("offset", default=0, type=int)
+        limit = request.args.get("limit", default=50, type=int)
+        sort = request.args.get("sort", default="created")
+        order = request.args.get("order", default="desc")
+        transcribed = request.args.get("transcribed")
+        if offset < 0 or limit < -1:
+            abort(400, description="Invalid request: offset and limit must be positive")
+        if sort not in SORT_COLUMNS:
+            abort(400, description="Invalid request: sort must be one of %s" % ", ".join(SORT_COLUMNS))
+        if order not in ("asc", "desc"):
+            abort(400, description="Invalid request: order must be asc or desc")
+        if transcribed is not None:
+            if transcribed.lower() not in ("true", "false"):
+                abort(400, description="Invalid request: transcribed must be true or false")
+            transcribed = transcribed.lower() == "true"
+
+        projects, total = project_index.list(offset=offset, limit=limit, sort=sort, order=order,
+                                             q=request.args.get("q"), transcribed=transcribed)
+        return jsonify({"projects": projects, "total": total})
 
     @app.route("/translate", methods=['POST'])
     def translate():
@@ -446,15 +891,10 @@ def create_app(args):
                   description: Reason for slow down
         """
 
-        if request.is_json:
-            json = request.get_json()
-            q = json.get('q')
-            source_lang = json.get('source')
-            target_lang = json.get('target')
-        else:
-            q = request.values.get("q")
-            source_lang = request.values.get("source")
-            target_lang = request.values.get("target")
+        params = get_request_params()
+        q = params.get('q')
+        source_lang = params.get('source')
+        target_lang = params.get('target')
 
         if not q:
             abort(400, description="Invalid request: missing q parameter")
@@ -471,56 +911,190 @@ def create_app(args):
                 abort(400, description="Invalid request: Request (%d) exceeds text limit (%d)" % (
                     batch_size, args.batch_limit))
 
-        if args.char_limit != -1:
-            if batch:
-                chars = sum([len(text) for text in q])
-            else:
-                chars = len(q)
+        if batch:
+            chars = sum([len(text) for text in q])
+        else:
+            chars = len(q)
 
+        if args.char_limit != -1:
             if args.char_limit < chars:
                 abort(400, description="Invalid request: Request (%d) exceeds character limit (%d)" % (
                     chars, args.char_limit))
 
-        if source_lang == 'auto':
-            candidate_langs = list(
-                filter(lambda l: l.lang in language_map, detect_langs(q)))
-
-            if len(candidate_langs) > 0:
-                candidate_langs.sort(key=lambda l: l.prob, reverse=True)
-
-                if args.debug:
-                    print(candidate_langs)
-
-                source_lang = next(
-                    iter([l.code for l in languages if l.code == candidate_langs[0].lang]), None)
-                if not source_lang:
-                    source_lang = 'en'
-            else:
-                source_lang = 'en'
-
-            if args.debug:
-                print("Auto detected: %s" % source_lang)
-
-        src_lang = next(
-            iter([l for l in languages if l.code == source_lang]), None)
-        tgt_lang = next(
-            iter([l for l in languages if l.code == target_lang]), None)
+        if not within_character_limit(chars):
+            abort(429, description="%d characters per minute" % args.chars_per_minute)
 
-        if src_lang is None:
-            abort(400, description="%s is not supported" % source_lang)
-        if tgt_lang is None:
+        if translators.get_language(target_lang) is None:
             abort(400, description="%s is not supported" % target_lang)
 
-        translator = src_lang.get_translation(tgt_lang)
+        texts = q if batch else [q]
+        if source_lang == 'auto':
+            source_langs = detect_source_languages(texts)
+        else:
+            if translators.get_language(source_lang) is None:
+                abort(400, description="%s is not supported" % source_lang)
+            source_langs = [source_lang] * len(texts)
 
         try:
+            # Each detected source language is translated as its own batch,
+            # results are put back in request order
+            translated = [None] * len(texts)
+            for lang, indices in group_by_language(source_langs).items():
+                for i, text in zip(indices, translate_texts(lang, target_lang, [texts[i] for i in indices])):
+                    translated[i] = text
+
             if batch:
-                return jsonify({"translatedText": [translator.translate(text) for text in q]})
+                return jsonify({"translatedText": translated})
             else:
-                return jsonify({"translatedText": translator.translate(q)})
+                return jsonify({"translatedText": translated[0]})
         except Exception as e:
             abort(500, description="Cannot translate text: %s" % str(e))
 
+    @app.route("/translate/stream", methods=['POST'])
+    def translate_stream():
+        """
+        Translate a long document, streaming back each sentence as soon as it is translated
+        ---
+        tags:
+          - translate
+        consumes:
+          - text/plain
+        produces:
+          - application/x-ndjson
+          - text/event-stream
+        parameters:
+          - in: body
+            name: body
+            schema:
+              type: string
+              example: Hello world! How are you?
+            required: true
+            description: Text to translate, may be sent with chunked transfer encoding
+          - in: query
+            name: source
+            schema:
+              type: string
+              example: en
+            required: true
+            description: Source language code
+          - in: query
+            name: target
+            schema:
+              type: string
+              example: es
+            required: true
+            description: Target language code
+          - in: query
+            name: format
+            schema:
+              type: string
+              enum: [ndjson, sse]
+              example: ndjson
+            required: false
+            description: Output format, defaults to sse if the client accepts text/event-stream and ndjson otherwise
+          - in: query
+            name: api_key
+            schema:
+              type: string
+              example: xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx
+            required: false
+            description: API key
+        responses:
+          200:
+            description: One JSON object per translated segment, in document order
+            schema:
+              id: translate-stream-segment
+              type: object
+              properties:
+                index:
+                  type: integer
+                  description: Position of the segment in the document
+                translatedText:
+                  type: string
+                  description: Translated segment
+                separator:
+                  type: string
+                  description: Whitespace that followed the segment in the source, to rebuild the layout
+                error:
+                  type: string
+                  description: Set on the last object if translation stopped early
+          400:
+            description: Invalid request
+            schema:
+              id: error-response
+              type: object
+              properties:
+                error:
+                  type: string
+                  description: Error message
+          429:
+            description: Slow down
+            schema:
+              id: error-slow-down
+              type: object
+              properties:
+                error:
+                  type: string
+                  description: Reason for slow down
+        """
+        source_lang = request.args.get("source")
+        target_lang = request.args.get("target")
+        output_format = request.args.get("format")
+        if output_format is None:
+            output_format = "sse" if request.accept_mimetypes.best == "text/event-stream" else "ndjson"
+
+        if not source_lang:
+            abort(400, description="Invalid request: missing source parameter")
+        if not target_lang:
+            abort(400, description="Invalid request: missing target parameter")
+        if output_format not in ("ndjson", "sse"):
+            abort(400, description="Invalid request: format must be ndjson or sse")
+        if request.is_json or request.mimetype in ("application/x-www-form-urlencoded", "multipart/form-data"):
+            abort(400, description="Invalid request: send the document as the text/plain body")
+        if source_lang != 'auto' and translators.get_language(source_lang) is None:
+            abort(400, description="%s is not supported" % source_lang)
+        if translators.get_language(target_lang) is None:
+            abort(400, description="%s is not supported" % target_lang)
+
+        def encode(item):
+            return encode_stream_item(item, output_format)
+
+        def generate():
+            splitter = SentenceSplitter()
+            detected_source = source_lang if source_lang != 'auto' else None
+            index = 0
+            chars = 0
+
+            def translate_segments(segments):
+                nonlocal index, detected_source
+                for text, separator in segments:
+                    if text.strip():
+                        if detected_source is None:
+                            detected_source = detect_source_language(text)
+                        translated = translate_texts(detected_source, target_lang, [text])[0]
+                    else:
+                        translated = text
+                    yield encode({"index": index, "translatedText": translated, "separator": separator})
+                    index += 1
+
+            try:
+                for chunk in iter_text_chunks(request.stream):
+                    chars += len(chunk)
+                    if args.char_limit != -1 and args.char_limit < chars:
+                        yield encode({"error": "Invalid request: Request exceeds character limit (%d)" % args.char_limit})
+                        return
+                    if not within_character_limit(len(chunk)):
+                        yield encode({"error": "Slowdown: %d characters per minute" % args.chars_per_minute})
+                        return
+                    yield from translate_segments(splitter.feed(chunk))
+                yield from translate_segments(splitter.flush())
+            except Exception as e:
+                yield encode({"error": "Cannot translate text: %s" % str(e)})
+
+        mimetype = "text/event-stream" if output_format == "sse" else "application/x-ndjson"
+        return Response(stream_with_context(generate()), mimetype=mimetype,
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
     @app.route("/detect", methods=['POST'])
     def detect():
         """
@@ -591,18 +1165,14 @@ def create_app(args):
                   type: string
                   description: Reason for slow down
         """
-        if request.is_json:
-            json = request.get_json()
-            q = json.get('q')
-        else:
-            q = request.values.get("q")
+        q = get_request_params().get('q')
 
         if not q:
             abort(400, description="Invalid request: missing q parameter")
 
-        candidate_langs = list(
-            filter(lambda l: l.lang in language_map, detect_langs(q)))
-        candidate_langs.sort(key=lambda l: l.prob, reverse=True)
+        start = timer()
+        candidate_langs = detector.detect(q)
+        detect_seconds.observe(timer() - start)
         return jsonify([{
             'confidence': l.prob,
             'language': l.lang
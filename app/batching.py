@@ -0,0 +1,178 @@
+import threading
+
+import ctranslate2
+import sentencepiece as spm
+import stanza
+from argostranslate.translate import (CachedTranslation, CompositeTranslation,
+                                      IdentityTranslation, PackageTranslation)
+
+DEFAULT_MAX_BATCH_TOKENS = 1024
+
+# Sentencepiece and stanza processors per package path. argostranslate
+# reloads both on every call, which costs more than the translation itself
+# for short texts. A stanza pipeline is not thread safe, each comes with a
+# lock held while it runs.
+_processors = {}
+_processors_lock = threading.Lock()
+# argostranslate creates PackageTranslation.translator on first use
+_translator_lock = threading.Lock()
+
+
+def get_processors(pkg):
+    key = str(pkg.package_path)
+    with _processors_lock:
+        processors = _processors.get(key)
+        if processors is None:
+            sp_processor = spm.SentencePieceProcessor(
+                model_file=str(pkg.package_path / 'sentencepiece.model'))
+            stanza_pipeline = stanza.Pipeline(lang=pkg.from_code,
+                                              dir=str(pkg.package_path / 'stanza'),
+                                              processors='tokenize', use_gpu=False,
+                                              logging_level='WARNING')
+            processors = (sp_processor, stanza_pipeline, threading.Lock())
+            _processors[key] = processors
+    return processors
+
+
+def translate_batch(translation, texts, max_batch_tokens=DEFAULT_MAX_BATCH_TOKENS):
+    """Translates a list of texts, sharing model invocations between them.
+
+    Args:
+        translation (ITranslation): Translation as returned by Language.get_translation.
+        texts ([str]): Texts to translate.
+        max_batch_tokens (int): Maximum number of source tokens sent to the
+            model in a single call (-1 for no limit).
+
+    Returns:
+        [str]: Translated texts, in the same order as texts.
+
+    """
+    if isinstance(translation, CachedTranslation):
+        return translate_batch(translation.underlying, texts, max_batch_tokens)
+    if isinstance(translation, IdentityTranslation):
+        return list(texts)
+    if isinstance(translation, CompositeTranslation):
+        return translate_batch(translation.t2,
+                               translate_batch(translation.t1, texts, max_batch_tokens),
+                               max_batch_tokens)
+    if isinstance(translation, PackageTranslation):
+        return translate_package_batch(translation, texts, max_batch_tokens)
+    return [translation.translate(text) for text in texts]
+
+
+def get_translator(translation):
+    """Returns the ctranslate2 model of a PackageTranslation, loading it once even for concurrent callers"""
+    if translation.translator is None:
+        with _translator_lock:
+            if translation.translator is None:
+                translation.translator = ctranslate2.Translator(
+                    str(translation.pkg.package_path / 'model'))
+    return translation.translator
+
+
+def package_translations(translation):
+    """Yields the PackageTranslations a translation is made of"""
+    if isinstance(translation, CachedTranslation):
+        yield from package_translations(translation.underlying)
+    elif isinstance(translation, CompositeTranslation):
+        yield from package_translations(translation.t1)
+        yield from package_translations(translation.t2)
+    elif isinstance(translation, PackageTranslation):
+        yield translation
+
+
+def release_translation(translation, keep=()):
+    """Frees the models of a translation that is no longer cached.
+
+    argostranslate keeps every PackageTranslation, with its loaded model, in
+    Language.translations_from, so dropping our own reference frees nothing.
+    The model, sentencepiece and stanza processors of each package are
+    dropped unless one of the keep translations also uses the package, and
+    are loaded again on next use.
+
+    Args:
+        translation (ITranslation): Translation evicted from the cache.
+        keep ([ITranslation]): Translations still in use.
+
+    """
+    kept = {str(t.pkg.package_path) for k in keep for t in package_translations(k)}
+    if isinstance(translation, CachedTranslation):
+        translation.cache = dict()
+    for t in package_translations(translation):
+        key = str(t.pkg.package_path)
+        if key in kept:
+            continue
+        with _translator_lock:
+            t.translator = None
+        with _processors_lock:
+            _processors.pop(key, None)
+
+
+def translate_package_batch(translation, texts, max_batch_tokens):
+    translator = get_translator(translation)
+    sp_processor, stanza_pipeline, stanza_lock = get_processors(translation.pkg)
+
+    # Split every text into paragraphs and sentences, remembering for each
+    # paragraph which range of the flat sentence list belongs to it
+    paragraph_ranges = []
+    tokenized = []
+    for text in texts:
+        ranges = []
+        for paragraph in translation.split_into_paragraphs(text):
+            start = len(tokenized)
+            with stanza_lock:
+                sentences = stanza_pipeline(paragraph).sentences
+            for sentence in sentences:
+                tokenized.append(sp_processor.encode(sentence.text, out_type=str))
+            ranges.append((start, len(tokenized)))
+        paragraph_ranges.append(ranges)
+
+    translated = [None] * len(tokenized)
+    for batch in make_batches(tokenized, max_batch_tokens):
+        results = translator.translate_batch(
+            [tokenized[i] for i in batch],
+            replace_unknowns=True,
+            max_batch_size=len(batch),
+            length_penalty=0.2)
+        for i, result in zip(batch, results):
+            translated[i] = result[0]['tokens']
+
+    output = []
+    for ranges in paragraph_ranges:
+        paragraphs = [detokenize(translated[start:end]) for start, end in ranges]
+        output.append(translation.combine_paragraphs(paragraphs))
+    return output
+
+
+def make_batches(tokenized, max_batch_tokens):
+    """Groups sentence indices into batches of at most max_batch_tokens tokens.
+
+    Sentences are sorted by length first so that each batch holds sentences
+    of similar size and little time is wasted on padding. A sentence longer
+    than max_batch_tokens gets a batch of its own.
+
+    """
+    order = sorted(range(len(tokenized)), key=lambda i: len(tokenized[i]))
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for i in order:
+        length = len(tokenized[i])
+        if batch and max_batch_tokens != -1 and batch_tokens + length > max_batch_tokens:
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(i)
+        batch_tokens += length
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def detokenize(sentences_tokens):
+    # Same as argostranslate.translate.apply_packaged_translation
+    detokenized = ''.join(token for tokens in sentences_tokens for token in tokens)
+    detokenized = detokenized.replace('▁', ' ')
+    if len(detokenized) > 0 and detokenized[0] == ' ':
+        detokenized = detokenized[1:]
+    return detokenized
@@ -0,0 +1,250 @@
+import json
+import os
+import threading
+from collections import namedtuple, OrderedDict
+
+import numpy as np
+import langdetect
+from langdetect import DetectorFactory, detect_langs
+from langdetect.lang_detect_exception import LangDetectException
+from langdetect.utils.ngram import NGram
+
+DetectorFactory.seed = 0  # deterministic
+
+Detection = namedtuple('Detection', ['lang', 'prob'])
+
+DETECTORS = ['langdetect', 'ngram']
+
+# langdetect only reports languages above this probability, the n-gram
+# detector does the same so both backends return similar candidate lists
+PROB_THRESHOLD = 0.1
+
+
+class LangdetectDetector:
+    """Detection with langdetect, restricted to the given language codes"""
+
+    def __init__(self, codes):
+        self.codes = set(codes)
+
+    def detect(self, text):
+        try:
+            candidates = detect_langs(text)
+        except LangDetectException:
+            return []
+        detections = []
+        for l in candidates:
+            # langdetect reports Chinese as zh-cn/zh-tw
+            lang = l.lang if l.lang in self.codes else l.lang.split('-')[0]
+            if lang in self.codes:
+                detections.append(Detection(lang, l.prob))
+        return detections
+
+    def detect_batch(self, texts):
+        return [self.detect(text) for text in texts]
+
+
+class NormalizeTable(dict):
+    """str.translate table applying langdetect's character normalization, filled on demand"""
+
+    def __missing__(self, code):
+        ch = NGram.normalize(chr(code))
+        self[code] = ch
+        return ch
+
+
+class NgramDetector:
+    """Naive Bayes classifier over langdetect's 1-3 gram profiles.
+
+    Only profiles of the given language codes are loaded. Scoring a text is
+    a single lookup of its n-grams in a (n-grams x languages) matrix of log
+    probabilities, instead of langdetect's randomized trials.
+
+    Args:
+        codes ([str]): Language codes to detect. Profiles such as zh-cn
+            are used for the code before the dash.
+        profiles_dir (str): Directory of langdetect profiles, the one bundled
+            with langdetect if None.
+        alpha (float): Additive smoothing for n-gram counts.
+
+    """
+
+    def __init__(self, codes, profiles_dir=None, alpha=0.5):
+        if profiles_dir is None:
+            profiles_dir = os.path.join(os.path.dirname(langdetect.__file__), 'profiles')
+
+        profiles = OrderedDict()
+        for name in sorted(os.listdir(profiles_dir)):
+            code = name.split('-')[0]
+            if code not in codes or code in profiles:
+                continue
+            with open(os.path.join(profiles_dir, name), encoding='utf-8') as f:
+                profiles[code] = json.load(f)
+
+        self.codes = list(profiles.keys())
+        self.table = NormalizeTable()
+        self.vocabulary = {}
+        for profile in profiles.values():
+            for gram in profile['freq']:
+                self.vocabulary.setdefault(gram, len(self.vocabulary))
+
+        counts = np.zeros((len(self.vocabulary), len(self.codes)), dtype=np.float64)
+        totals = np.zeros((3, len(self.codes)), dtype=np.float64)
+        for j, profile in enumerate(profiles.values()):
+            rows = [self.vocabulary[gram] for gram in profile['freq']]
+            counts[rows, j] = list(profile['freq'].values())
+            totals[:, j] = profile['n_words']
+
+        orders = np.array([len(gram) for gram in self.vocabulary], dtype=np.int64) - 1
+        vocabulary_sizes = np.bincount(orders, minlength=3)
+        denominators = totals[orders] + alpha * vocabulary_sizes[orders][:, None]
+        self.log_probs = np.log((counts + alpha) / denominators).astype(np.float32)
+
+    def ngrams(self, text):
+        grams = {}
+        for word in text.translate(self.table).split():
+            # langdetect skips words written in capitals (acronyms)
+            if len(word) > 1 and word.isupper():
+                continue
+            padded = " " + word + " "
+            for n in (1, 2, 3):
+                for i in range(len(padded) - n + 1):
+                    gram = padded[i:i + n]
+                    if gram != " ":
+                        grams[gram] = grams.get(gram, 0) + 1
+        return grams
+
+    def detect(self, text):
+        return self.detect_batch([text])[0]
+
+    def detect_batch(self, texts):
+        """Detects the language of each text with a single matrix lookup for the whole list"""
+        rows = []
+        weights = []
+        offsets = []
+        for text in texts:
+            offsets.append(len(rows))
+            for gram, count in self.ngrams(text).items():
+                row = self.vocabulary.get(gram)
+                if row is not None:
+                    rows.append(row)
+                    weights.append(count)
+        if not rows or not self.codes:
+            return [[] for text in texts]
+
+        weights = np.asarray(weights, dtype=np.float32)
+        contributions = weights[:, None] * self.log_probs[rows]
+        # reduceat needs strictly valid start offsets, texts without any
+        # known n-gram are filled in afterwards
+        known = [i for i in range(len(texts))
+                 if offsets[i] < (offsets[i + 1] if i + 1 < len(texts) else len(rows))]
+        scores = np.add.reduceat(contributions, [offsets[i] for i in known], axis=0)
+        scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+        probs = scores / scores.sum(axis=1, keepdims=True)
+
+        results = [[] for text in texts]
+        for k, i in enumerate(known):
+            order = np.argsort(-probs[k])
+            results[i] = [Detection(self.codes[j], float(probs[k, j])) for j in order if probs[k, j] > PROB_THRESHOLD]
+        return results
+
+
+class CachedDetector:
+    """Adds a memo for short texts and truncation of long texts to a detector.
+
+    Args:
+        backend: Object with detect(text) returning [Detection] and
+            detect_batch(texts) returning one such list per text.
+        max_chars (int): Only the first max_chars characters of a text are
+            looked at (-1 for the whole text).
+        cache_size (int): Number of short texts whose result is memoized
+            (0 to disable).
+        cache_max_chars (int): Texts up to this length are memoized.
+
+    """
+
+    def __init__(self, backend, max_chars=1000, cache_size=10000, cache_max_chars=256):
+        self.backend = backend
+        self.max_chars = max_chars
+        self.cache_size = cache_size
+        self.cache_max_chars = cache_max_chars
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def truncate(self, text):
+        if self.max_chars == -1 or len(text) <= self.max_chars:
+            return text
+        cut = text.rfind(" ", 0, self.max_chars)
+        return text[:cut if cut > 0 else self.max_chars]
+
+    def detect(self, text):
+        cacheable = self.cache_size > 0 and len(text) <= self.cache_max_chars
+        if cacheable:
+            with self.lock:
+                result = self.cache.get(text)
+                if result is not None:
+                    self.cache.move_to_end(text)
+                    self.hits += 1
+                    return result
+                self.misses += 1
+
+        result = self.backend.detect(self.truncate(text))
+
+        if cacheable:
+            with self.lock:
+                self.cache[text] = result
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return result
+
+    def detect_batch(self, texts):
+        results = [None] * len(texts)
+        # Texts still to detect, each sent to the backend once
+        missing = OrderedDict()
+        with self.lock:
+            for i, text in enumerate(texts):
+                if self.cache_size > 0 and len(text) <= self.cache_max_chars:
+                    result = self.cache.get(text)
+                    if result is not None:
+                        self.cache.move_to_end(text)
+                        self.hits += 1
+                        results[i] = result
+                        continue
+                    self.misses += 1
+                missing.setdefault(text, []).append(i)
+
+        if missing:
+            detected = self.backend.detect_batch([self.truncate(text) for text in missing])
+            with self.lock:
+                for (text, indices), result in zip(missing.items(), detected):
+                    for i in indices:
+                        results[i] = result
+                    if self.cache_size > 0 and len(text) <= self.cache_max_chars:
+                        self.cache[text] = result
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return results
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.cache), 'hits': self.hits, 'misses': self.misses}
+
+
+def group_by_language(langs):
+    """Returns {lang: [indices]} for a list of per-item languages, in order of first appearance"""
+    groups = OrderedDict()
+    for i, lang in enumerate(langs):
+        groups.setdefault(lang, []).append(i)
+    return groups
+
+
+def create_detector(name, codes, max_chars=1000, cache_size=10000):
+    """Returns a CachedDetector using the backend called name (see DETECTORS)"""
+    if name == 'ngram':
+        backend = NgramDetector(codes)
+    elif name == 'langdetect':
+        backend = LangdetectDetector(codes)
+    else:
+        raise ValueError("Unknown language detector %s" % name)
+    return CachedDetector(backend, max_chars=max_chars, cache_size=cache_size)
@@ -0,0 +1,88 @@
+import json
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+from app.manifest import MANIFEST_FILE
+
+# Files of a project folder that can be downloaded
+DOWNLOADABLE = re.compile(r'\A(rawMedia\.\w+|audio\.wav|[\w-]+\.srt|subtitles\.zip|thumbnail(-\d+)?\.png)\Z')
+
+DownloadFile = namedtuple('DownloadFile', ['path', 'size', 'mtime', 'etag'])
+
+
+class DownloadCache:
+    """Per-project whitelist of downloadable files and their ETags.
+
+    The listing of a project folder and its manifest hashes are cached until
+    the folder changes (files added, removed or renamed update the folder
+    mtime, so does every manifest write). A download then only costs a stat
+    of the folder and of the file.
+
+    ETags are the sha256 recorded in the manifest when the file still has the
+    recorded size and mtime, and are built from size and mtime otherwise.
+
+    Args:
+        project_directory (str): Directory holding one folder per project.
+        max_size (int): Number of projects kept in the cache.
+
+    """
+
+    def __init__(self, project_directory, max_size=1024):
+        self.project_directory = os.path.abspath(project_directory)
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def lookup(self, project_id, name):
+        """Returns a DownloadFile, or None if name is not a downloadable file of the project"""
+        project_dir = os.path.join(self.project_directory, project_id)
+        try:
+            dir_mtime = os.stat(project_dir).st_mtime_ns
+        except FileNotFoundError:
+            with self.lock:
+                self.cache.pop(project_id, None)
+            return None
+
+        with self.lock:
+            entry = self.cache.get(project_id)
+            if entry is not None and entry[0] == dir_mtime:
+                self.cache.move_to_end(project_id)
+                files = entry[1]
+            else:
+                files = None
+        if files is None:
+            files = self.scan(project_dir)
+            with self.lock:
+                self.cache[project_id] = (dir_mtime, files)
+                self.cache.move_to_end(project_id)
+                while len(self.cache) > self.max_size:
+                    self.cache.popitem(last=False)
+
+        if name not in files:
+            return None
+        path = os.path.join(project_dir, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        recorded = files[name]
+        if recorded is not None and recorded['size'] == st.st_size and recorded['mtime_ns'] == st.st_mtime_ns:
+            etag = recorded['hash']
+        else:
+            etag = "%x-%x" % (st.st_mtime_ns, st.st_size)
+        return DownloadFile(path, st.st_size, st.st_mtime, etag)
+
+    def scan(self, project_dir):
+        try:
+            with open(os.path.join(project_dir, MANIFEST_FILE)) as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            manifest = {}
+        files = {}
+        for name in os.listdir(project_dir):
+            if DOWNLOADABLE.match(name):
+                entry = manifest.get(name)
+                files[name] = entry if entry is not None and 'hash' in entry else None
+        return files
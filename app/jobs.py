@@ -0,0 +1,313 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+DEFAULT_DB_PATH = "jobs.db"
+# Times a job is claimed before a worker dying on it marks it failed
+DEFAULT_MAX_ATTEMPTS = 3
+# Pipeline timings older than this are deleted, servers sharing the queue
+# must collect them (i.e. be scraped) more often
+TIMINGS_RETENTION_SECONDS = 3600
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Stages of a transcription job, translations add one "translate:<code>"
+# stage per target language between chunking and zipping
+STAGE_AUDIO = "audio"
+STAGE_STT = "stt"
+STAGE_CHUNKING = "chunking"
+STAGE_ZIP = "zip"
+
+
+def translate_stage(lang_code):
+    return "translate:" + lang_code
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running as another user
+        return True
+    return True
+
+
+class JobQueue:
+    """Persistent queue of project transcription jobs.
+
+    The queue lives in an SQLite file shared by the web server, which
+    enqueues jobs, and the transcription workers, which claim them and
+    report progress per stage. A project has at most one queued or running
+    job at a time. A job whose worker died max_attempts times is marked
+    failed instead of being queued again. Jobs remember the host of their
+    worker, so instances on several hosts can share the queue.
+
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.host = socket.gethostname()
+        self.lock = threading.Lock()
+        self.c = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.c.execute('PRAGMA journal_mode=WAL')
+        self.c.execute('''CREATE TABLE IF NOT EXISTS jobs (
+            "id"	INTEGER PRIMARY KEY AUTOINCREMENT,
+            "project_id"	TEXT NOT NULL,
+            "target_dir"	TEXT NOT NULL,
+            "status"	TEXT NOT NULL,
+            "stages"	TEXT NOT NULL DEFAULT '[]',
+            "progress"	TEXT NOT NULL DEFAULT '{}',
+            "worker_pid"	INTEGER,
+            "worker_host"	TEXT,
+            "attempts"	INTEGER NOT NULL DEFAULT 0,
+            "error"	TEXT,
+            "created"	REAL NOT NULL,
+            "updated"	REAL NOT NULL
+        );''')
+        columns = [row[1] for row in self.c.execute('PRAGMA table_info(jobs)')]
+        if "attempts" not in columns:
+            # Queues created before attempts were counted
+            self.c.execute('ALTER TABLE jobs ADD COLUMN "attempts" INTEGER NOT NULL DEFAULT 0')
+        if "worker_host" not in columns:
+            self.c.execute('ALTER TABLE jobs ADD COLUMN "worker_host" TEXT')
+        self.c.execute('CREATE INDEX IF NOT EXISTS jobs_project ON jobs (project_id);')
+        self.c.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);')
+        # Durations of the pipeline functions, written by the workers and
+        # turned into histograms by the server
+        self.c.execute('''CREATE TABLE IF NOT EXISTS timings (
+            "id"	INTEGER PRIMARY KEY AUTOINCREMENT,
+            "job_id"	INTEGER NOT NULL,
+            "stage"	TEXT NOT NULL,
+            "seconds"	REAL NOT NULL,
+            "created"	REAL NOT NULL DEFAULT 0
+        );''')
+        if "created" not in [row[1] for row in self.c.execute('PRAGMA table_info(timings)')]:
+            self.c.execute('ALTER TABLE timings ADD COLUMN "created" REAL NOT NULL DEFAULT 0')
+        self.c.commit()
+
+    def enqueue(self, project_id, target_dir):
+        """Queues a job for project_id unless one is already queued or running.
+
+        Returns:
+            (int, bool): Job id and whether a new job was created.
+
+        """
+        with self.lock:
+            row = self.c.execute('SELECT id FROM jobs WHERE project_id = ? AND status IN (?, ?)',
+                                 (project_id, QUEUED, RUNNING)).fetchone()
+            if row is not None:
+                return (row[0], False)
+            now = time.time()
+            cursor = self.c.execute('INSERT INTO jobs (project_id, target_dir, status, created, updated) VALUES (?, ?, ?, ?, ?)',
+                                    (project_id, target_dir, QUEUED, now, now))
+            self.c.commit()
+            return (cursor.lastrowid, True)
+
+    def claim(self, worker_pid):
+        """Marks the oldest queued job as running for worker_pid and returns (id, project_id, target_dir), or None"""
+        with self.lock:
+            # BEGIN IMMEDIATE takes the write lock up front so two workers
+            # cannot claim the same job
+            self.c.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.c.execute('SELECT id, project_id, target_dir FROM jobs WHERE status = ? ORDER BY id LIMIT 1',
+                                     (QUEUED, )).fetchone()
+                if row is not None:
+                    self.c.execute('UPDATE jobs SET status = ?, worker_pid = ?, worker_host = ?, attempts = attempts + 1, '
+                                   'updated = ? WHERE id = ?',
+                                   (RUNNING, worker_pid, self.host, time.time(), row[0]))
+                self.c.execute('COMMIT')
+            except Exception:
+                self.c.execute('ROLLBACK')
+                raise
+            return row
+
+    def set_stages(self, job_id, stages):
+        with self.lock:
+            self.c.execute('UPDATE jobs SET stages = ?, progress = ?, updated = ? WHERE id = ?',
+                           (json.dumps(stages), json.dumps({stage: 0 for stage in stages}), time.time(), job_id))
+            self.c.commit()
+
+    def update_progress(self, job_id, stage, percent):
+        with self.lock:
+            row = self.c.execute('SELECT progress FROM jobs WHERE id = ?', (job_id, )).fetchone()
+            if row is None:
+                return
+            progress = json.loads(row[0])
+            progress[stage] = int(percent)
+            self.c.execute('UPDATE jobs SET progress = ?, updated = ? WHERE id = ?',
+                           (json.dumps(progress), time.time(), job_id))
+            self.c.commit()
+
+    def finish(self, job_id):
+        self.set_status(job_id, DONE)
+
+    def fail(self, job_id, error):
+        self.set_status(job_id, FAILED, error)
+
+    def set_status(self, job_id, status, error=None):
+        with self.lock:
+            self.c.execute('UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?',
+                           (status, error, time.time(), job_id))
+            self.c.commit()
+
+    def requeue_worker(self, worker_pid):
+        """Puts the jobs of a worker that died back in the queue, or fails those that used up their attempts"""
+        self.requeue('worker_pid = ? AND (worker_host = ? OR worker_host IS NULL)', (worker_pid, self.host))
+
+    def requeue_running(self):
+        """Requeues the running jobs of workers of this host that are gone, used at startup after an unclean shutdown.
+
+        Jobs of other hosts sharing the queue, and of workers still alive,
+        are left alone.
+
+        """
+        with self.lock:
+            pids = [row[0] for row in self.c.execute(
+                'SELECT DISTINCT worker_pid FROM jobs WHERE status = ? AND (worker_host = ? OR worker_host IS NULL)',
+                (RUNNING, self.host))]
+        for pid in pids:
+            if pid is None:
+                self.requeue('worker_pid IS NULL AND (worker_host = ? OR worker_host IS NULL)', (self.host, ))
+            elif not pid_alive(pid):
+                self.requeue_worker(pid)
+
+    def requeue(self, where, params):
+        with self.lock:
+            now = time.time()
+            error = "The transcription worker exited %s times while running this job" % self.max_attempts
+            self.c.execute('UPDATE jobs SET status = ?, worker_pid = NULL, error = ?, updated = ? '
+                           'WHERE status = ? AND attempts >= ? AND ' + where,
+                           (FAILED, error, now, RUNNING, self.max_attempts) + params)
+            self.c.execute('UPDATE jobs SET status = ?, worker_pid = NULL, updated = ? WHERE status = ? AND ' + where,
+                           (QUEUED, now, RUNNING) + params)
+            self.c.commit()
+
+    def record_timings(self, job_id, timings):
+        """Stores the [(stage, seconds)] measured while running a job"""
+        with self.lock:
+            now = time.time()
+            self.c.executemany('INSERT INTO timings (job_id, stage, seconds, created) VALUES (?, ?, ?, ?)',
+                               [(job_id, stage, seconds, now) for stage, seconds in timings])
+            self.c.commit()
+
+    def last_timing_id(self):
+        with self.lock:
+            return self.c.execute('SELECT COALESCE(MAX(id), 0) FROM timings').fetchone()[0]
+
+    def prune_timings(self, max_age=TIMINGS_RETENTION_SECONDS):
+        """Deletes the timings stored more than max_age seconds ago"""
+        with self.lock:
+            self.c.execute('DELETE FROM timings WHERE created < ?', (time.time() - max_age, ))
+            self.c.commit()
+
+    def timings_since(self, timing_id):
+        """Returns the (id, stage, seconds) stored after timing_id, oldest first"""
+        with self.lock:
+            return self.c.execute('SELECT id, stage, seconds FROM timings WHERE id > ? ORDER BY id',
+                                  (timing_id, )).fetchall()
+
+    def queue_depth(self):
+        with self.lock:
+            return self.c.execute('SELECT COUNT(*) FROM jobs WHERE status = ?', (QUEUED, )).fetchone()[0]
+
+    def status(self, project_id):
+        """Returns the state of the latest job of project_id, or None if it was never transcribed"""
+        with self.lock:
+            row = self.c.execute('''SELECT id, status, stages, progress, error, created, updated FROM jobs
+                WHERE project_id = ? ORDER BY id DESC LIMIT 1''', (project_id, )).fetchone()
+        if row is None:
+            return None
+        job_id, status, stages, progress, error, created, updated = row
+        stages = json.loads(stages)
+        progress = json.loads(progress)
+        if status == DONE:
+            percent = 100
+        elif stages:
+            percent = int(sum(progress.get(stage, 0) for stage in stages) / len(stages))
+        else:
+            percent = 0
+        stage = next((s for s in stages if progress.get(s, 0) < 100), None) if status == RUNNING else None
+        return {
+            'id': job_id,
+            'status': status,
+            'stage': stage,
+            'percent': percent,
+            'stages': [{'name': s, 'percent': progress.get(s, 0)} for s in stages],
+            'error': error,
+            'created': created,
+            'updated': updated,
+        }
+
+
+class TranscriptionWorkers:
+    """Fixed-size pool of long-lived scripts/batch.py worker processes.
+
+    Each worker loads the speech and translation models once and then
+    processes jobs from the JobQueue one after the other. Workers that exit
+    are restarted by ensure_running and their job is queued again.
+    worker_args are appended to the batch.py command line.
+
+    """
+
+    def __init__(self, size, jobs, script_path, cwd, worker_args=None):
+        self.size = size
+        self.jobs = jobs
+        self.script_path = script_path
+        self.cwd = cwd
+        self.worker_args = worker_args or []
+        self.processes = []
+        self.lock = threading.Lock()
+
+    def start(self, monitor_interval=5):
+        if self.size <= 0:
+            # Jobs are run by the workers of another instance sharing the queue
+            return
+        self.jobs.requeue_running()
+        self.ensure_running()
+        threading.Thread(target=self.monitor, args=(monitor_interval, ), daemon=True).start()
+
+    def monitor(self, interval):
+        while True:
+            time.sleep(interval)
+            self.ensure_running()
+
+    def ensure_running(self):
+        with self.lock:
+            alive = []
+            for process in self.processes:
+                if process.poll() is None:
+                    alive.append(process)
+                else:
+                    logging.error("Transcription worker %s exited with code %s" % (process.pid, process.returncode))
+                    self.jobs.requeue_worker(process.pid)
+            while len(alive) < self.size:
+                cmd = [sys.executable, self.script_path, "--worker", "--jobs-db", os.path.abspath(self.jobs.db_path)]
+                cmd += self.worker_args
+                # stderr is inherited so crashes that happen outside of
+                # Python logging, e.g. in the native model runtimes, are seen
+                process = subprocess.Popen(cmd, cwd=self.cwd,
+                                           stdout=subprocess.DEVNULL)
+                logging.info("Started transcription worker %s" % process.pid)
+                alive.append(process)
+            self.processes = alive
+
+    def stop(self):
+        with self.lock:
+            for process in self.processes:
+                process.terminate()
+            for process in self.processes:
+                process.wait(timeout=10)
+            self.processes = []
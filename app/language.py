@@ -1,3 +1,20 @@
+import threading
+
 from argostranslate import translate
 
-languages = translate.load_installed_languages()
\ No newline at end of file
+lock = threading.Lock()
+installed_languages = None
+
+
+def load_languages():
+    """Returns the installed argos languages, read from disk on first use.
+
+    Models of a language pair are only loaded once a translator for the
+    pair is requested.
+
+    """
+    global installed_languages
+    with lock:
+        if installed_languages is None:
+            installed_languages = translate.load_installed_languages()
+        return installed_languages
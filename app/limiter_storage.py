@@ -0,0 +1,228 @@
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from limits.storage import Storage
+
+DEFAULT_STORAGE_URI = "memory://"
+CHARACTERS_WINDOW = 60
+
+
+def sqlite_path(uri):
+    """sqlite:///var/lib/lt/limits.db -> /var/lib/lt/limits.db, sqlite://limits.db -> limits.db"""
+    return uri[len("sqlite://"):]
+
+
+def sqlite_connect(local, db_path):
+    """Returns the connection of the calling thread, in autocommit mode so transactions can be started explicitly"""
+    c = getattr(local, 'c', None)
+    if c is None:
+        c = local.c = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        c.execute('PRAGMA journal_mode=WAL')
+    return c
+
+
+class SQLiteStorage(Storage):
+    """Rate limit storage in an SQLite file, shared by every process of a host.
+
+    Registered with the limits package for sqlite:// URIs. Supports the
+    fixed-window and moving-window strategies; updates run in BEGIN
+    IMMEDIATE transactions so concurrent processes do not lose hits.
+
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri=None, **options):
+        self.db_path = sqlite_path(uri)
+        self.local = threading.local()
+        c = self.connection()
+        c.execute('''CREATE TABLE IF NOT EXISTS counters (
+            "key"	TEXT NOT NULL,
+            "value"	INTEGER NOT NULL,
+            "expiry"	REAL NOT NULL,
+            PRIMARY KEY("key")
+        );''')
+        c.execute('''CREATE TABLE IF NOT EXISTS events (
+            "key"	TEXT NOT NULL,
+            "ts"	REAL NOT NULL
+        );''')
+        c.execute('CREATE INDEX IF NOT EXISTS events_key_ts ON events (key, ts);')
+        super(SQLiteStorage, self).__init__(uri)
+
+    def connection(self):
+        return sqlite_connect(self.local, self.db_path)
+
+    def incr(self, key, expiry, elastic_expiry=False):
+        c = self.connection()
+        now = time.time()
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            row = c.execute('SELECT value, expiry FROM counters WHERE key = ?', (key, )).fetchone()
+            if row is None or row[1] <= now:
+                value, expires = 1, now + expiry
+            else:
+                value, expires = row[0] + 1, now + expiry if elastic_expiry else row[1]
+            c.execute('INSERT OR REPLACE INTO counters (key, value, expiry) VALUES (?, ?, ?)', (key, value, expires))
+            c.execute('COMMIT')
+        except Exception:
+            c.execute('ROLLBACK')
+            raise
+        return value
+
+    def get(self, key):
+        row = self.connection().execute('SELECT value FROM counters WHERE key = ? AND expiry > ?',
+                                        (key, time.time())).fetchone()
+        return 0 if row is None else row[0]
+
+    def get_expiry(self, key):
+        row = self.connection().execute('SELECT expiry FROM counters WHERE key = ?', (key, )).fetchone()
+        return -1 if row is None else int(row[0])
+
+    def acquire_entry(self, key, limit, expiry, no_add=False):
+        c = self.connection()
+        now = time.time()
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            c.execute('DELETE FROM events WHERE key = ? AND ts < ?', (key, now - expiry))
+            count = c.execute('SELECT COUNT(*) FROM events WHERE key = ?', (key, )).fetchone()[0]
+            acquired = count < limit
+            if acquired and not no_add:
+                c.execute('INSERT INTO events (key, ts) VALUES (?, ?)', (key, now))
+            c.execute('COMMIT')
+        except Exception:
+            c.execute('ROLLBACK')
+            raise
+        return acquired
+
+    def get_moving_window(self, key, limit, expiry):
+        now = time.time()
+        start, count = self.connection().execute('SELECT MIN(ts), COUNT(*) FROM events WHERE key = ? AND ts >= ?',
+                                                 (key, now - expiry)).fetchone()
+        return int(start if start is not None else now), count
+
+    def check(self):
+        try:
+            self.connection().execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        c = self.connection()
+        c.execute('DELETE FROM counters')
+        c.execute('DELETE FROM events')
+
+    def clear(self, key):
+        c = self.connection()
+        c.execute('DELETE FROM counters WHERE key = ?', (key, ))
+        c.execute('DELETE FROM events WHERE key = ?', (key, ))
+
+
+class MemoryCharacterCounter:
+    """Sliding window of translated characters per client, for a single process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.windows = {}
+
+    def hit(self, key, weight, limit, window=CHARACTERS_WINDOW):
+        now = time.time()
+        with self.lock:
+            events, total = self.windows.get(key, (deque(), 0))
+            while events and events[0][0] <= now - window:
+                total -= events.popleft()[1]
+            allowed = total + weight <= limit
+            if allowed:
+                events.append((now, weight))
+                total += weight
+            if events:
+                self.windows[key] = (events, total)
+            else:
+                self.windows.pop(key, None)
+            return allowed
+
+
+class SQLiteCharacterCounter:
+    """Sliding window of translated characters per client, shared by the processes of a host"""
+
+    def __init__(self, uri):
+        self.db_path = sqlite_path(uri)
+        self.local = threading.local()
+        c = sqlite_connect(self.local, self.db_path)
+        c.execute('''CREATE TABLE IF NOT EXISTS characters (
+            "key"	TEXT NOT NULL,
+            "ts"	REAL NOT NULL,
+            "weight"	INTEGER NOT NULL
+        );''')
+        c.execute('CREATE INDEX IF NOT EXISTS characters_key_ts ON characters (key, ts);')
+
+    def hit(self, key, weight, limit, window=CHARACTERS_WINDOW):
+        c = sqlite_connect(self.local, self.db_path)
+        now = time.time()
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            c.execute('DELETE FROM characters WHERE key = ? AND ts <= ?', (key, now - window))
+            total = c.execute('SELECT COALESCE(SUM(weight), 0) FROM characters WHERE key = ?', (key, )).fetchone()[0]
+            allowed = total + weight <= limit
+            if allowed:
+                c.execute('INSERT INTO characters (key, ts, weight) VALUES (?, ?, ?)', (key, now, weight))
+            c.execute('COMMIT')
+        except Exception:
+            c.execute('ROLLBACK')
+            raise
+        return allowed
+
+
+class RedisCharacterCounter:
+    """Translated characters per client in Redis, shared by every replica.
+
+    Uses a sliding window counter: the count of the previous fixed window is
+    weighted by how much of it still overlaps the sliding window. Any server
+    speaking the Redis protocol works.
+
+    Characters are counted before the check and taken back when they go
+    over the limit, so concurrent replicas never exceed it together.
+
+    Args:
+        uri (str): redis:// URI.
+        client: Redis client to use instead of connecting to uri.
+
+    """
+
+    def __init__(self, uri, client=None):
+        if client is None:
+            import redis
+            client = redis.from_url(uri)
+        self.client = client
+
+    def hit(self, key, weight, limit, window=CHARACTERS_WINDOW):
+        now = time.time()
+        current_start = int(now // window) * window
+        current_key = "LT/characters/%s/%s" % (key, current_start)
+        previous_key = "LT/characters/%s/%s" % (key, current_start - window)
+        # Counting first keeps the check atomic: replicas racing for the last
+        # characters each see the others' hits, and give theirs back on overflow
+        pipe = self.client.pipeline()
+        pipe.incrby(current_key, weight)
+        pipe.expire(current_key, 2 * window)
+        pipe.get(previous_key)
+        current, _, previous = pipe.execute()
+        overlap = 1 - (now - current_start) / window
+        total = int(current) + int(previous or 0) * overlap
+        if total > limit:
+            self.client.decrby(current_key, weight)
+            return False
+        return True
+
+
+def create_character_counter(storage_uri):
+    """Returns the character counter matching a --limiter-storage URI"""
+    if storage_uri.startswith("sqlite://"):
+        return SQLiteCharacterCounter(storage_uri)
+    if storage_uri.startswith(("redis://", "rediss://")):
+        return RedisCharacterCounter(storage_uri)
+    if storage_uri.startswith("memory://"):
+        return MemoryCharacterCounter()
+    raise ValueError("Unsupported limiter storage %s" % storage_uri)
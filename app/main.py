@@ -1,7 +1,18 @@
 import argparse
 from app.app import create_app
+from app.detect import DETECTORS
+from app.stt import MODEL_FORMATS
 
-def main():
+def thumbnail_sizes(value):
+    try:
+        widths = [int(w) for w in value.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected comma separated widths, e.g. 512,256")
+    if not widths or min(widths) <= 0:
+        raise argparse.ArgumentTypeError("widths must be positive")
+    return widths
+
+def get_parser():
     parser = argparse.ArgumentParser(description='LibreTranslate - Free and Open Source Translation API')
     parser.add_argument('--host', type=str,
                         help='Hostname (%(default)s)', default="127.0.0.1")
@@ -11,6 +22,10 @@ def main():
                         help='Set character limit (%(default)s)')
     parser.add_argument('--req-limit', default=-1, type=int, metavar="<number>",
                         help='Set the default maximum number of requests per minute per client (%(default)s)')
+    parser.add_argument('--limiter-storage', type=str, default="memory://", metavar="<storage URI>",
+                        help='Set where rate limits are counted: memory:// (per process), sqlite:///<path> (shared by the processes of a host) or redis://<host>:<port> (shared by all replicas) (%(default)s)')
+    parser.add_argument('--chars-per-minute', default=-1, type=int, metavar="<number of characters>",
+                        help='Set maximum number of characters translated per minute per client (%(default)s)')
     parser.add_argument('--batch-limit', default=-1, type=int, metavar="<number of texts>",
                         help='Set maximum number of texts to translate in a batch request (%(default)s)')
     parser.add_argument('--ga-id', type=str, default=None, metavar="<GA ID>",
@@ -31,9 +46,66 @@ def main():
                         help="Enable API keys database for per-user rate limits lookup")
     parser.add_argument('--project-directory', type=str, default="/tmp/LibreTranslateProjects", metavar="<directory>",
                         help="Project directory for storing recorded audio and video files and metadata")
-    
+    parser.add_argument('--translator-cache-size', default=64, type=int, metavar="<number of pairs>",
+                        help='Set maximum number of language pairs whose models stay loaded, in each translation worker, -1 for no limit (%(default)s)')
+    parser.add_argument('--metrics', default=False, action="store_true",
+                        help="Enable the /metrics endpoint, in the Prometheus text format")
+    parser.add_argument('--stt-model', type=str, default="skip", choices=["startup", "background", "skip"],
+                        help='Set when the web server checks that the DeepSpeech model loads: before serving, in the background while serving, or never; transcription workers load their own and /health/ready does not wait for it (%(default)s)')
+    parser.add_argument('--preload-translators', default=False, action="store_true",
+                        help="Load the models of every language pair in the background at startup, with one short translation each, instead of on first use")
+    parser.add_argument('--max-batch-tokens', default=1024, type=int, metavar="<number of tokens>",
+                        help='Set maximum number of tokens sent to the model at once when translating a batch request, -1 for no limit (%(default)s)')
+    parser.add_argument('--cache-size', default=10000, type=int, metavar="<number of texts>",
+                        help='Set maximum number of translations cached in memory, 0 to disable, -1 for no limit (%(default)s)')
+    parser.add_argument('--cache-ttl', default=86400, type=int, metavar="<seconds>",
+                        help='Set how long cached translations stay valid, -1 for no expiry (%(default)s)')
+    parser.add_argument('--cache-db', type=str, default=None, metavar="<path>",
+                        help='Keep translations in an SQLite file that survives restarts (%(default)s)')
+    parser.add_argument('--cache-db-size', default=1000000, type=int, metavar="<number of texts>",
+                        help='Set maximum number of translations kept in the SQLite cache, -1 for no limit (%(default)s)')
+    parser.add_argument('--batch-window-ms', default=0, type=int, metavar="<milliseconds>",
+                        help='Wait this long to group concurrent requests for the same language pair into one model batch, 0 to disable (%(default)s)')
+    parser.add_argument('--batch-max-size', default=32, type=int, metavar="<number of texts>",
+                        help='Run a grouped batch as soon as it holds this many texts (%(default)s)')
+    parser.add_argument('--translation-workers', default=0, type=int, metavar="<number of processes>",
+                        help='Run translation and detection in this many worker processes, 0 to run them in the server process (%(default)s)')
+    parser.add_argument('--detector', type=str, default="langdetect", choices=DETECTORS,
+                        help='Set language detection backend (%(default)s)')
+    parser.add_argument('--detect-max-chars', default=1000, type=int, metavar="<number of characters>",
+                        help='Only look at the beginning of long texts when detecting their language, -1 for the whole text (%(default)s)')
+    parser.add_argument('--detect-cache-size', default=10000, type=int, metavar="<number of texts>",
+                        help='Set number of short texts whose detected language is remembered, 0 to disable (%(default)s)')
+    parser.add_argument('--transcription-workers', default=1, type=int, metavar="<number of processes>",
+                        help='Set number of long-lived processes running project transcription jobs, 0 when another instance sharing --jobs-db runs them (%(default)s)')
+    parser.add_argument('--x-sendfile', default=False, action="store_true",
+                        help="Let the web server send project downloads with X-Sendfile")
+    parser.add_argument('--x-accel-redirect', type=str, default=None, metavar="<location>",
+                        help="Let nginx send project downloads from this internal location mapped to the project directory (%(default)s)")
+    parser.add_argument('--upload-expiry', default=86400, type=int, metavar="<seconds>",
+                        help='Delete chunked uploads that received no chunk for this long, with their partial files, -1 to keep them (%(default)s)')
+    parser.add_argument('--probe-workers', default=2, type=int, metavar="<number of threads>",
+                        help='Set number of threads probing uploaded media and writing thumbnails (%(default)s)')
+    parser.add_argument('--thumbnail-sizes', default="512", type=thumbnail_sizes, metavar="<widths>",
+                        help='Set comma separated widths of the thumbnails of video projects, all made by a single ffmpeg run (%(default)s)')
+    parser.add_argument('--projects-db', type=str, default="projects.db", metavar="<path>",
+                        help='Set the SQLite file indexing the project directory (%(default)s)')
+    parser.add_argument('--jobs-db', type=str, default="jobs.db", metavar="<path>",
+                        help='Set the SQLite file holding the transcription job queue (%(default)s)')
+    parser.add_argument('--stt-model-format', type=str, default="auto", choices=MODEL_FORMATS,
+                        help='Set DeepSpeech model file to load, auto prefers the memory mapped .tflite model that transcription processes share (%(default)s)')
+    parser.add_argument('--stt-workers', default=1, type=int, metavar="<number of processes>",
+                        help='Set number of processes each transcription worker uses to transcribe audio segments in parallel (%(default)s)')
+    parser.add_argument('--subtitle-translate-workers', default=4, type=int, metavar="<number of threads>",
+                        help='Set number of target languages each transcription worker translates subtitles into at the same time (%(default)s)')
+    parser.add_argument('--vad-min-rms', default=30, type=float, metavar="<RMS>",
+                        help='Set minimum RMS of 16 bit samples for transcribed audio to count as speech; lower it for very quiet recordings, 0 to only compare with the noise floor (%(default)s)')
+    parser.add_argument('--keep-wav', default=False, action="store_true",
+                        help="Save the decoded audio of transcribed projects to audio.wav")
+    return parser
 
-    args = parser.parse_args()
+def main():
+    args = get_parser().parse_args()
     app = create_app(args)
 
     if args.debug:
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import threading
+
+MANIFEST_FILE = "manifest.json"
+
+
+def file_hash(path, block_size=1 << 20):
+    """Returns the sha256 hex digest of a file, read in blocks"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+class Manifest:
+    """Content hashes of the artifacts of a project and the inputs they were built from.
+
+    The manifest is a JSON file in the project directory with one entry per
+    artifact file name:
+
+        {"en.srt": {"hash": ..., "size": ..., "mtime_ns": ..., "inputs": {"words.json": ...}}}
+
+    Hashes are only recomputed when the size or modification time of a file
+    changed. An artifact is up to date when it exists and was recorded with
+    the same inputs, so a pipeline stage can be skipped when nothing it
+    reads has changed.
+
+    Args:
+        project_dir (str): Directory holding the artifacts and the manifest.
+
+    """
+
+    def __init__(self, project_dir):
+        self.project_dir = project_dir
+        self.path = os.path.join(project_dir, MANIFEST_FILE)
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                # A corrupt manifest only means everything is rebuilt
+                self.entries = {}
+
+    def hash(self, name):
+        """Returns the content hash of the file name, or None if it does not exist"""
+        path = os.path.join(self.project_dir, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None and entry.get('size') == st.st_size and entry.get('mtime_ns') == st.st_mtime_ns:
+                return entry['hash']
+        digest = file_hash(path)
+        with self.lock:
+            entry = self.entries.setdefault(name, {})
+            entry.update(hash=digest, size=st.st_size, mtime_ns=st.st_mtime_ns)
+            self.save()
+        return digest
+
+    def inputs(self, name):
+        """Returns the inputs name was last recorded with, or None"""
+        with self.lock:
+            entry = self.entries.get(name)
+            return None if entry is None else entry.get('inputs')
+
+    def up_to_date(self, name, inputs):
+        if not os.path.exists(os.path.join(self.project_dir, name)):
+            return False
+        return self.inputs(name) == inputs
+
+    def record(self, name, inputs):
+        """Stores the hash of the freshly built artifact name along with its inputs"""
+        path = os.path.join(self.project_dir, name)
+        st = os.stat(path)
+        digest = file_hash(path)
+        with self.lock:
+            self.entries[name] = {'hash': digest, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'inputs': inputs}
+            self.save()
+        return digest
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
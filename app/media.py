@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import queue
+import threading
+from timeit import default_timer as timer
+
+import ffmpeg
+
+DEFAULT_THUMBNAIL_WIDTHS = [512]
+# Thumbnails are taken this far into the media, or at the start of shorter media
+THUMBNAIL_SECONDS = 3
+
+PROBE_PENDING = "pending"
+PROBE_DONE = "done"
+PROBE_FAILED = "failed"
+
+
+def probe_media(in_filename):
+    """Returns duration and, for media with a video stream, the frame size of in_filename"""
+    probe = ffmpeg.probe(in_filename)
+    # Cover art of audio files is a video stream holding a single picture
+    video_stream = next(
+        (stream for stream in probe['streams'] if stream['codec_type'] == 'video'
+         and not stream.get('disposition', {}).get('attached_pic')), None)
+    audio_stream = next(
+        (stream for stream in probe['streams'] if stream['codec_type'] == 'audio'), None)
+    logging.debug(str(video_stream))
+    info = {'hasVideo': video_stream is not None, 'hasAudio': audio_stream is not None}
+    # Containers know the duration even when a stream does not (mkv, mp3)
+    duration = probe.get('format', {}).get('duration')
+    if duration is None:
+        duration = (video_stream or audio_stream or {}).get('duration')
+    if duration is not None:
+        info['durationSeconds'] = float(duration)
+    if video_stream is not None:
+        info['width'] = int(video_stream['width'])
+        info['height'] = int(video_stream['height'])
+    return info
+
+
+def thumbnail_name(width, widths):
+    # The first size keeps the historical name
+    return "thumbnail.png" if width == widths[0] else "thumbnail-%s.png" % width
+
+
+def create_thumbnails(in_filename, out_dir, widths, duration=None):
+    """Writes one thumbnail per width with a single ffmpeg run, decoding the frame once.
+
+    Returns:
+        dict: File name of the thumbnail of each width.
+
+    """
+    seek = THUMBNAIL_SECONDS if duration is None or duration > THUMBNAIL_SECONDS else 0
+    frames = ffmpeg.input(in_filename, ss=seek).video.filter_multi_output('split', len(widths))
+    outputs = []
+    thumbnails = {}
+    for i, width in enumerate(widths):
+        name = thumbnail_name(width, widths)
+        thumbnails[str(width)] = name
+        outputs.append(frames[i].filter('scale', width, -1).output(os.path.join(out_dir, name), vframes=1))
+    ffmpeg.merge_outputs(*outputs).overwrite_output().run(quiet=True)
+    return thumbnails
+
+
+def ffmpeg_error(e):
+    return (e.stderr or b"").decode('utf-8', 'replace').strip()[-1000:]
+
+
+def write_metadata(project_dir, metadata):
+    path = os.path.join(project_dir, "metadata.json")
+    with open(path + ".tmp", 'w') as f:
+        json.dump(metadata, f)
+    os.replace(path + ".tmp", path)
+
+
+class MediaProbePool:
+    """Fixed number of threads probing the media of new projects and writing their thumbnails.
+
+    Uploads only queue the project id, so the request returns as soon as the
+    file is on disk and at most size ffmpeg processes run at a time. Results
+    are merged into metadata.json along with a "probe" status of pending,
+    done or failed.
+
+    Args:
+        project_directory (str): Directory holding one folder per project.
+        size (int): Number of probing threads.
+        thumbnail_widths ([int]): Widths of the thumbnails of video projects.
+        on_done (function): Called with the project id once metadata.json was updated.
+
+    """
+
+    def __init__(self, project_directory, size=2, thumbnail_widths=DEFAULT_THUMBNAIL_WIDTHS, on_done=None):
+        self.project_directory = project_directory
+        self.thumbnail_widths = thumbnail_widths
+        self.on_done = on_done
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.queued = set()
+        for i in range(size):
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, project_id):
+        """Queues a project unless it is already waiting"""
+        with self.lock:
+            if project_id in self.queued:
+                return
+            self.queued.add(project_id)
+        self.queue.put(project_id)
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def run(self):
+        while True:
+            project_id = self.queue.get()
+            with self.lock:
+                self.queued.discard(project_id)
+            try:
+                self.process(project_id)
+            except Exception:
+                logging.exception("Unable to update the metadata of project %s" % project_id)
+
+    def process(self, project_id):
+        project_dir = os.path.join(self.project_directory, project_id)
+        try:
+            with open(os.path.join(project_dir, "metadata.json")) as f:
+                metadata = json.load(f)
+        except FileNotFoundError:
+            # Deleted while waiting
+            return
+        in_filename = os.path.join(project_dir, "rawMedia." + metadata['fileEnding'])
+
+        start = timer()
+        try:
+            info = probe_media(in_filename)
+            metadata.update(info)
+            metadata['probe'] = PROBE_DONE
+            metadata.pop('probeError', None)
+        except ffmpeg.Error as e:
+            metadata['probe'] = PROBE_FAILED
+            metadata['probeError'] = ffmpeg_error(e)
+        except Exception as e:
+            # Unexpected probe output, the project must not stay pending
+            logging.exception("Unable to read the probe of project %s" % project_id)
+            metadata['probe'] = PROBE_FAILED
+            metadata['probeError'] = str(e)
+        if metadata['probe'] == PROBE_DONE and metadata['hasVideo']:
+            # A missing thumbnail keeps the duration and size that were read
+            try:
+                metadata['thumbnails'] = create_thumbnails(in_filename, project_dir, self.thumbnail_widths,
+                                                           metadata.get('durationSeconds'))
+                metadata.pop('thumbnailError', None)
+            except ffmpeg.Error as e:
+                metadata['thumbnailError'] = ffmpeg_error(e)
+        logging.info("Probed project %s in %.2f ms: %s" % (project_id, (timer() - start) * 1000, metadata['probe']))
+
+        write_metadata(project_dir, metadata)
+        if self.on_done is not None:
+            self.on_done(project_id)
@@ -0,0 +1,191 @@
+import bisect
+import functools
+import logging
+import threading
+from timeit import default_timer as timer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, for requests and translations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Seconds, for the stages of the transcription pipeline which can take an hour
+STAGE_BUCKETS = (0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (name, escape(value)) for name, value in pairs)
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value)
+
+
+class Counter:
+    """Monotonic count per label values, like a Prometheus counter"""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, labels, (), value) for labels, value in self.values.items()]
+
+
+class Histogram:
+    """Bucketed observations per label values, like a Prometheus histogram"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        # labels -> [count per bucket (the last one is +Inf), sum]
+        self.values = {}
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][index] += 1
+            counts[1] += value
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for labels, (counts, total) in self.values.items():
+                cumulative = 0
+                for le, count in zip(self.buckets + (float("inf"), ), counts):
+                    cumulative += count
+                    samples.append((self.name + "_bucket", labels, (("le", format_value(float(le))), ), cumulative))
+                samples.append((self.name + "_sum", labels, (), total))
+                samples.append((self.name + "_count", labels, (), cumulative))
+        return samples
+
+
+class Gauge:
+    """Value read when metrics are collected.
+
+    Args:
+        read (function): Returns the value, or {label values tuple: value}
+            when the gauge has labelnames.
+
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, read, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.read = read
+
+    def samples(self):
+        values = self.read()
+        if not self.labelnames:
+            values = {(): values}
+        return [(self.name, labels, (), value) for labels, value in values.items()]
+
+
+class Registry:
+    """Set of metrics rendered in the Prometheus text format.
+
+    Counters and histograms are registered once per name and shared by
+    everyone asking for that name. Gauges and collectors, which read state
+    owned by an app, are replaced when registered again.
+
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.collectors = {}
+
+    def register(self, metric, replace=False):
+        with self.lock:
+            if replace or metric.name not in self.metrics:
+                self.metrics[metric.name] = metric
+            return self.metrics[metric.name]
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, read, labelnames=()):
+        return self.register(Gauge(name, documentation, read, labelnames), replace=True)
+
+    def add_collector(self, name, collect):
+        """Registers a function called before each exposition, to pull observations made elsewhere"""
+        with self.lock:
+            self.collectors[name] = collect
+
+    def exposition(self):
+        with self.lock:
+            collectors = list(self.collectors.values())
+            metrics = list(self.metrics.values())
+        for collect in collectors:
+            try:
+                collect()
+            except Exception:
+                logging.exception("Unable to collect metrics")
+
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception:
+                logging.exception("Unable to read %s" % metric.name)
+                continue
+            lines.append("# HELP %s %s" % (metric.name, metric.documentation))
+            lines.append("# TYPE %s %s" % (metric.name, metric.type))
+            for name, labels, extra, value in samples:
+                lines.append("%s%s %s" % (name, format_labels(metric.labelnames, labels, extra), format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Called with (stage, seconds) after each call of a function decorated with timeit
+timing_listeners = []
+
+
+def timeit(method):
+    """Passes the duration of each call of method to timing_listeners, with the function name as stage"""
+    stage = method.__name__
+
+    @functools.wraps(method)
+    def timed(*args, **kw):
+        start = timer()
+        try:
+            return method(*args, **kw)
+        finally:
+            elapsed = timer() - start
+            for listener in timing_listeners:
+                listener(stage, elapsed)
+            logging.info('%r  %2.2f ms' % (stage, elapsed * 1000))
+    return timed
@@ -0,0 +1,142 @@
+import json
+import os
+import sqlite3
+import threading
+
+DEFAULT_DB_PATH = "projects.db"
+
+SORT_COLUMNS = {
+    'created': 'created',
+    'name': 'name COLLATE NOCASE',
+    'duration': 'duration',
+}
+
+
+def read_project(project_dir, project_id):
+    """Reads metadata.json and the subtitle files of a project from disk, None if it has no metadata"""
+    metadata_path = os.path.join(project_dir, "metadata.json")
+    try:
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+        created = metadata.get('created', os.path.getmtime(metadata_path))
+        files = os.listdir(project_dir)
+    except (FileNotFoundError, ValueError):
+        return None
+    metadata["id"] = project_id
+    metadata['project_dir'] = project_dir
+    metadata['created'] = created
+    metadata['subtitles'] = sorted(file for file in files if file.endswith(".srt"))
+    if "subtitles.zip" in files:
+        metadata['subtitles'].insert(0, 'subtitles.zip')
+    metadata['inputVideo'] = "rawMedia."+metadata['fileEnding']
+    metadata['audio'] = "audio.wav"
+    return metadata
+
+
+class ProjectIndex:
+    """SQLite index of the project directory.
+
+    Listing projects reads rows from the index instead of every
+    metadata.json and project folder. Rows are written through by whoever
+    changes a project (upload, transcription, delete) with refresh() or
+    remove(). rebuild() scans the whole directory, which is only needed at
+    startup.
+
+    Args:
+        db_path (str): SQLite file of the index, shared with the transcription workers.
+        project_directory (str): Directory holding one folder per project.
+
+    """
+
+    def __init__(self, db_path, project_directory):
+        self.project_directory = project_directory
+        self.lock = threading.Lock()
+        self.c = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.c.execute('PRAGMA journal_mode=WAL')
+        self.c.execute('''CREATE TABLE IF NOT EXISTS projects (
+            "id"	TEXT NOT NULL,
+            "name"	TEXT NOT NULL,
+            "created"	REAL NOT NULL,
+            "duration"	REAL,
+            "transcribed"	INTEGER NOT NULL,
+            "metadata"	TEXT NOT NULL,
+            PRIMARY KEY("id")
+        );''')
+        self.c.execute('CREATE INDEX IF NOT EXISTS projects_created ON projects (created);')
+        self.c.execute('CREATE INDEX IF NOT EXISTS projects_name ON projects (name COLLATE NOCASE);')
+        self.c.commit()
+
+    def rebuild(self):
+        """Indexes every project folder and drops rows of folders that are gone"""
+        rows = []
+        for project_id in os.listdir(self.project_directory):
+            metadata = read_project(os.path.join(self.project_directory, project_id), project_id)
+            if metadata is not None:
+                rows.append(self.row(metadata))
+        with self.lock:
+            self.c.execute('DELETE FROM projects')
+            self.c.executemany('INSERT INTO projects (id, name, created, duration, transcribed, metadata) VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self.c.commit()
+        return len(rows)
+
+    def refresh(self, project_id):
+        """Re-reads a single project from disk and returns its metadata, None if it does not exist"""
+        metadata = read_project(os.path.join(self.project_directory, project_id), project_id)
+        with self.lock:
+            if metadata is None:
+                self.c.execute('DELETE FROM projects WHERE id = ?', (project_id, ))
+            else:
+                self.c.execute('INSERT OR REPLACE INTO projects (id, name, created, duration, transcribed, metadata) VALUES (?, ?, ?, ?, ?, ?)',
+                               self.row(metadata))
+            self.c.commit()
+        return metadata
+
+    def remove(self, project_id):
+        with self.lock:
+            self.c.execute('DELETE FROM projects WHERE id = ?', (project_id, ))
+            self.c.commit()
+
+    def row(self, metadata):
+        return (metadata['id'], metadata.get('name', ''), metadata['created'], metadata.get('durationSeconds'),
+                1 if metadata['subtitles'] else 0, json.dumps(metadata))
+
+    def get(self, project_id):
+        with self.lock:
+            row = self.c.execute('SELECT metadata FROM projects WHERE id = ?', (project_id, )).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def list(self, offset=0, limit=50, sort='created', order='desc', q=None, transcribed=None):
+        """Returns one page of projects and the number of projects matching the filters.
+
+        Args:
+            offset (int): Number of matching projects to skip.
+            limit (int): Maximum number of projects to return (-1 for all).
+            sort (str): One of SORT_COLUMNS.
+            order (str): asc or desc.
+            q (str): Only projects whose name contains this text.
+            transcribed (bool): Only projects with (True) or without (False) subtitles.
+
+        Returns:
+            ([dict], int): Project metadata and total count.
+
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError("Invalid sort %s" % sort)
+        if order not in ('asc', 'desc'):
+            raise ValueError("Invalid order %s" % order)
+
+        conditions = []
+        params = []
+        if q:
+            conditions.append("name LIKE ? ESCAPE '\\'")
+            params.append("%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if transcribed is not None:
+            conditions.append('transcribed = ?')
+            params.append(1 if transcribed else 0)
+        where = (' WHERE ' + ' AND '.join(conditions)) if conditions else ''
+
+        with self.lock:
+            total = self.c.execute('SELECT COUNT(*) FROM projects' + where, params).fetchone()[0]
+            rows = self.c.execute('SELECT metadata FROM projects%s ORDER BY %s %s, id LIMIT ? OFFSET ?' % (where, SORT_COLUMNS[sort], order.upper()),
+                                  params + [limit, offset]).fetchall()
+        return [json.loads(row[0]) for row in rows], total
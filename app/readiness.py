@@ -0,0 +1,82 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class ModelLoader:
+    """Loads independent models in parallel threads and tracks their readiness.
+
+    Each model is registered under a name with the function loading it.
+    Loads start right away so the server can finish starting while they run;
+    callers needing a model wait for it with get().
+
+    Args:
+        max_workers (int): Number of models loading at the same time.
+
+    """
+
+    def __init__(self, max_workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model-loader")
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.states = {}
+        self.errors = {}
+        self.durations = {}
+        self.optional = set()
+
+    def submit(self, name, load, required=True):
+        """Starts loading a model, returns its future. Optional models are reported but do not hold up ready()"""
+        with self.lock:
+            self.states[name] = LOADING
+            if not required:
+                self.optional.add(name)
+            future = self.futures[name] = self.executor.submit(self.run, name, load)
+        return future
+
+    def skip(self, name):
+        """Records a model that is deliberately not loaded by this process"""
+        with self.lock:
+            self.states[name] = SKIPPED
+
+    def run(self, name, load):
+        start = timer()
+        try:
+            result = load()
+        except Exception as e:
+            logging.exception("Unable to load %s" % name)
+            with self.lock:
+                self.states[name] = FAILED
+                self.errors[name] = str(e)
+            raise
+        with self.lock:
+            self.states[name] = READY
+            self.durations[name] = timer() - start
+        logging.info("Loaded %s in %.3fs" % (name, self.durations[name]))
+        return result
+
+    def get(self, name, timeout=None):
+        """Waits for a model and returns what its load function returned"""
+        return self.futures[name].result(timeout)
+
+    def ready(self):
+        """True once every required model that is not skipped has loaded"""
+        with self.lock:
+            return all(state in (READY, SKIPPED) for name, state in self.states.items() if name not in self.optional)
+
+    def status(self):
+        """Returns {name: {state, seconds, error}} for every registered model"""
+        with self.lock:
+            status = {}
+            for name, state in self.states.items():
+                status[name] = {'state': state}
+                if name in self.durations:
+                    status[name]['seconds'] = round(self.durations[name], 3)
+                if name in self.errors:
+                    status[name]['error'] = self.errors[name]
+            return status
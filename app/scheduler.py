@@ -0,0 +1,126 @@
+import queue
+import threading
+from concurrent.futures import Future
+from timeit import default_timer as timer
+
+# A pair without requests for this long stops its worker thread
+PAIR_WORKER_IDLE_SECONDS = 60
+
+
+class PairWorker:
+    """Background thread that coalesces requests for one language pair.
+
+    The thread exits once on_idle returns True after idle_timeout seconds
+    without requests.
+
+    """
+
+    def __init__(self, translate_fn, window, max_batch_size, idle_timeout, on_idle):
+        self.translate_fn = translate_fn
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.idle_timeout = idle_timeout
+        self.on_idle = on_idle
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                requests = [self.queue.get(timeout=self.idle_timeout)]
+            except queue.Empty:
+                if self.on_idle(self):
+                    return
+                continue
+            size = len(requests[0][1])
+            deadline = timer() + self.window
+            while size < self.max_batch_size:
+                remaining = deadline - timer()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                size += len(request[1])
+            self.process(requests)
+
+    def process(self, requests):
+        texts = [text for translator, request_texts, future in requests for text in request_texts]
+        # Every request carries the translator it looked up, the latest one
+        # is used so no object outlives its entry in the translator cache
+        translator = requests[-1][0]
+        try:
+            translated = self.translate_fn(translator, texts)
+        except Exception as e:
+            for translator, request_texts, future in requests:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for translator, request_texts, future in requests:
+            future.set_result(translated[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+
+
+class BatchScheduler:
+    """Runs concurrent translation requests for the same pair as one batch.
+
+    Requests arriving within ``window`` seconds of the first one, up to
+    ``max_batch_size`` texts, are passed to ``translate_fn`` together. A
+    request larger than the cap is still run as a single batch. Each pair
+    has a worker thread while it receives requests.
+
+    Args:
+        translate_fn (callable): Called with (translator, texts) and returning
+            the translated texts in order. translator is the one passed to
+            submit with the latest request of the batch.
+        window (float): Seconds to wait for more requests (0 disables coalescing).
+        max_batch_size (int): Texts after which a batch is run without waiting.
+        idle_timeout (float): Seconds without requests after which the
+            worker thread of a pair stops.
+
+    """
+
+    def __init__(self, translate_fn, window=0.01, max_batch_size=32, idle_timeout=PAIR_WORKER_IDLE_SECONDS):
+        self.translate_fn = translate_fn
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.idle_timeout = idle_timeout
+        self.workers = {}
+        self.lock = threading.Lock()
+
+    def submit(self, source_lang, target_lang, translator, texts):
+        """Queues texts for translation and returns a Future of the translated list"""
+        key = (source_lang, target_lang)
+        future = Future()
+        with self.lock:
+            worker = self.workers.get(key)
+            if worker is None:
+                worker = PairWorker(self.translate_fn, self.window, self.max_batch_size, self.idle_timeout,
+                                    lambda worker: self.remove_idle(key, worker))
+                self.workers[key] = worker
+            # Queued under the lock so an idle worker cannot stop in between
+            worker.queue.put((translator, texts, future))
+        return future
+
+    def remove_idle(self, key, worker):
+        """Forgets an idle pair worker, returns False if a request arrived in the meantime"""
+        with self.lock:
+            if not worker.queue.empty():
+                return False
+            if self.workers.get(key) is worker:
+                del self.workers[key]
+            return True
+
+    def translate(self, source_lang, target_lang, translator, texts):
+        if self.window <= 0:
+            return self.translate_fn(translator, texts)
+        return self.submit(source_lang, target_lang, translator, texts).result()
+
+    def queue_depth(self):
+        """Returns {(source, target): number of requests waiting for a batch}"""
+        with self.lock:
+            return {key: worker.queue.qsize() for key, worker in self.workers.items()}
@@ -0,0 +1,84 @@
+import codecs
+import json
+import re
+
+# End of a sentence: terminal punctuation, optional closing quotes or
+# brackets, then whitespace. A line break always ends a segment.
+SENTENCE_END = re.compile(r'[.!?。！？]+["\'”’)\]]*\s+|\n\s*')
+
+
+class SentenceSplitter:
+    """Splits text fed in arbitrary chunks into sentences as soon as they are complete.
+
+    Each segment is returned as (text, separator) where separator is the
+    whitespace that followed the sentence in the input, so that the document
+    layout can be rebuilt from the translated segments.
+
+    Args:
+        max_segment_chars (int): Text without a sentence boundary is cut at
+            the last space once it grows past this length, so memory does not
+            grow with the input.
+
+    """
+
+    def __init__(self, max_segment_chars=2000):
+        self.max_segment_chars = max_segment_chars
+        self.buffer = ""
+
+    def feed(self, text):
+        self.buffer += text
+        segments = []
+        start = 0
+        for match in SENTENCE_END.finditer(self.buffer):
+            # Whitespace at the end of the buffer may continue in the next chunk
+            if match.end() == len(self.buffer):
+                break
+            sentence_end = match.start() + len(match.group(0).rstrip())
+            segments.append((self.buffer[start:sentence_end], self.buffer[sentence_end:match.end()]))
+            start = match.end()
+        self.buffer = self.buffer[start:]
+
+        while len(self.buffer) > self.max_segment_chars:
+            cut = self.buffer.rfind(" ", 0, self.max_segment_chars)
+            if cut <= 0:
+                segments.append((self.buffer[:self.max_segment_chars], ""))
+                self.buffer = self.buffer[self.max_segment_chars:]
+            else:
+                segments.append((self.buffer[:cut], " "))
+                self.buffer = self.buffer[cut + 1:]
+        return segments
+
+    def flush(self):
+        text = self.buffer
+        self.buffer = ""
+        stripped = text.rstrip()
+        if not stripped:
+            return [("", text)] if text else []
+        return [(stripped, text[len(stripped):])]
+
+
+def iter_text_chunks(stream, chunk_size=16384, encoding='utf-8'):
+    """Reads a binary stream in chunks and yields decoded text.
+
+    Multi-byte characters split across chunk boundaries are handled by an
+    incremental decoder.
+
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        text = decoder.decode(data)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def encode_stream_item(item, output_format):
+    """Returns item as one line of ndjson, or as a server-sent event for the sse format"""
+    if output_format == "sse":
+        return "data: %s\n\n" % json.dumps(item)
+    return json.dumps(item) + "\n"
@@ -0,0 +1,56 @@
+import logging
+import os
+
+MODEL_NAME = "deepspeech-0.9.3-models"
+MODEL_FORMATS = ["auto", "tflite", "pbmm"]
+
+
+def model_files(models_dir, model_format):
+    """Returns the model files to try in order for a --stt-model-format"""
+    tflite = os.path.join(models_dir, MODEL_NAME + ".tflite")
+    pbmm = os.path.join(models_dir, MODEL_NAME + ".pbmm")
+    if model_format == "tflite":
+        return [tflite]
+    if model_format == "pbmm":
+        return [pbmm]
+    return ([tflite] if os.path.exists(tflite) else []) + [pbmm]
+
+
+def load_model(models_dir, model_format="auto"):
+    """Loads the DeepSpeech model and its scorer.
+
+    Both model files are memory mapped by DeepSpeech, so processes loading
+    the same file share its weights through the page cache. The .tflite
+    model is preferred by auto since its interpreter is light enough to be
+    shared by forking after the load; it needs the deepspeech-tflite
+    runtime, auto falls back to the .pbmm when the installed runtime is the
+    TensorFlow one.
+
+    Returns:
+        (Model, str): The model and the path of the file it was loaded from.
+
+    """
+    # Imported here so servers that never load the model do not load the native runtime either
+    from deepspeech import Model
+
+    paths = model_files(models_dir, model_format)
+    for path in paths:
+        try:
+            ds = Model(path)
+        except RuntimeError:
+            if path == paths[-1]:
+                raise
+            logging.info("Unable to load %s with this deepspeech runtime, trying %s" % (path, paths[-1]))
+            continue
+        ds.enableExternalScorer(os.path.join(models_dir, MODEL_NAME + ".scorer"))
+        return ds, path
+
+
+def shared_after_fork(path):
+    """True when a model loaded from path may be used by processes forked after the load.
+
+    The TFLite interpreter starts no threads before its first inference.
+    TensorFlow sessions do, and do not survive a fork.
+
+    """
+    return path.endswith(".tflite")
@@ -0,0 +1,217 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Keys looked up per query, below the default SQLite limit of bound parameters
+SQLITE_MAX_PARAMS = 500
+
+
+def normalize_text(text):
+    # Surrounding spaces do not change what the model produces (sentence
+    # splitting drops them), but line breaks do, so only spaces/tabs go
+    return unicodedata.normalize('NFC', text).strip(' \t')
+
+
+def cache_key(source_lang, target_lang, text):
+    h = hashlib.sha256()
+    h.update(("%s\0%s\0" % (source_lang, target_lang)).encode('utf-8'))
+    h.update(normalize_text(text).encode('utf-8'))
+    return h.hexdigest()
+
+
+class TierStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def to_dict(self, size):
+        lookups = self.hits + self.misses
+        return {
+            'size': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+        }
+
+
+class MemoryTier:
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = TierStats()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.time():
+                    self.entries.move_to_end(key)
+                    self.stats.hits += 1
+                    return value
+                del self.entries[key]
+            self.stats.misses += 1
+            return None
+
+    def set_many(self, items):
+        expires = time.time() + self.ttl if self.ttl != -1 else None
+        with self.lock:
+            for key, value in items:
+                self.entries[key] = (value, expires)
+                self.entries.move_to_end(key)
+            if self.max_size != -1:
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+
+    def size(self):
+        return len(self.entries)
+
+
+class SqliteTier:
+    def __init__(self, db_path, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.stats = TierStats()
+
+        self.c = sqlite3.connect(db_path, check_same_thread=False)
+        self.c.execute('''CREATE TABLE IF NOT EXISTS translations (
+            "key"	TEXT NOT NULL,
+            "translated"	TEXT NOT NULL,
+            "created"	REAL NOT NULL,
+            PRIMARY KEY("key")
+        );''')
+        self.c.execute('CREATE INDEX IF NOT EXISTS translations_created ON translations (created);')
+        self.c.commit()
+        self.count = self.c.execute('SELECT COUNT(*) FROM translations').fetchone()[0]
+
+    def get(self, key):
+        with self.lock:
+            row = self.c.execute('SELECT translated, created FROM translations WHERE key = ?', (key, )).fetchone()
+            if row is not None:
+                if self.ttl == -1 or row[1] + self.ttl > time.time():
+                    self.stats.hits += 1
+                    return row[0]
+                self.c.execute('DELETE FROM translations WHERE key = ?', (key, ))
+                self.c.commit()
+                self.count -= 1
+            self.stats.misses += 1
+            return None
+
+    def set_many(self, items):
+        now = time.time()
+        with self.lock:
+            # Same as INSERT OR REPLACE, the last value of a key wins
+            values = dict(items)
+            keys = list(values)
+            # Only keys not stored yet add to the count, replaced ones do not
+            existing = 0
+            for i in range(0, len(keys), SQLITE_MAX_PARAMS):
+                chunk = keys[i:i + SQLITE_MAX_PARAMS]
+                existing += self.c.execute('SELECT COUNT(*) FROM translations WHERE key IN (%s)' % ", ".join("?" * len(chunk)),
+                                           chunk).fetchone()[0]
+            self.c.executemany('INSERT OR REPLACE INTO translations (key, translated, created) VALUES (?, ?, ?)',
+                               [(key, value, now) for key, value in values.items()])
+            self.count += len(keys) - existing
+            if self.max_size != -1 and self.count > self.max_size:
+                self.c.execute('''DELETE FROM translations WHERE key IN (
+                    SELECT key FROM translations ORDER BY created LIMIT ?)''', (self.count - self.max_size, ))
+                self.count = self.c.execute('SELECT COUNT(*) FROM translations').fetchone()[0]
+            self.c.commit()
+
+    def size(self):
+        return self.count
+
+
+class TranslationCache:
+    """Two-tier cache of translated texts.
+
+    Entries are keyed by a hash of (source, target, normalized text). The
+    in-memory LRU is always consulted first; the optional SQLite tier keeps
+    translations across restarts and refills the memory tier on hits.
+
+    Args:
+        max_size (int): Entries kept in memory (0 disables caching, -1 for no limit).
+        ttl (int): Seconds an entry stays valid (-1 for no expiry).
+        db_path (str): Path of the SQLite cache file, None to disable the disk tier.
+        db_max_size (int): Entries kept on disk (-1 for no limit).
+
+    """
+
+    def __init__(self, max_size=10000, ttl=86400, db_path=None, db_max_size=1000000):
+        self.memory = MemoryTier(max_size, ttl) if max_size != 0 else None
+        self.disk = SqliteTier(db_path, db_max_size, ttl) if db_path else None
+
+    def enabled(self):
+        return self.memory is not None or self.disk is not None
+
+    def get(self, key):
+        if self.memory is not None:
+            value = self.memory.get(key)
+            if value is not None:
+                return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                if self.memory is not None:
+                    self.memory.set_many([(key, value)])
+                return value
+        return None
+
+    def set_many(self, items):
+        if self.memory is not None:
+            self.memory.set_many(items)
+        if self.disk is not None:
+            self.disk.set_many(items)
+
+    def translate(self, source_lang, target_lang, texts, translate_fn):
+        """Translates texts, only passing cache misses to translate_fn.
+
+        Args:
+            source_lang (str): Source language code.
+            target_lang (str): Target language code.
+            texts ([str]): Texts to translate.
+            translate_fn (callable): Receives a list of texts and returns
+                their translations in the same order.
+
+        Returns:
+            [str]: Translated texts, in the same order as texts.
+
+        """
+        if not self.enabled():
+            return translate_fn(texts)
+
+        results = [None] * len(texts)
+        # Texts missing from the cache, each translated once even if it
+        # appears several times in the request
+        missing = OrderedDict()
+        for i, text in enumerate(texts):
+            key = cache_key(source_lang, target_lang, text)
+            value = self.get(key)
+            if value is not None:
+                results[i] = value
+            else:
+                missing.setdefault(key, (text, []))[1].append(i)
+
+        if missing:
+            keys = list(missing.keys())
+            translated = translate_fn([missing[key][0] for key in keys])
+            for key, value in zip(keys, translated):
+                for i in missing[key][1]:
+                    results[i] = value
+            self.set_many(list(zip(keys, translated)))
+
+        return results
+
+    def stats(self):
+        stats = {}
+        if self.memory is not None:
+            stats['memory'] = self.memory.stats.to_dict(self.memory.size())
+        if self.disk is not None:
+            stats['disk'] = self.disk.stats.to_dict(self.disk.size())
+        return stats
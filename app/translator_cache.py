@@ -0,0 +1,103 @@
+import logging
+import threading
+from collections import OrderedDict
+
+
+class TranslatorCache:
+    """Process-wide registry of translator objects keyed by (source, target).
+
+    Language lookups are done through a dict instead of scanning the list
+    of installed languages, and the translator returned by
+    ``Language.get_translation`` (which may be a pivot chain) is kept in an
+    LRU so it is only resolved once per pair.
+
+    Args:
+        languages ([Language]): Installed argos languages.
+        max_size (int): Maximum number of pairs to keep (-1 for no limit).
+        release (function): Called with (translator, [kept translators])
+            for each evicted translator to free its models, see
+            batching.release_translation.
+
+    """
+
+    def __init__(self, languages, max_size=64, release=None):
+        self.languages = {l.code: l for l in languages}
+        self.max_size = max_size
+        self.release = release
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_language(self, code):
+        return self.languages.get(code)
+
+    def get(self, source_code, target_code):
+        """Returns the translator for a pair, or None if the pair is not supported"""
+        key = (source_code, target_code)
+        with self.lock:
+            translator = self.cache.get(key)
+            if translator is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return translator
+            self.misses += 1
+
+        src_lang = self.languages.get(source_code)
+        tgt_lang = self.languages.get(target_code)
+        if src_lang is None or tgt_lang is None:
+            return None
+
+        translator = src_lang.get_translation(tgt_lang)
+        if translator is None:
+            return None
+
+        evicted = []
+        with self.lock:
+            # Another thread may have resolved the same pair in the meantime,
+            # keep the first one so every caller shares a single object
+            translator = self.cache.setdefault(key, translator)
+            self.cache.move_to_end(key)
+            if self.max_size != -1:
+                while len(self.cache) > self.max_size:
+                    evicted.append(self.cache.popitem(last=False)[1])
+                    self.evictions += 1
+            kept = list(self.cache.values())
+        if self.release is not None:
+            for evicted_translator in evicted:
+                self.release(evicted_translator, kept)
+        return translator
+
+    def warm(self, pairs=None, load=None):
+        """Resolves translators ahead of time.
+
+        Args:
+            pairs ([(str, str)]): Pairs to load, all installed pairs if None.
+                Loading stops once the cache is full.
+            load (function): Called with (source, target, translator) for
+                each pair to load its models, e.g. with a short translation.
+                A pair failing to load is logged and skipped.
+
+        """
+        if pairs is None:
+            pairs = [(s, t) for s in self.languages for t in self.languages if s != t]
+        for source_code, target_code in pairs:
+            if self.max_size != -1 and len(self.cache) >= self.max_size:
+                break
+            translator = self.get(source_code, target_code)
+            if translator is not None and load is not None:
+                try:
+                    load(source_code, target_code, translator)
+                except Exception:
+                    logging.exception("Unable to load the models of %s -> %s" % (source_code, target_code))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.cache),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
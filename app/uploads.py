@@ -0,0 +1,197 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from app.media import PROBE_PENDING
+
+UPLOAD_STATE_FILE = "upload.json"
+# Chunks are written to disk as they are read, so the chunk size only bounds
+# the size of a single request, not the memory used
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+READ_BLOCK_SIZE = 64 * 1024
+DEFAULT_EXPIRY_SECONDS = 24 * 60 * 60
+
+
+class OffsetMismatch(Exception):
+    """The chunk does not start where the upload currently ends"""
+
+    def __init__(self, offset):
+        super().__init__("Upload is at offset %s" % offset)
+        self.offset = offset
+
+
+class UploadStore:
+    """Chunked, resumable uploads of project media.
+
+    An upload creates the project folder right away and appends chunks to
+    rawMedia.<ending>.part. Each chunk carries the sha256 of its bytes and
+    is rolled back if it does not match, so a client can always resume from
+    the offset reported by state(). Once all bytes are there the part file
+    is renamed and metadata.json is written, which makes the project
+    visible. Uploads that received no chunk for a while are deleted by
+    expire().
+
+    Args:
+        project_directory (str): Directory holding one folder per project.
+        allowed_extensions (set): Accepted media file endings.
+        chunk_size (int): Largest chunk accepted in a single request.
+
+    """
+
+    def __init__(self, project_directory, allowed_extensions, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.project_directory = project_directory
+        self.allowed_extensions = allowed_extensions
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        self.upload_locks = {}
+
+    def create(self, name, filename, size):
+        """Starts an upload and returns its state, raises ValueError on invalid parameters"""
+        if not name:
+            raise ValueError("Invalid request: missing name parameter")
+        ending = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+        if ending not in self.allowed_extensions:
+            raise ValueError("Invalid request: file type must be one of %s" % ", ".join(sorted(self.allowed_extensions)))
+        if size <= 0:
+            raise ValueError("Invalid request: size must be positive")
+
+        project_id = str(uuid.uuid4())
+        project_dir = os.path.join(self.project_directory, project_id)
+        os.makedirs(project_dir)
+        open(self.part_path(project_id, ending), 'wb').close()
+        state = {"id": project_id, "name": name, "filename": filename, "fileEnding": ending,
+                 "size": size, "offset": 0, "complete": False}
+        self.save_state(state)
+        return state
+
+    def state(self, project_id):
+        """Returns the state of an upload, None if there is no such upload"""
+        try:
+            with open(os.path.join(self.project_directory, project_id, UPLOAD_STATE_FILE)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def write_chunk(self, project_id, offset, stream, length, checksum):
+        """Appends length bytes read from stream at offset.
+
+        Returns:
+            dict: Upload state after the chunk, None if there is no such upload.
+
+        Raises:
+            OffsetMismatch: offset is not the end of the upload.
+            ValueError: Invalid chunk, nothing was written.
+
+        """
+        if length is None or length <= 0 or length > self.chunk_size:
+            raise ValueError("Invalid request: chunks must be between 1 and %s bytes" % self.chunk_size)
+        checksum = (checksum or "").lower()
+        if len(checksum) != 64:
+            raise ValueError("Invalid request: missing or invalid chunk sha256")
+
+        with self.upload_lock(project_id):
+            state = self.state(project_id)
+            if state is None:
+                return None
+            if state["complete"] or offset != state["offset"]:
+                raise OffsetMismatch(state["offset"])
+            if offset + length > state["size"]:
+                raise ValueError("Invalid request: chunk goes past the announced size")
+
+            h = hashlib.sha256()
+            with open(self.part_path(project_id, state["fileEnding"]), 'r+b') as f:
+                f.seek(offset)
+                remaining = length
+                while remaining > 0:
+                    block = stream.read(min(READ_BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    h.update(block)
+                    f.write(block)
+                    remaining -= len(block)
+                if remaining > 0 or h.hexdigest() != checksum:
+                    f.truncate(offset)
+                    raise ValueError("Invalid request: chunk is incomplete or its checksum does not match")
+                f.flush()
+                os.fsync(f.fileno())
+
+            state["offset"] = offset + length
+            if state["offset"] == state["size"]:
+                self.complete(state)
+            self.save_state(state)
+
+        if state["complete"]:
+            with self.lock:
+                self.upload_locks.pop(project_id, None)
+        return state
+
+    def complete(self, state):
+        project_id = state["id"]
+        project_dir = os.path.join(self.project_directory, project_id)
+        os.replace(self.part_path(project_id, state["fileEnding"]),
+                   os.path.join(project_dir, "rawMedia." + state["fileEnding"]))
+        metadata = {"name": state["name"], "fileEnding": state["fileEnding"], "originalFilename": state["filename"],
+                    "created": time.time(), "probe": PROBE_PENDING}
+        with open(os.path.join(project_dir, "metadata.json"), 'w') as f:
+            json.dump(metadata, f)
+        state["complete"] = True
+
+    def expire(self, max_age=DEFAULT_EXPIRY_SECONDS):
+        """Deletes the uploads that are not complete and got no chunk for max_age seconds, returns their ids"""
+        expired = []
+        oldest = time.time() - max_age
+        for project_id in os.listdir(self.project_directory):
+            if not self.stale(project_id, oldest):
+                continue
+            with self.upload_lock(project_id):
+                # A chunk may have arrived in the meantime
+                if not self.stale(project_id, oldest):
+                    continue
+                shutil.rmtree(os.path.join(self.project_directory, project_id), ignore_errors=True)
+            with self.lock:
+                self.upload_locks.pop(project_id, None)
+            expired.append(project_id)
+        return expired
+
+    def stale(self, project_id, oldest):
+        state = self.state(project_id)
+        if state is None or state["complete"]:
+            return False
+        try:
+            return os.path.getmtime(os.path.join(self.project_directory, project_id, UPLOAD_STATE_FILE)) < oldest
+        except FileNotFoundError:
+            return False
+
+    def start_expiry(self, max_age=DEFAULT_EXPIRY_SECONDS, interval=60 * 60):
+        """Runs expire() every interval seconds in a background thread"""
+        def run():
+            while True:
+                try:
+                    expired = self.expire(max_age)
+                    if expired:
+                        logging.info("Deleted %s abandoned uploads" % len(expired))
+                except Exception:
+                    logging.exception("Unable to delete abandoned uploads")
+                time.sleep(interval)
+        threading.Thread(target=run, daemon=True).start()
+
+    def part_path(self, project_id, ending):
+        return os.path.join(self.project_directory, project_id, "rawMedia." + ending + ".part")
+
+    def save_state(self, state):
+        path = os.path.join(self.project_directory, state["id"], UPLOAD_STATE_FILE)
+        with open(path + ".tmp", 'w') as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+
+    def upload_lock(self, project_id):
+        with self.lock:
+            lock = self.upload_locks.get(project_id)
+            if lock is None:
+                lock = self.upload_locks[project_id] = threading.Lock()
+            return lock
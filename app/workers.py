@@ -0,0 +1,193 @@
+import atexit
+import itertools
+import logging
+import multiprocessing
+import threading
+import zlib
+from concurrent.futures import Future
+from timeit import default_timer as timer
+
+from app.detect import Detection
+
+# A worker that dies sooner than this after being started is restarted
+# with a delay, so a persistent failure does not turn into a busy loop
+MIN_WORKER_LIFETIME = 5
+
+
+def worker_main(conn, max_batch_tokens, detector, translator_cache_size=-1):
+    """Entry point of a translation worker process.
+
+    Receives (job_id, kind, payload) tuples on conn and answers with
+    (job_id, ok, result). Models stay loaded for the life of the process.
+
+    """
+    from app.language import load_languages
+    from app.translator_cache import TranslatorCache
+    from app.batching import release_translation, translate_batch
+    from app.detect import create_detector
+
+    translators = TranslatorCache(load_languages(), max_size=translator_cache_size, release=release_translation)
+    # Truncation and memoization are done by the caller
+    detector_name, detector_codes = detector
+    detector = create_detector(detector_name, detector_codes, max_chars=-1, cache_size=0)
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        job_id, kind, payload = message
+        try:
+            if kind == 'translate':
+                source_lang, target_lang, texts = payload
+                translator = translators.get(source_lang, target_lang)
+                if translator is None:
+                    raise ValueError("%s -> %s is not supported" % (source_lang, target_lang))
+                result = translate_batch(translator, texts, max_batch_tokens)
+            elif kind == 'detect':
+                result = [(l.lang, l.prob) for l in detector.detect(payload)]
+            elif kind == 'detect_batch':
+                result = [[(l.lang, l.prob) for l in detections] for detections in detector.detect_batch(payload)]
+            else:
+                raise ValueError("Unknown job type %s" % kind)
+            conn.send((job_id, True, result))
+        except Exception as e:
+            conn.send((job_id, False, str(e)))
+
+
+class WorkerProcess:
+    def __init__(self, context, max_batch_tokens, detector, index, target=worker_main, translator_cache_size=-1):
+        self.context = context
+        self.target = target
+        self.max_batch_tokens = max_batch_tokens
+        self.detector = detector
+        self.translator_cache_size = translator_cache_size
+        self.index = index
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.closed = False
+        self.start()
+
+    def start(self):
+        self.conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(target=self.target,
+                                            args=(child_conn, self.max_batch_tokens, self.detector,
+                                                  self.translator_cache_size),
+                                            daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.started = timer()
+        self.reader = threading.Thread(target=self.read, args=(self.conn, ), daemon=True)
+        self.reader.start()
+        logging.info("Started translation worker %s (pid %s)" % (self.index, self.process.pid))
+
+    def read(self, conn):
+        while True:
+            try:
+                job_id, ok, result = conn.recv()
+            except (EOFError, OSError):
+                break
+            with self.lock:
+                future = self.pending.pop(job_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(result))
+        self.restart()
+
+    def restart(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            closed = self.closed
+        for future in pending.values():
+            future.set_exception(RuntimeError("Translation worker %s exited" % self.index))
+        if closed:
+            return
+
+        self.process.join()
+        logging.error("Translation worker %s exited with code %s, restarting" % (self.index, self.process.exitcode))
+        if timer() - self.started < MIN_WORKER_LIFETIME:
+            threading.Event().wait(MIN_WORKER_LIFETIME)
+        with self.lock:
+            if not self.closed:
+                self.start()
+
+    def submit(self, job_id, kind, payload):
+        future = Future()
+        with self.lock:
+            self.pending[job_id] = future
+            try:
+                self.conn.send((job_id, kind, payload))
+            except (OSError, ValueError):
+                # The reader thread notices the broken pipe and restarts us
+                self.pending.pop(job_id, None)
+                future.set_exception(RuntimeError("Translation worker %s is restarting" % self.index))
+        return future
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class WorkerPool:
+    """Pool of processes that each hold their own copy of the models.
+
+    Translation jobs are routed by language pair, so a given pair always
+    lands on the same worker and its model stays warm there. Detection jobs
+    are spread round-robin. Crashed workers are restarted and their pending
+    jobs fail with a RuntimeError.
+
+    Args:
+        size (int): Number of worker processes.
+        max_batch_tokens (int): Passed to translate_batch in the workers.
+        detector ((str, [str])): Detector name and language codes, see create_detector.
+        start_method (str): multiprocessing start method.
+        target (function): Entry point of the processes, see worker_main.
+        translator_cache_size (int): Maximum number of language pairs each
+            worker keeps loaded (-1 for no limit).
+
+    """
+
+    def __init__(self, size, max_batch_tokens, detector, start_method='spawn', target=worker_main,
+                 translator_cache_size=-1):
+        context = multiprocessing.get_context(start_method)
+        self.workers = [WorkerProcess(context, max_batch_tokens, detector, i, target, translator_cache_size)
+                        for i in range(size)]
+        self.job_ids = itertools.count()
+        self.round_robin = itertools.count()
+        atexit.register(self.close)
+
+    def worker_for_pair(self, source_lang, target_lang):
+        # crc32 rather than hash() so routing does not change between runs
+        key = ("%s-%s" % (source_lang, target_lang)).encode('utf-8')
+        return self.workers[zlib.crc32(key) % len(self.workers)]
+
+    def translate(self, source_lang, target_lang, texts):
+        worker = self.worker_for_pair(source_lang, target_lang)
+        return worker.submit(next(self.job_ids), 'translate', (source_lang, target_lang, list(texts))).result()
+
+    def detect(self, text):
+        worker = self.workers[next(self.round_robin) % len(self.workers)]
+        result = worker.submit(next(self.job_ids), 'detect', text).result()
+        return [Detection(lang, prob) for lang, prob in result]
+
+    def detect_batch(self, texts):
+        worker = self.workers[next(self.round_robin) % len(self.workers)]
+        result = worker.submit(next(self.job_ids), 'detect_batch', list(texts)).result()
+        return [[Detection(lang, prob) for lang, prob in detections] for detections in result]
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
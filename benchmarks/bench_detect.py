@@ -0,0 +1,80 @@
+"""Compares the language detection backends on short and long texts.
+
+Usage: python benchmarks/bench_detect.py [--repeat N] [--output results.json]
+"""
+import argparse
+from timeit import default_timer as timer
+
+from common import add_output_argument, write_results
+
+from langdetect import detect_langs
+from app.detect import Detection, LangdetectDetector, NgramDetector, CachedDetector
+
+SAMPLES = {
+    'en': "Hello world, how are you doing today?",
+    'es': "Hola mundo, ¿cómo estás hoy?",
+    'fr': "Bonjour le monde, comment allez-vous aujourd'hui ?",
+    'de': "Hallo Welt, wie geht es dir heute?",
+    'it': "Ciao mondo, come stai oggi?",
+    'pt': "Olá mundo, como você está hoje?",
+    'ru': "Привет мир, как дела сегодня?",
+    'zh': "你好世界，今天你好吗？",
+    'ja': "こんにちは世界、今日はお元気ですか？",
+    'ar': "مرحبا بالعالم، كيف حالك اليوم؟",
+}
+
+
+class RawLangdetect:
+    """langdetect's detect_langs as called before the detection backends, for reference"""
+
+    def detect(self, text):
+        return [Detection(l.lang, l.prob) for l in detect_langs(text)]
+
+
+def bench(detector, texts, repeat):
+    correct = 0
+    start = timer()
+    for _ in range(repeat):
+        for code, text in texts:
+            result = detector.detect(text)
+            if result and result[0].lang == code:
+                correct += 1
+    elapsed = timer() - start
+    count = repeat * len(texts)
+    return {'per_text_ms': elapsed / count * 1000, 'accuracy': correct / count}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Language detection micro-benchmark')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='Number of passes over the samples (%(default)s)')
+    add_output_argument(parser)
+    args = parser.parse_args()
+
+    codes = list(SAMPLES.keys())
+    short_texts = list(SAMPLES.items())
+    long_texts = [(code, " ".join([text] * 100)) for code, text in SAMPLES.items()]
+
+    results = {}
+    start = timer()
+    ngram = NgramDetector(codes)
+    results['ngram/load'] = {'load_ms': (timer() - start) * 1000}
+    print("ngram profiles loaded in %.1f ms" % results['ngram/load']['load_ms'])
+
+    backends = [
+        ('detect_langs', RawLangdetect()),
+        ('langdetect', LangdetectDetector(codes)),
+        ('ngram', ngram),
+        ('langdetect+cache', CachedDetector(LangdetectDetector(codes))),
+        ('ngram+cache', CachedDetector(ngram)),
+    ]
+    for name, detector in backends:
+        for label, texts in (('short', short_texts), ('long', long_texts)):
+            result = bench(detector, texts, args.repeat)
+            results['%s/%s' % (name, label)] = result
+            print("%-18s %-6s %8.3f ms/text  accuracy %.2f" % (name, label, result['per_text_ms'], result['accuracy']))
+    write_results(args.output, 'detect', results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""HTTP load test of the API.
+
+Starts create_app behind waitress in this process, the way libretranslate
+serves it, then sends requests from concurrent keep-alive connections and
+reports latency percentiles and throughput per scenario. Arguments after
+-- are passed to the app, e.g. -- --translation-workers 2.
+
+Usage: python benchmarks/bench_http.py [--requests 500] [--concurrency 8] [--output results.json] [-- <libretranslate arguments>]
+"""
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+from timeit import default_timer as timer
+
+from common import add_output_argument, percentiles, write_results
+
+from app.app import create_app
+from app.main import get_parser
+
+TEXT = "The quick brown fox jumps over the lazy dog. Machine translation makes documents available in many languages."
+
+SCENARIOS = [
+    ('translate', 'POST', '/translate', lambda i, unique: {'q': suffix(TEXT, i, unique), 'source': 'en', 'target': 'es'}),
+    ('translate batch of 8', 'POST', '/translate',
+     lambda i, unique: {'q': [suffix(TEXT, i * 8 + j, unique) for j in range(8)], 'source': 'en', 'target': 'es'}),
+    ('translate auto', 'POST', '/translate', lambda i, unique: {'q': suffix(TEXT, i, unique), 'source': 'auto', 'target': 'es'}),
+    ('detect', 'POST', '/detect', lambda i, unique: {'q': suffix(TEXT, i, unique)}),
+    ('languages', 'GET', '/languages', None),
+]
+
+
+def suffix(text, i, unique):
+    # Distinct texts keep the translation and detection caches out of the measure
+    return "%s %s" % (text, i) if unique else text
+
+
+def start_server(app_args, threads):
+    """Runs create_app in a waitress server on a free port, returns the server"""
+    from waitress import create_server
+
+    # create_app sends the output to the debug log, keep the report on the console
+    stdout, stderr = sys.stdout, sys.stderr
+    try:
+        app = create_app(app_args)
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+    logging.getLogger().setLevel(logging.WARNING)
+
+    server = create_server(app, host="127.0.0.1", port=0, threads=threads)
+    threading.Thread(target=server.run, daemon=True).start()
+    return server
+
+
+def run_scenario(port, method, path, payload, requests, concurrency, unique):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    numbers = itertools.count()
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        while True:
+            i = next(numbers)
+            if i >= requests:
+                break
+            body = json.dumps(payload(i, unique)) if payload is not None else None
+            start = timer()
+            try:
+                conn.request(method, path, body, {'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+            elapsed = timer() - start
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors[0] += 1
+        conn.close()
+
+    start = timer()
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    wall = timer() - start
+
+    result = {
+        'requests': requests,
+        'errors': errors[0],
+        'concurrency': concurrency,
+        'requests_per_second': requests / wall,
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else None,
+    }
+    result.update(percentiles(latencies))
+    return result
+
+
+def main():
+    argv = sys.argv[1:]
+    app_argv = []
+    if '--' in argv:
+        app_argv = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+
+    parser = argparse.ArgumentParser(description='HTTP load test of the API')
+    parser.add_argument('--requests', type=int, default=500, help='Requests sent per scenario (%(default)s)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of concurrent connections (%(default)s)')
+    parser.add_argument('--threads', type=int, default=8, help='Number of waitress threads (%(default)s)')
+    parser.add_argument('--warmup', type=int, default=5,
+                        help='Requests sent per scenario before measuring, to load the models (%(default)s)')
+    parser.add_argument('--repeat-texts', default=False, action="store_true",
+                        help="Send the same texts in every request, which measures the caches")
+    parser.add_argument('--scenarios', type=str, default=",".join(name for name, _, _, _ in SCENARIOS),
+                        help='Comma separated scenarios to run (%(default)s)')
+    add_output_argument(parser)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Offline, without speech model nor transcription workers, and a
+        # request limit no client of the benchmark reaches
+        app_args = get_parser().parse_args([
+            '--offline', '--stt-model', 'skip', '--transcription-workers', '0', '--req-limit', '1000000000',
+            '--project-directory', os.path.join(work_dir, 'projects'),
+            '--jobs-db', os.path.join(work_dir, 'jobs.db'),
+            '--projects-db', os.path.join(work_dir, 'projects.db'),
+        ] + app_argv)
+        # Runs in a daemon thread, it stops with the process
+        server = start_server(app_args, args.threads)
+        port = server.effective_port
+
+        selected = args.scenarios.split(",")
+        results = {}
+        for name, method, path, payload in SCENARIOS:
+            if name not in selected:
+                continue
+            # Warm-up texts differ from the measured ones so they do not fill the caches
+            run_scenario(port, method, path, payload and (lambda i, unique, p=payload: p(-1 - i, unique)),
+                         args.warmup, 1, True)
+            result = run_scenario(port, method, path, payload, args.requests, args.concurrency, not args.repeat_texts)
+            results[name] = result
+            print("%-22s %7.1f req/s  p50 %8.1f ms  p95 %8.1f ms  p99 %8.1f ms  errors %s" % (
+                name, result['requests_per_second'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                result['errors']))
+
+    write_results(args.output, 'http', results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Times the subtitle stages of scripts/batch.py on synthetic transcripts.
+
+words_from_candidate_transcript, build_srt_chunks and create_srt_file run
+on generated DeepSpeech token streams, so no model or media is needed.
+
+Usage: python benchmarks/bench_pipeline.py [--sizes 1000,10000,100000,1000000] [--output results.json]
+"""
+import argparse
+import importlib.util
+import os
+import random
+import tempfile
+from collections import namedtuple
+from timeit import default_timer as timer
+
+from common import ROOT, add_output_argument, write_results
+
+Token = namedtuple('Token', ['text', 'start_time'])
+Transcript = namedtuple('Transcript', ['tokens'])
+
+WORDS = ["the", "translation", "of", "subtitles", "is", "done", "by", "open", "source", "models",
+         "and", "a", "speech", "recognizer", "running", "offline"]
+# Seconds between two characters, and a pause every few words
+CHARACTER_SECONDS = 0.04
+PAUSE_SECONDS = 0.8
+
+
+def load_batch():
+    spec = importlib.util.spec_from_file_location("batch", os.path.join(ROOT, "scripts", "batch.py"))
+    batch = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(batch)
+    return batch
+
+
+def synthetic_transcript(size, seed=0):
+    """Returns a transcript of size character tokens, words separated by space tokens"""
+    rng = random.Random(seed)
+    tokens = []
+    time = 0.0
+    while len(tokens) < size:
+        word = rng.choice(WORDS)
+        for c in word:
+            tokens.append(Token(c, round(time, 2)))
+            time += CHARACTER_SECONDS
+        tokens.append(Token(" ", round(time, 2)))
+        time += PAUSE_SECONDS if rng.random() < 0.1 else CHARACTER_SECONDS
+    return Transcript(tokens[:size])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Subtitle pipeline benchmarks')
+    parser.add_argument('--sizes', type=str, default="1000,10000,100000,1000000",
+                        help='Comma separated numbers of tokens of the transcripts (%(default)s)')
+    add_output_argument(parser)
+    args = parser.parse_args()
+
+    batch = load_batch()
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        # create_srt_file writes en.srt to the working directory
+        os.chdir(work_dir)
+        try:
+            for size in [int(s) for s in args.sizes.split(",")]:
+                transcript = synthetic_transcript(size)
+
+                start = timer()
+                words = batch.words_from_candidate_transcript(transcript)
+                words_seconds = timer() - start
+
+                start = timer()
+                chunks = batch.build_srt_chunks(words)
+                chunks_seconds = timer() - start
+
+                start = timer()
+                batch.create_srt_file(chunks)
+                srt_seconds = timer() - start
+
+                for stage, seconds in (('words_from_candidate_transcript', words_seconds),
+                                       ('build_srt_chunks', chunks_seconds),
+                                       ('create_srt_file', srt_seconds)):
+                    results['%s/%s' % (stage, size)] = {'total_ms': seconds * 1000,
+                                                        'tokens_per_second': size / seconds if seconds > 0 else None}
+                    print("%-32s %8s tokens %10.1f ms" % (stage, size, seconds * 1000))
+                print("%8s tokens -> %s words, %s cues" % (size, len(words), len(chunks)))
+        finally:
+            os.chdir(cwd)
+
+    write_results(args.output, 'pipeline', results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Times language lookup, translator creation and single/batch translation.
+
+Uses the installed argos packages, so it runs offline once they are
+downloaded. Translations bypass the argos paragraph cache.
+
+Usage: python benchmarks/bench_translate.py [--source en] [--target es] [--sentences 64] [--output results.json]
+"""
+import argparse
+from timeit import default_timer as timer
+
+from common import add_output_argument, best_of, write_results
+
+from argostranslate.translate import CachedTranslation
+
+from app.batching import translate_batch, DEFAULT_MAX_BATCH_TOKENS
+from app.language import load_languages
+from app.translator_cache import TranslatorCache
+
+SENTENCES = [
+    "The quick brown fox jumps over the lazy dog.",
+    "Machine translation makes documents available in many languages.",
+    "Please send me the report before the end of the week.",
+    "The weather was nice, so we walked along the river for an hour.",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Translation micro-benchmarks')
+    parser.add_argument('--source', type=str, default="en", help='Source language code (%(default)s)')
+    parser.add_argument('--target', type=str, default="es", help='Target language code (%(default)s)')
+    parser.add_argument('--sentences', type=int, default=64,
+                        help='Number of sentences of the batch translations (%(default)s)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each measure, the best is kept (%(default)s)')
+    add_output_argument(parser)
+    args = parser.parse_args()
+
+    results = {}
+    start = timer()
+    languages = load_languages()
+    results['languages/load'] = {'load_ms': (timer() - start) * 1000}
+    print("%s languages loaded in %.1f ms" % (len(languages), results['languages/load']['load_ms']))
+
+    codes = [l.code for l in languages]
+    translators = TranslatorCache(languages)
+
+    def scan():
+        for code in codes:
+            next(iter([l for l in languages if l.code == code]), None)
+
+    def lookup():
+        for code in codes:
+            translators.get_language(code)
+
+    for name, fn in (('list scan', scan), ('dict', lookup)):
+        per_lookup = best_of(fn, args.repeat, number=100) / max(1, len(codes))
+        results['language lookup/%s' % name] = {'per_lookup_ms': per_lookup * 1000}
+        print("language lookup %-10s %10.4f ms" % (name, per_lookup * 1000))
+
+    source = translators.get_language(args.source)
+    target = translators.get_language(args.target)
+    if source is None or target is None:
+        parser.error("%s -> %s is not installed" % (args.source, args.target))
+
+    start = timer()
+    translation = source.get_translation(target)
+    results['translator/create'] = {'create_ms': (timer() - start) * 1000}
+    start = timer()
+    translators.get(args.source, args.target)
+    results['translator/cache'] = {'first_get_ms': (timer() - start) * 1000}
+    get_cached = best_of(lambda: translators.get(args.source, args.target), args.repeat, number=1000)
+    results['translator/cache']['get_ms'] = get_cached * 1000
+    print("translator create %.1f ms, cached get %.4f ms" % (results['translator/create']['create_ms'], get_cached * 1000))
+
+    # CachedTranslation answers repeated paragraphs from a dict, measure the
+    # translation underneath so every call runs the model
+    if isinstance(translation, CachedTranslation):
+        translation = translation.underlying
+
+    # The first call loads the model and processors, keep it out of the averages
+    start = timer()
+    translation.translate(SENTENCES[0])
+    results['translate/first call'] = {'first_call_ms': (timer() - start) * 1000}
+
+    texts = [SENTENCES[i % len(SENTENCES)] for i in range(args.sentences)]
+    single = best_of(lambda: translation.translate(SENTENCES[0]), args.repeat)
+    results['translate/single'] = {'per_text_ms': single * 1000}
+    one_by_one = best_of(lambda: [translation.translate(text) for text in texts], args.repeat)
+    results['translate/%s one by one' % args.sentences] = {'per_text_ms': one_by_one / len(texts) * 1000,
+                                                          'texts_per_second': len(texts) / one_by_one}
+    batch = best_of(lambda: translate_batch(translation, texts, DEFAULT_MAX_BATCH_TOKENS), args.repeat)
+    results['translate/%s batched' % args.sentences] = {'per_text_ms': batch / len(texts) * 1000,
+                                                       'texts_per_second': len(texts) / batch}
+    for case in ('translate/single', 'translate/%s one by one' % args.sentences, 'translate/%s batched' % args.sentences):
+        print("%-28s %10.3f ms/text" % (case, results[case]['per_text_ms']))
+
+    write_results(args.output, 'translate', results)
+
+
+if __name__ == "__main__":
+    main()
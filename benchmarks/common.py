@@ -0,0 +1,69 @@
+"""Helpers shared by the benchmarks: timing, percentiles and JSON results."""
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+from timeit import default_timer as timer
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+
+def add_output_argument(parser):
+    parser.add_argument('--output', type=str, default=None, metavar="<path>",
+                        help='Write the results to this JSON file, for benchmarks/compare.py')
+
+
+def best_of(fn, repeat=5, number=1):
+    """Returns the best time of repeat runs of number calls of fn, in seconds per call"""
+    best = None
+    for _ in range(repeat):
+        start = timer()
+        for _ in range(number):
+            fn()
+        elapsed = (timer() - start) / number
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    """Returns {'p50_ms': ..} for latencies given in seconds, using the nearest rank"""
+    ordered = sorted(samples)
+    result = {}
+    for point in points:
+        if ordered:
+            rank = max(0, min(len(ordered) - 1, int(round(point / 100.0 * len(ordered))) - 1))
+            result['p%s_ms' % point] = ordered[rank] * 1000
+        else:
+            result['p%s_ms' % point] = None
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'date': datetime.datetime.utcnow().isoformat() + 'Z',
+    }
+
+
+def write_results(path, benchmark, results):
+    """Writes {benchmark, environment, results} where results is {case: {metric: value}}"""
+    if path is None:
+        return
+    with open(path, 'w') as f:
+        json.dump({'benchmark': benchmark, 'environment': environment(), 'results': results}, f, indent=2, sort_keys=True)
+    print("Results written to %s" % path)
@@ -0,0 +1,62 @@
+"""Compares two result files of the same benchmark, e.g. from two commits.
+
+Usage: python benchmarks/compare.py before.json after.json [--threshold 10]
+
+Times (*_ms, *_seconds) are better lower, rates (*_per_second) better
+higher. Exits with status 1 when a metric got worse by more than the
+threshold, in percent.
+"""
+import argparse
+import json
+import sys
+
+
+def direction(metric):
+    """1 if higher is better, -1 if lower is better, 0 if the metric is not a performance figure"""
+    if metric.endswith('_per_second'):
+        return 1
+    if metric.endswith('_ms') or metric.endswith('_seconds'):
+        return -1
+    return 0
+
+
+def compare(before, after, threshold):
+    """Returns [(case, metric, before, after, change in percent, regressed)]"""
+    rows = []
+    for case, metrics in sorted(after['results'].items()):
+        previous = before['results'].get(case, {})
+        for metric, value in sorted(metrics.items()):
+            old = previous.get(metric)
+            better = direction(metric)
+            if better == 0 or not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or old == 0:
+                continue
+            change = (value - old) / old * 100
+            rows.append((case, metric, old, value, change, change * better < -threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('before', type=str, help='Results of the baseline')
+    parser.add_argument('after', type=str, help='Results to check')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='Percentage by which a metric may get worse before it is reported as a regression (%(default)s)')
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    if before['benchmark'] != after['benchmark']:
+        parser.error("%s and %s come from different benchmarks" % (args.before, args.after))
+
+    print("%s: %s -> %s" % (after['benchmark'], before['environment'].get('commit'), after['environment'].get('commit')))
+    rows = compare(before, after, args.threshold)
+    for case, metric, old, value, change, regressed in rows:
+        print("%-40s %-18s %12.3f %12.3f %+7.1f%%%s" % (case, metric, old, value, change, "  REGRESSION" if regressed else ""))
+    if any(row[-1] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
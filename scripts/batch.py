@@ -9,7 +9,6 @@ import uuid
 import shutil
 import ffmpeg
 from datetime import datetime, timedelta
-from deepspeech import Model, version
 from timeit import default_timer as timer
 import wave
 import numpy as np
@@ -17,14 +16,65 @@ import logging
 import srt
 import glob
 import re
+import sys
+import time
 import zipfile
-from app.language import languages
+import multiprocessing
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from app.language import load_languages
+from app.batching import translate_batch, DEFAULT_MAX_BATCH_TOKENS
+from app.manifest import Manifest
+from app.metrics import timeit, timing_listeners
+from app.stt import load_model, shared_after_fork, MODEL_FORMATS
+from app.projects import ProjectIndex, DEFAULT_DB_PATH as DEFAULT_PROJECTS_DB_PATH
+from app.jobs import (JobQueue, DEFAULT_DB_PATH, STAGE_AUDIO, STAGE_STT,
+                      STAGE_CHUNKING, STAGE_ZIP, translate_stage)
 
 home_dir=os.getcwd()
 
 SUBTITLE_BREAK_GAP_SECONDS = 0.5
 SUBTITLE_MAX_CHARS = 47
 SUBTITLE_MAX_DURATION_SECONDS = 7
+WORKER_POLL_SECONDS = 1
+# Artifacts tracked in the project manifest besides the media and subtitles
+WORDS_FILE = "words.json"
+ZIP_FILE = "subtitles.zip"
+# Audio is decoded in windows of this length so memory does not grow with
+# the media duration; each window ends at the quietest 20 ms frame of its
+# last STT_CUT_SEARCH_SECONDS to avoid cutting through a word
+STT_WINDOW_SECONDS = 30
+STT_CUT_SEARCH_SECONDS = 2
+STT_CUT_FRAME_SECONDS = 0.02
+# Voice activity detection: 30 ms frames are speech when their energy is
+# VAD_NOISE_RATIO times above the noise floor (10th percentile of the
+# window) and their RMS above vad_min_rms. Windows are preferably cut in
+# the middle of a silence of at least VAD_MIN_SILENCE_SECONDS.
+VAD_FRAME_SECONDS = 0.03
+VAD_NOISE_RATIO = 4
+VAD_MIN_SILENCE_SECONDS = 0.3
+# Absolute floor on the int16 RMS of speech, which keeps near-digital
+# silence out of the model. 30 is about -61 dBFS, below quiet speech
+# recordings but above dither; 0 relies on the noise floor alone.
+VAD_MIN_RMS = 30
+
+# Number of processes transcribing windows in parallel, each holding its
+# own DeepSpeech model. 1 transcribes in the main process.
+stt_workers = 1
+stt_pool = None
+# Which DeepSpeech model file to load, see app.stt.load_model
+stt_model_format = "auto"
+stt_model_path = None
+# Number of target languages whose subtitles are translated at the same time
+translate_workers = 4
+# See VAD_MIN_RMS
+vad_min_rms = VAD_MIN_RMS
+# Audio is decoded by ffmpeg straight into the transcription, it is only
+# also written to audio.wav when this is set
+keep_wav = False
+# Installed argos languages, set by load()
+languages = []
 
 class LoggerWriter:
     def __init__(self, level):
@@ -45,69 +95,158 @@ class LoggerWriter:
         # to work properly for me.
         self.level(sys.stderr)
 
-def timeit(method):
-    def timed(*args, **kw):
-        ts = timer()
-        result = method(*args, **kw)
-        te = timer()
-        if 'log_time' in kw:
-            name = kw.get('log_name', method.__name__.upper())
-            kw['log_time'][name] = int((te - ts) * 1000)
-        else:
-            logging.info('%r  %2.2f ms' % (method.__name__, (te - ts) * 1000))
-        return result
-    return timed
+def no_progress(stage, percent):
+    pass
+
+# Called with (stage, percent) as the pipeline advances
+progress = no_progress
 
 def main():
     parser = argparse.ArgumentParser(description='LibreTranslate - Free and Open Source Translation API')
     parser.add_argument('--target-dir', type=str,
-                        help='Directory of the project to translate (%(default)s)', required=True)
+                        help='Directory of the project to translate (%(default)s)')
+    parser.add_argument('--worker', default=False, action="store_true",
+                        help="Keep the models loaded and process transcription jobs from the job queue until stopped")
+    parser.add_argument('--jobs-db', type=str, default=DEFAULT_DB_PATH,
+                        help='Job queue database used in worker mode (%(default)s)')
+    parser.add_argument('--projects-db', type=str, default=DEFAULT_PROJECTS_DB_PATH,
+                        help='Project index updated after each job in worker mode (%(default)s)')
+    parser.add_argument('--stt-workers', type=int, default=1,
+                        help='Number of processes transcribing audio segments in parallel (%(default)s)')
+    parser.add_argument('--stt-model-format', type=str, default="auto", choices=MODEL_FORMATS,
+                        help='DeepSpeech model file to load, auto prefers the memory mapped .tflite that STT processes share (%(default)s)')
+    parser.add_argument('--translate-workers', type=int, default=4,
+                        help='Number of target languages whose subtitles are translated at the same time (%(default)s)')
+    parser.add_argument('--keep-wav', default=False, action="store_true",
+                        help="Also save the decoded audio to audio.wav in the project directory")
+    parser.add_argument('--vad-min-rms', type=float, default=VAD_MIN_RMS,
+                        help='Minimum RMS of 16 bit samples for audio to count as speech, 0 to only compare with the noise floor (%(default)s)')
     args = parser.parse_args()
+    global stt_workers, stt_model_format, translate_workers, keep_wav, vad_min_rms
+    stt_workers = args.stt_workers
+    stt_model_format = args.stt_model_format
+    translate_workers = args.translate_workers
+    keep_wav = args.keep_wav
+    vad_min_rms = args.vad_min_rms
+    if args.worker:
+        logging.basicConfig(filename="batch-worker.log", level=logging.DEBUG)
+        sys.stdout = LoggerWriter(logging.debug)
+        sys.stderr = LoggerWriter(logging.warning)
+        run_worker(args.jobs_db, args.projects_db)
+    elif args.target_dir:
+        logging.basicConfig(filename=os.path.join(args.target_dir, "batch.log"), level=logging.DEBUG)
+        sys.stdout = LoggerWriter(logging.debug)
+        sys.stderr = LoggerWriter(logging.warning)
+        load()
+        process_project(args.target_dir)
+    else:
+        parser.error("one of --target-dir or --worker is required")
+
+def run_worker(jobs_db, projects_db):
+    global progress
+    jobs = JobQueue(jobs_db)
+    load()
+    # Durations of the current job, stored with it for the server's /metrics.
+    # The forked STT processes append to their own copy, their timings are not kept.
+    timings = []
+    timing_listeners.append(lambda stage, seconds: timings.append((stage, seconds)))
+    # One connection per project directory, reused for every job
+    project_indexes = {}
+    while True:
+        job = jobs.claim(os.getpid())
+        if job is None:
+            time.sleep(WORKER_POLL_SECONDS)
+            continue
+        job_id, project_id, job_target_dir = job
+        logging.info("Starting transcription job %s for project %s" % (job_id, project_id))
+        handler = None
+        progress = lambda stage, percent: jobs.update_progress(job_id, stage, percent)
+        del timings[:]
+        try:
+            # Fails when the project was deleted since it was queued
+            handler = logging.FileHandler(os.path.join(job_target_dir, "batch.log"))
+            logging.getLogger().addHandler(handler)
+            jobs.set_stages(job_id, job_stages())
+            process_project(job_target_dir)
+            jobs.finish(job_id)
+            logging.info("Finished transcription job %s" % job_id)
+        except Exception as e:
+            logging.exception("Transcription job %s failed" % job_id)
+            jobs.fail(job_id, str(e))
+        finally:
+            progress = no_progress
+            jobs.record_timings(job_id, timings)
+            if handler is not None:
+                logging.getLogger().removeHandler(handler)
+                handler.close()
+            os.chdir(home_dir)
+            project_dir = os.path.abspath(job_target_dir)
+            project_directory = os.path.dirname(project_dir)
+            if project_directory not in project_indexes:
+                project_indexes[project_directory] = ProjectIndex(projects_db, project_directory)
+            project_indexes[project_directory].refresh(os.path.basename(project_dir))
+
+def job_stages():
+    stages = [STAGE_AUDIO, STAGE_STT, STAGE_CHUNKING]
+    stages += [translate_stage(l.code) for l in languages if l.code != "en"]
+    stages.append(STAGE_ZIP)
+    return stages
+
+def process_project(project_dir):
     global target_dir
-    target_dir=args.target_dir
+    target_dir = project_dir
     os.chdir(target_dir)
-    logging.basicConfig(filename="batch.log", level=logging.DEBUG)
-    sys.stdout = LoggerWriter(logging.debug)
-    sys.stderr = LoggerWriter(logging.warning)
-
-    ## create lock file
-    load()
-    create_wav_file_if_needed()
-    transcribe()
-    ## Signal completion/progress
+    manifest = Manifest(".")
+    transcribe(manifest)
 
 @timeit
 def load():
-    global language_map
+    global language_map, languages
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # Independent of the STT model, read while it loads
+        languages_future = executor.submit(load_languages)
+        load_transcribe_model()
+        languages = languages_future.result()
     language_map = {}
     for l in languages:
         language_map[l.code] = l.name
+    # Forked once no other thread runs, so no lock is copied while held
+    if stt_workers > 1:
+        start_stt_pool()
+
+@timeit
+def start_stt_pool():
+    global stt_pool, ds
+    if shared_after_fork(stt_model_path):
+        # The forked processes use the model loaded here, its weights are mapped once for all of them
+        stt_pool = multiprocessing.get_context("fork").Pool(stt_workers)
+    else:
+        # TensorFlow does not support forking once a session is loaded, so
+        # the processes are spawned and load their own session. The .pbmm
+        # weights are still shared through the page cache.
+        ds = None
+        stt_pool = multiprocessing.get_context("spawn").Pool(
+            stt_workers, initializer=init_stt_process, initargs=(home_dir, stt_model_format, vad_min_rms))
+
+def init_stt_process(models_home_dir, model_format, min_rms):
+    # Spawned processes start from a fresh import of this module
+    global home_dir, stt_model_format, vad_min_rms
+    home_dir, stt_model_format, vad_min_rms = models_home_dir, model_format, min_rms
     load_transcribe_model()
 
 @timeit
 def load_transcribe_model():
     model_load_start = timer()
-    global ds
-    ds = Model(os.path.join(home_dir,"models","deepspeech-0.9.3-models.pbmm"))
-    ds.enableExternalScorer(os.path.join(home_dir,"models","deepspeech-0.9.3-models.scorer"))
+    global ds, stt_model_path
+    ds, stt_model_path = load_model(os.path.join(home_dir, "models"), stt_model_format)
     model_load_end = timer() - model_load_start
-    logging.info('Loaded model in {:.3}s.'.format(model_load_end))
+    logging.info('Loaded {} in {:.3}s.'.format(stt_model_path, model_load_end))
     global desired_sample_rate
     desired_sample_rate = ds.sampleRate()
     logging.info('Model optimized for a sample rate of ' +
                  str(desired_sample_rate))
     
 
-@timeit
-def create_wav_file_if_needed():
-    metadata = loadProjectDetails()
-    in_filename = "rawMedia." + metadata['fileEnding']
-    if not os.path.exists("audio.wav"):
-        create_wav_file(in_filename, "audio.wav")
-@timeit
-def create_wav_file(in_filename, out_path):
-    os.system("ffmpeg -i "+in_filename+" -ac 1 -ar 16000 "+out_path)
-
 @timeit
 def loadProjectDetails():
     metadata_path = "metadata.json"
@@ -117,49 +256,307 @@ def loadProjectDetails():
     return metadata
 
 @timeit
-def transcribe():
-    logging.debug("Loading wav file for project ")
-    fin = wave.open("audio.wav", 'rb')
-    fs_orig = fin.getframerate()
-    if fs_orig != desired_sample_rate:
-        logging.error('Original sample rate ({}) is different than {}hz. Resampling might produce erratic speech recognition.'.format(
-            fs_orig, desired_sample_rate))
-    audio = np.frombuffer(fin.readframes(fin.getnframes()), np.int16)
-    audio_length = fin.getnframes() * (1/fs_orig)
-    fin.close()
-    metadata = performSpeechToText(audio)
-    logging.debug(str(metadata))
-    words = words_from_candidate_transcript(metadata.transcripts[0])
-    logging.debug(str(words))
-    srt_chunks = build_srt_chunks(words)
-    logging.debug(str(srt_chunks))
-    srt_content = create_srt_file(srt_chunks)
-    logging.debug("SRT content: "+srt_content)
-    translate_subtitles_to_all_languages(srt_content)
-    zip_all_subtitles()
+def transcribe(manifest):
+    """Runs the pipeline stages, skipping those whose inputs did not change"""
+    metadata = loadProjectDetails()
+    in_filename = "rawMedia." + metadata['fileEnding']
+    audio_inputs = {in_filename: manifest.hash(in_filename)}
+    words_inputs = transcription_inputs(audio_inputs)
+    if manifest.up_to_date(WORDS_FILE, words_inputs):
+        logging.info("Media unchanged, reusing " + WORDS_FILE)
+        progress(STAGE_AUDIO, 100)
+        srt_chunks = build_srt_chunks(WordList.from_json(json.loads(Path(WORDS_FILE).read_text())))
+    else:
+        word_list, srt_chunks = transcribe_audio(in_filename, manifest, audio_inputs)
+        Path(WORDS_FILE).write_text(word_list.to_json())
+        manifest.record(WORDS_FILE, words_inputs)
+    progress(STAGE_STT, 100)
+    logging.debug("%s subtitle cues" % len(srt_chunks))
+    subtitles = build_subtitles(srt_chunks)
+    srt_inputs = {WORDS_FILE: manifest.hash(WORDS_FILE), "chunking": chunking_settings()}
+    if not manifest.up_to_date("en.srt", srt_inputs):
+        srt_content = create_srt_file(srt_chunks)
+        logging.debug("SRT content: "+srt_content)
+        manifest.record("en.srt", srt_inputs)
+    progress(STAGE_CHUNKING, 100)
+    translate_subtitles_to_all_languages(subtitles, manifest)
+    zip_all_subtitles(manifest)
+    progress(STAGE_ZIP, 100)
+
+def transcription_inputs(audio_inputs):
+    """Inputs of words.json: the media and every setting changing the transcribed words"""
+    return dict(audio_inputs, sample_rate=str(desired_sample_rate), vad_min_rms=str(vad_min_rms),
+                stt_model=stt_model_path, stt_model_format=os.path.splitext(stt_model_path)[1][1:])
+
+def chunking_settings():
+    return "%s/%s/%s" % (SUBTITLE_BREAK_GAP_SECONDS, SUBTITLE_MAX_CHARS, SUBTITLE_MAX_DURATION_SECONDS)
+
+@timeit
+def transcribe_audio(in_filename, manifest, audio_inputs):
+    """Transcribes the project media, publishing en.srt as windows are done.
+
+    The audio is decoded by ffmpeg through a pipe, unless an up to date
+    audio.wav was kept from a previous run.
+
+    Returns:
+        (WordList, SubtitleBuilder): Words and subtitle cues.
+
+    """
+    fin = None
+    if manifest.up_to_date("audio.wav", audio_inputs):
+        logging.debug("Loading wav file for project ")
+        fin = wave.open("audio.wav", 'rb')
+        fs_orig = fin.getframerate()
+        if fs_orig != desired_sample_rate:
+            logging.error('Original sample rate ({}) is different than {}hz. Resampling might produce erratic speech recognition.'.format(
+                fs_orig, desired_sample_rate))
+        total_frames = fin.getnframes()
+        blocks = read_wav_blocks(fin)
+    else:
+        fs_orig = desired_sample_rate
+        total_frames = probe_frames(in_filename, fs_orig)
+        blocks = decode_audio_blocks(in_filename, fs_orig, "audio.wav" if keep_wav else None)
+    builder = SubtitleBuilder()
+    word_list = WordList()
+    try:
+        for words in stream_words(audio_progress(blocks, total_frames), fs_orig, total_frames):
+            logging.debug(" ".join(words.texts))
+            builder.add_words(words)
+            word_list.extend(words)
+            # Publish what we have so far, the last cue may still grow
+            create_srt_file(builder)
+    finally:
+        if fin is not None:
+            fin.close()
+        else:
+            blocks.close()
+    if fin is None and keep_wav:
+        manifest.record("audio.wav", audio_inputs)
+    return word_list, builder
+
+def decode_audio_blocks(in_filename, sample_rate, wav_path=None, block_seconds=1):
+    """Decodes in_filename with ffmpeg into mono int16 blocks read from a pipe.
+
+    No file is written unless wav_path is given, in which case the decoded
+    audio is also saved there once ffmpeg finished successfully.
+
+    """
+    process = (ffmpeg
+               .input(in_filename)
+               .output('pipe:', format='s16le', acodec='pcm_s16le', ac=1, ar=sample_rate)
+               .global_args('-nostdin', '-loglevel', 'error')
+               .run_async(pipe_stdout=True))
+    wav = None
+    if wav_path is not None:
+        wav = wave.open(wav_path + ".part", 'wb')
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+    block_bytes = int(sample_rate * block_seconds) * 2
+    completed = False
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            if wav is not None:
+                wav.writeframes(data)
+            yield np.frombuffer(data, np.int16)
+        if process.wait() != 0:
+            raise RuntimeError("ffmpeg could not decode %s (exit code %s)" % (in_filename, process.returncode))
+        completed = True
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        process.wait()
+        if wav is not None:
+            wav.close()
+            if completed:
+                os.replace(wav_path + ".part", wav_path)
+            else:
+                os.remove(wav_path + ".part")
+
+def probe_frames(in_filename, sample_rate):
+    """Returns the number of audio frames in_filename decodes to, None if ffprobe does not know"""
+    try:
+        duration = float(ffmpeg.probe(in_filename)['format']['duration'])
+    except (ffmpeg.Error, KeyError, ValueError):
+        return None
+    return int(duration * sample_rate)
+
+def read_wav_blocks(fin, block_seconds=1):
+    block_frames = int(fin.getframerate() * block_seconds)
+    while True:
+        data = fin.readframes(block_frames)
+        if not data:
+            break
+        yield np.frombuffer(data, np.int16)
+
+def audio_progress(blocks, total_frames=None):
+    """Passes audio blocks through, reporting the share of the audio read as the audio stage"""
+    read_frames = 0
+    reported = 0
+    for block in blocks:
+        read_frames += len(block)
+        if total_frames:
+            percent = min(99, int(100 * read_frames / total_frames))
+            if percent > reported:
+                progress(STAGE_AUDIO, percent)
+                reported = percent
+        yield block
+    progress(STAGE_AUDIO, 100)
+
+def stream_words(blocks, sample_rate, total_frames=None):
+    """Transcribes int16 audio blocks window by window.
+
+    Yields the words of each window in order, with start times relative to
+    the start of the audio. Windows are transcribed in parallel when an STT
+    pool is running; at most two windows per worker are held in memory.
+
+    """
+    done_frames = 0
+    for window_frames, words in transcribe_windows(iter_windows(blocks, sample_rate), sample_rate):
+        done_frames += window_frames
+        if total_frames:
+            progress(STAGE_STT, min(99, 100 * done_frames / total_frames))
+        yield words
+
+def iter_windows(blocks, sample_rate):
+    """Groups audio blocks into (offset_frames, window) pieces of about STT_WINDOW_SECONDS"""
+    window_frames = int(STT_WINDOW_SECONDS * sample_rate)
+    pending = []
+    pending_frames = 0
+    offset_frames = 0
+    blocks = iter(blocks)
+    finished = False
+    while not finished:
+        while pending_frames < window_frames:
+            block = next(blocks, None)
+            if block is None:
+                finished = True
+                break
+            pending.append(block)
+            pending_frames += len(block)
+        if pending_frames == 0:
+            break
+        audio = np.concatenate(pending)
+        cut = len(audio) if finished else find_cut(audio[:window_frames], sample_rate)
+        window, rest = audio[:cut], audio[cut:]
+        pending = [rest] if len(rest) > 0 else []
+        pending_frames = len(rest)
+        yield (offset_frames, window)
+        offset_frames += cut
+
+def transcribe_windows(windows, sample_rate):
+    """Yields (window length, words) for each (offset_frames, window), in order"""
+    if stt_pool is None:
+        for offset_frames, window in windows:
+            yield (len(window), transcribe_window(window, offset_frames / sample_rate))
+        return
+
+    in_flight = deque()
+    for offset_frames, window in windows:
+        in_flight.append((len(window), stt_pool.apply_async(transcribe_window, (window, offset_frames / sample_rate))))
+        if len(in_flight) >= 2 * stt_workers:
+            window_frames, result = in_flight.popleft()
+            yield (window_frames, result.get())
+    while in_flight:
+        window_frames, result = in_flight.popleft()
+        yield (window_frames, result.get())
+
+def transcribe_window(window, time_offset):
+    # Silent windows (pauses, music intros) do not need the model
+    if not speech_frames(window, desired_sample_rate).any():
+        return WordList()
+    metadata = performSpeechToText(window)
+    return words_from_candidate_transcript(metadata.transcripts[0], time_offset)
+
+def speech_frames(audio, sample_rate):
+    """Returns a boolean array telling which VAD_FRAME_SECONDS frames of audio contain speech"""
+    frame = max(1, int(VAD_FRAME_SECONDS * sample_rate))
+    count = len(audio) // frame
+    if count == 0:
+        return np.zeros(0, dtype=bool)
+    frames = audio[:count * frame].astype(np.float32).reshape(count, frame)
+    energies = np.mean(frames * frames, axis=1)
+    threshold = max(VAD_NOISE_RATIO * np.percentile(energies, 10), vad_min_rms * vad_min_rms)
+    return energies > threshold
+
+def find_cut(audio, sample_rate):
+    """Returns where to end a window: the middle of its last long silence in
+    the second half, or the quietest frame near the end if there is none"""
+    frame = max(1, int(VAD_FRAME_SECONDS * sample_rate))
+    silent = ~speech_frames(audio, sample_rate)
+    min_silence = max(1, int(VAD_MIN_SILENCE_SECONDS / VAD_FRAME_SECONDS))
+    # Silence runs as [start, end) frame ranges
+    edges = np.flatnonzero(np.diff(np.concatenate([[False], silent, [False]]).astype(np.int8)))
+    for start, end in reversed(list(zip(edges[0::2], edges[1::2]))):
+        if (start + end) // 2 < len(silent) // 2:
+            break
+        if end - start >= min_silence:
+            return int((start + end) * frame) // 2
+    return find_quiet_cut(audio, sample_rate)
+
+def find_quiet_cut(audio, sample_rate):
+    frame = max(1, int(STT_CUT_FRAME_SECONDS * sample_rate))
+    search = min(len(audio), int(STT_CUT_SEARCH_SECONDS * sample_rate))
+    start = len(audio) - search + (search % frame)
+    frames = audio[start:].astype(np.float32).reshape(-1, frame)
+    if len(frames) == 0:
+        return len(audio)
+    energies = np.mean(frames * frames, axis=1)
+    return start + int(np.argmin(energies)) * frame + frame // 2
 
 @timeit
-def zip_all_subtitles():
-    zipf = zipfile.ZipFile('subtitles.zip','w', zipfile.ZIP_DEFLATED)
-    for file in os.listdir("./"):
-        if file.endswith(".srt"):
+def zip_all_subtitles(manifest):
+    inputs = {file: manifest.hash(file) for file in sorted(os.listdir("./")) if file.endswith(".srt")}
+    if manifest.up_to_date(ZIP_FILE, inputs):
+        return
+    previous = manifest.inputs(ZIP_FILE)
+    if (previous is not None and os.path.exists(ZIP_FILE)
+            and all(inputs.get(file) == digest for file, digest in previous.items())):
+        # Only new languages, append them to the existing archive
+        mode = 'a'
+        files = [file for file in inputs if file not in previous]
+    else:
+        mode = 'w'
+        files = list(inputs)
+    with zipfile.ZipFile(ZIP_FILE, mode, zipfile.ZIP_DEFLATED) as zipf:
+        for file in files:
             zipf.write(file)
+    manifest.record(ZIP_FILE, inputs)
 
 @timeit
-def translate_subtitles_to_all_languages(srt_content):
+def translate_subtitles_to_all_languages(subtitles, manifest):
     src_lang = next(
         iter([l for l in languages if l.code == "en"]), None)
+    # Only the cue texts go to the model, indexes and timings are copied
+    texts = [subtitle.content for subtitle in subtitles]
+    inputs = {"en.srt": manifest.hash("en.srt")}
+    targets = []
     for tgt_lang in languages:
-        if(tgt_lang.code == src_lang.code):
+        if tgt_lang.code == src_lang.code:
             continue
-        translate_subtitles_to_one_language(
-            src_lang, tgt_lang, srt_content)
+        if manifest.up_to_date(tgt_lang.code+".srt", inputs):
+            progress(translate_stage(tgt_lang.code), 100)
+        else:
+            targets.append(tgt_lang)
+    with ThreadPoolExecutor(max_workers=max(1, translate_workers)) as executor:
+        futures = [executor.submit(translate_subtitles_to_one_language, src_lang, tgt_lang, subtitles, texts)
+                   for tgt_lang in targets]
+        for tgt_lang, future in zip(targets, futures):
+            future.result()
+            manifest.record(tgt_lang.code+".srt", inputs)
 
 @timeit
-def translate_subtitles_to_one_language(src_lang, tgt_lang, srt_content):
+def translate_subtitles_to_one_language(src_lang, tgt_lang, subtitles, texts):
     translator = src_lang.get_translation(tgt_lang)
-    translated_content = translator.translate(srt_content)
-    write_srt_file(translated_content, tgt_lang.code)
+    translated_texts = translate_batch(translator, texts, DEFAULT_MAX_BATCH_TOKENS)
+    translated_subtitles = [srt.Subtitle(subtitle.index, subtitle.start, subtitle.end, text)
+                            for subtitle, text in zip(subtitles, translated_texts)]
+    write_srt_file(srt.compose(translated_subtitles), tgt_lang.code)
+    progress(translate_stage(tgt_lang.code), 100)
 
 @timeit
 def write_srt_file(content, lang_code):
@@ -171,84 +568,192 @@ def performSpeechToText(audio):
     return ds.sttWithMetadata(audio)
 
 
+class WordList:
+    """Words of a transcript, stored as columns.
+
+    Texts, start times and durations are kept in three parallel lists
+    instead of a dict per word. The values keep their Python type so
+    words.json stays the same as when it was written from dicts.
+    Iterating yields (text, start_time, duration) tuples.
+
+    """
+
+    def __init__(self, texts=None, starts=None, durations=None):
+        self.texts = texts if texts is not None else []
+        self.starts = starts if starts is not None else []
+        self.durations = durations if durations is not None else []
+
+    def append(self, text, start_time, duration):
+        self.texts.append(text)
+        self.starts.append(start_time)
+        self.durations.append(duration)
+
+    def extend(self, words):
+        self.texts.extend(words.texts)
+        self.starts.extend(words.starts)
+        self.durations.extend(words.durations)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __iter__(self):
+        return zip(self.texts, self.starts, self.durations)
+
+    def to_json(self):
+        """Returns the words as a JSON list of {text, start_time, duration} objects, without building the dicts"""
+        return "[" + ", ".join('{"text": %s, "start_time": %r, "duration": %r}' % (json.dumps(text), start_time, duration)
+                               for text, start_time, duration in self) + "]"
+
+    @classmethod
+    def from_json(cls, words):
+        word_list = cls()
+        for word in words:
+            word_list.append(word['text'], word['start_time'], word['duration'])
+        return word_list
+
 @timeit
-def words_from_candidate_transcript(metadata):
-    word = ""
-    word_list = []
+def words_from_candidate_transcript(metadata, time_offset=0):
+    """Returns the WordList of a DeepSpeech transcript, joining the characters between space tokens"""
+    texts, starts, durations = [], [], []
+    tokens = metadata.tokens
+    last = len(tokens) - 1
+    characters = []
+    word_length = 0
     word_start_time = 0
     word_duration = 0
-    # Loop through each character
-    for i, token in enumerate(metadata.tokens):
+    for i, token in enumerate(tokens):
+        text = token.text
         # Append character to word if it's not a space
-        if token.text != " ":
-            if len(word) == 0:
+        if text != " ":
+            if word_length == 0:
                 # Log the start time of the new word
                 word_start_time = token.start_time
 
-            word = word + token.text
+            characters.append(text)
+            word_length += len(text)
             word_duration = token.start_time - word_start_time
 
         # Word boundary is either a space or the last character in the array
-        if token.text == " " or i == len(metadata.tokens) - 1:
+        if text == " " or i == last:
 
             if word_duration < 0:
                 word_duration = 0
 
-            each_word = dict()
-            each_word["text"] = word
-            each_word["start_time"] = round(word_start_time, 4)
-            each_word["duration"] = round(word_duration, 4)
-
-            word_list.append(each_word)
+            texts.append("".join(characters))
+            starts.append(round(word_start_time + time_offset, 4))
+            durations.append(round(word_duration, 4))
             # Reset
-            word = ""
+            characters = []
+            word_length = 0
             word_start_time = 0
 
-    return word_list
+    return WordList(texts, starts, durations)
+
+class SubtitleBuilder:
+    """Groups words into subtitle cues as they arrive.
+
+    A cue is closed when it would get longer than SUBTITLE_MAX_CHARS or
+    SUBTITLE_MAX_DURATION_SECONDS, or after a pause longer than
+    SUBTITLE_BREAK_GAP_SECONDS. Every cue but the last one is final.
+
+    Cue times are kept in array('d') columns. The words of the open cue are
+    joined once when it is closed, and the SRT blocks of final cues are
+    composed once, so publishing the SRT after each window does not redo
+    the whole transcript.
+
+    """
+
+    def __init__(self):
+        self.starts = array('d')
+        self.ends = array('d')
+        # Texts of the closed cues, and words and text length of the open one
+        self.texts = []
+        self.parts = []
+        self.length = 0
+        # SRT blocks of the final cues, see compose()
+        self.blocks = []
+        self.composed = 0
+        self.next_index = 1
+        self.in_order = True
+
+    def add_words(self, words):
+        """Adds (text, start_time, duration) words at the end of the transcript"""
+        starts, ends, texts = self.starts, self.ends, self.texts
+        parts, length = self.parts, self.length
+        for text, start_time, duration in words:
+            end_time = start_time + duration
+            if not starts:
+                # The text of the first cue starts empty, words are added after a space
+                starts.append(start_time)
+                ends.append(end_time)
+                parts, length = [""], 0
+            too_long_characters = length + len(text) + 1 > SUBTITLE_MAX_CHARS
+            paused = start_time - ends[-1] > SUBTITLE_BREAK_GAP_SECONDS
+            too_long_duration = end_time - starts[-1] > SUBTITLE_MAX_DURATION_SECONDS
+            if too_long_characters or paused or too_long_duration:
+                texts.append(" ".join(parts))
+                starts.append(start_time)
+                ends.append(end_time)
+                parts, length = [text], len(text)
+            else:
+                parts.append(text)
+                length += len(text) + 1
+                ends[-1] = end_time
+        self.parts, self.length = parts, length
+
+    def __len__(self):
+        return len(self.starts)
+
+    def subtitle(self, i):
+        """Returns cue i as an srt.Subtitle, which ends where the next cue starts"""
+        end_time = self.starts[i + 1] if i != len(self.starts) - 1 else self.ends[i]
+        text = self.texts[i] if i < len(self.texts) else " ".join(self.parts)
+        return srt.Subtitle(i + 1, timedelta(seconds=self.starts[i]), timedelta(seconds=end_time), text.strip())
+
+    def subtitles(self):
+        return [self.subtitle(i) for i in range(len(self.starts))]
+
+    def compose(self):
+        """Returns the SRT of the cues, as srt.compose(self.subtitles()) would.
+
+        srt.compose sorts the cues by time, skips empty ones and numbers the
+        others. Cues arrive in time order, so the cues that became final
+        since the last call are composed once and their blocks kept; if one
+        ever starts before the previous one, the whole SRT is composed
+        instead.
+
+        """
+        if not self.starts:
+            return ""
+        starts = self.starts
+        last = len(starts) - 1
+        if self.in_order and any(starts[i] < starts[i - 1] for i in range(max(self.composed, 1), last + 1)):
+            self.in_order = False
+        if not self.in_order:
+            return srt.compose(self.subtitles())
+        if self.composed < last:
+            subtitles = list(srt.sort_and_reindex([self.subtitle(i) for i in range(self.composed, last)],
+                                                  start_index=self.next_index, in_place=True))
+            self.blocks.append("".join(subtitle.to_srt() for subtitle in subtitles))
+            self.next_index += len(subtitles)
+            self.composed = last
+        return "".join(self.blocks) + srt.compose([self.subtitle(last)], start_index=self.next_index)
 
 @timeit
 def build_srt_chunks(word_list):
-    srt_chunks = []
-    srt_chunks.append(
-        {"start_time": word_list[0]['start_time'], "end_time": word_list[0]['start_time']+word_list[0]['duration'], "text": ""})
-    for word in word_list:
-        if word is None:
-            continue
-        last_chunk = srt_chunks[-1]
-        too_long_characters = len(
-            last_chunk['text'])+len(word['text'])+1 > SUBTITLE_MAX_CHARS
-        paused = word['start_time'] - \
-            last_chunk['end_time'] > SUBTITLE_BREAK_GAP_SECONDS
-        too_long_duration = word['start_time']+word['duration'] - \
-            last_chunk['start_time'] > SUBTITLE_MAX_DURATION_SECONDS
-        if too_long_characters or paused or too_long_duration:
-            srt_chunks.append(
-                {"start_time": word['start_time'], "end_time": word['start_time']+word['duration'], "text": word['text']})
-        else:
-            last_chunk['text'] = last_chunk['text']+" "+word['text']
-            last_chunk['end_time'] = word['start_time']+word['duration']
-    return srt_chunks
+    builder = SubtitleBuilder()
+    builder.add_words(word_list)
+    return builder
+
+def build_subtitles(srt_chunks):
+    return srt_chunks.subtitles()
 
 @timeit
 def create_srt_file(srt_chunks):
-    subtitles = []
-    for i, chunk in enumerate(srt_chunks):
-        end_time = chunk['end_time']
-        if i != len(srt_chunks) - 1:
-            end_time = srt_chunks[i+1]['start_time']
-        subtitles.append(srt.Subtitle(
-            i+1, timedelta(seconds=chunk['start_time']), timedelta(seconds=end_time), chunk['text'].strip()))
-    srt_content = srt.compose(subtitles)
+    srt_content = srt_chunks.compose()
     write_srt_file(srt_content, "en")
     return srt_content
 
-@timeit
-def write_srt_file(content, lang_code):
-    with open(lang_code+".srt", 'w') as f:
-        f.write(content)
-
-
-
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,29 @@
+import time
+
+from app.api_keys import Database
+
+
+def test_lookup_uses_snapshot(tmp_path):
+    db_path = str(tmp_path / "api_keys.db")
+    db = Database(db_path, refresh_interval=0.05)
+    api_key, req_limit = db.add(10)
+    assert db.lookup(api_key) == 10
+    assert db.lookup("unknown") is None
+
+    db.add(20, api_key)
+    assert db.lookup(api_key) == 20
+    db.remove(api_key)
+    assert db.lookup(api_key) is None
+
+
+def test_reloads_changes_of_other_processes(tmp_path):
+    db_path = str(tmp_path / "api_keys.db")
+    server = Database(db_path, refresh_interval=0.05)
+    assert server.lookup("key") is None
+
+    # manage.py uses its own Database
+    Database(db_path).add(5, "key")
+    deadline = time.time() + 5
+    while server.lookup("key") is None and time.time() < deadline:
+        time.sleep(0.05)
+    assert server.lookup("key") == 5
@@ -0,0 +1,288 @@
+import importlib.util
+import io
+import json
+import os
+import wave
+from datetime import timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import srt
+
+from app.manifest import Manifest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+SAMPLE_RATE = 16000
+
+
+@pytest.fixture(scope="module")
+def batch():
+    spec = importlib.util.spec_from_file_location("batch", os.path.join(ROOT, "scripts", "batch.py"))
+    batch = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(batch)
+    return batch
+
+
+def tone(seconds, rms, seed=0):
+    """Tone with a syllable-like 4 Hz envelope and the given int16 RMS, a stand-in for speech"""
+    rng = np.random.RandomState(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    envelope = np.sin(2 * np.pi * 2 * t + rng.uniform(0, np.pi)) ** 2
+    signal = np.sin(2 * np.pi * 220 * t) * envelope * (1 + 0.3 * rng.randn(len(t)))
+    return (signal / np.sqrt(np.mean(signal ** 2)) * rms).astype(np.int16)
+
+
+def silence(seconds, rms=2, seed=1):
+    return (np.random.RandomState(seed).randn(int(seconds * SAMPLE_RATE)) * rms).astype(np.int16)
+
+
+def test_speech_frames(batch):
+    audio = np.concatenate([silence(1), tone(1, 3000), silence(1)])
+    speech = batch.speech_frames(audio, SAMPLE_RATE)
+    frames_per_second = int(1 / batch.VAD_FRAME_SECONDS)
+    assert len(speech) == len(audio) // int(batch.VAD_FRAME_SECONDS * SAMPLE_RATE)
+    assert not speech[:frames_per_second - 1].any()
+    assert speech[frames_per_second + 1:2 * frames_per_second - 1].all()
+    assert not speech[2 * frames_per_second + 1:].any()
+
+    assert len(batch.speech_frames(audio[:10], SAMPLE_RATE)) == 0
+    # Dither alone is not speech
+    assert not batch.speech_frames(silence(3), SAMPLE_RATE).any()
+
+
+def test_quiet_recording_is_speech(batch, monkeypatch):
+    # Speech at about -56 dBFS over a quieter noise floor
+    audio = np.concatenate([silence(1), tone(2, 50), silence(1)])
+    assert batch.speech_frames(audio, SAMPLE_RATE).any()
+    monkeypatch.setattr(batch, "vad_min_rms", 100)
+    assert not batch.speech_frames(audio, SAMPLE_RATE).any()
+
+
+def test_find_cut_in_last_silence(batch):
+    # The silence from 20 to 21 s is the last one in the second half of the window
+    audio = np.concatenate([tone(5, 3000), silence(1), tone(14, 3000), silence(1), tone(9, 3000, seed=2)])
+    cut = batch.find_cut(audio, SAMPLE_RATE)
+    assert 20.4 * SAMPLE_RATE <= cut <= 20.6 * SAMPLE_RATE
+
+
+def test_find_cut_without_silence(batch):
+    # Continuous speech is cut at the quietest frame of the last seconds
+    audio = tone(10, 3000)
+    audio[int(8.5 * SAMPLE_RATE):int(8.52 * SAMPLE_RATE)] = 0
+    cut = batch.find_cut(audio, SAMPLE_RATE)
+    assert 8.5 * SAMPLE_RATE <= cut <= 8.52 * SAMPLE_RATE
+    assert batch.find_cut(audio[:0], SAMPLE_RATE) == 0
+
+
+def test_iter_windows(batch):
+    audio = np.concatenate([tone(20, 3000), silence(1), tone(20, 3000, seed=2), silence(0.5), tone(35, 3000, seed=3)])
+    blocks = [audio[i:i + SAMPLE_RATE] for i in range(0, len(audio), SAMPLE_RATE)]
+    windows = list(batch.iter_windows(iter(blocks), SAMPLE_RATE))
+
+    assert len(windows) > 2
+    offset = 0
+    for window_offset, window in windows:
+        assert window_offset == offset
+        assert len(window) <= batch.STT_WINDOW_SECONDS * SAMPLE_RATE
+        offset += len(window)
+    assert np.array_equal(np.concatenate([window for _, window in windows]), audio)
+    # The first window ends in the middle of the first silence
+    assert 20.4 * SAMPLE_RATE <= len(windows[0][1]) <= 20.6 * SAMPLE_RATE
+
+
+def test_iter_windows_short_and_empty(batch):
+    audio = tone(3, 3000)
+    assert [(o, len(w)) for o, w in batch.iter_windows([audio[:SAMPLE_RATE], audio[SAMPLE_RATE:]], SAMPLE_RATE)] \
+        == [(0, len(audio))]
+    assert list(batch.iter_windows([], SAMPLE_RATE)) == []
+    assert list(batch.iter_windows([np.zeros(0, np.int16)], SAMPLE_RATE)) == []
+
+
+class FakeFfmpeg:
+    """Stands in for ffmpeg-python, run_async returns a process whose stdout holds data"""
+
+    def __init__(self, data, returncode=0):
+        self.data = data
+        self.returncode = returncode
+
+    def input(self, filename):
+        return self
+
+    def output(self, *args, **kwargs):
+        return self
+
+    def global_args(self, *args):
+        return self
+
+    def run_async(self, pipe_stdout=False):
+        return FakeProcess(self.data, self.returncode)
+
+
+class FakeProcess:
+    def __init__(self, data, returncode):
+        self.stdout = io.BytesIO(data)
+        self.exit_code = returncode
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        self.returncode = self.exit_code
+        return self.returncode
+
+    def kill(self):
+        self.returncode = -9
+
+
+def test_decode_audio_blocks(batch, monkeypatch, tmp_path):
+    audio = tone(2.5, 3000)
+    monkeypatch.setattr(batch, "ffmpeg", FakeFfmpeg(audio.tobytes()))
+    wav_path = str(tmp_path / "audio.wav")
+
+    blocks = list(batch.decode_audio_blocks("media.mp4", SAMPLE_RATE, wav_path))
+    assert [len(block) for block in blocks] == [SAMPLE_RATE, SAMPLE_RATE, SAMPLE_RATE // 2]
+    assert np.array_equal(np.concatenate(blocks), audio)
+    with wave.open(wav_path, 'rb') as f:
+        assert (f.getframerate(), f.getnchannels(), f.getsampwidth()) == (SAMPLE_RATE, 1, 2)
+        assert f.readframes(f.getnframes()) == audio.tobytes()
+
+    # Without wav_path nothing is written
+    os.remove(wav_path)
+    assert len(list(batch.decode_audio_blocks("media.mp4", SAMPLE_RATE))) == 3
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_decode_audio_blocks_failure(batch, monkeypatch, tmp_path):
+    monkeypatch.setattr(batch, "ffmpeg", FakeFfmpeg(tone(1, 3000).tobytes(), returncode=1))
+    with pytest.raises(RuntimeError):
+        list(batch.decode_audio_blocks("media.mp4", SAMPLE_RATE, str(tmp_path / "audio.wav")))
+    # The partial audio is not kept
+    assert os.listdir(str(tmp_path)) == []
+
+
+class WorkerStopped(Exception):
+    pass
+
+
+def test_worker_fails_job_of_deleted_project(batch, monkeypatch, tmp_path):
+    from app.jobs import JobQueue, FAILED
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(batch, "home_dir", str(tmp_path))
+    monkeypatch.setattr(batch, "load", lambda: None)
+
+    def sleep(seconds):
+        raise WorkerStopped()
+
+    monkeypatch.setattr(batch.time, "sleep", sleep)
+    jobs_db = str(tmp_path / "jobs.db")
+    JobQueue(jobs_db).enqueue("gone", str(tmp_path / "projects" / "gone"))
+    with pytest.raises(WorkerStopped):
+        batch.run_worker(jobs_db, str(tmp_path / "projects.db"))
+
+    status = JobQueue(jobs_db).status("gone")
+    assert status['status'] == FAILED
+    assert "batch.log" in status['error']
+
+
+def test_transcription_inputs_include_model(batch, monkeypatch):
+    monkeypatch.setattr(batch, "desired_sample_rate", SAMPLE_RATE, raising=False)
+    audio_inputs = {"rawMedia.mp3": "abc"}
+    monkeypatch.setattr(batch, "stt_model_path", "/models/deepspeech-0.9.3-models.pbmm")
+    pbmm = batch.transcription_inputs(audio_inputs)
+    assert pbmm["stt_model_format"] == "pbmm"
+    assert pbmm["rawMedia.mp3"] == "abc"
+
+    monkeypatch.setattr(batch, "stt_model_path", "/models/deepspeech-0.9.3-models.tflite")
+    tflite = batch.transcription_inputs(audio_inputs)
+    assert tflite["stt_model_format"] == "tflite"
+    assert tflite != pbmm
+
+
+def test_translate_subtitles_sends_only_cue_texts(batch, monkeypatch, tmp_path):
+    class FakeLanguage:
+        def __init__(self, code):
+            self.code = code
+
+        def get_translation(self, to):
+            return (self.code, to.code)
+
+    calls = []
+
+    def translate_batch(translator, texts, max_batch_tokens):
+        calls.append((translator, list(texts)))
+        return ["%s:%s" % (translator[1], text) for text in texts]
+
+    subtitles = [srt.Subtitle(1, timedelta(seconds=0), timedelta(seconds=1.5), "Hello there"),
+                 srt.Subtitle(2, timedelta(seconds=2), timedelta(seconds=4.25), "How are you\ntoday"),
+                 srt.Subtitle(3, timedelta(minutes=1, seconds=5), timedelta(minutes=1, seconds=7), "Bye")]
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "en.srt").write_text(srt.compose(subtitles))
+    monkeypatch.setattr(batch, "languages", [FakeLanguage(code) for code in ["en", "es", "fr"]])
+    monkeypatch.setattr(batch, "translate_batch", translate_batch)
+    monkeypatch.setattr(batch, "translate_workers", 1)
+
+    batch.translate_subtitles_to_all_languages(subtitles, Manifest("."))
+
+    # One batch per target language, holding every cue text and nothing else
+    assert sorted(calls) == [(("en", "es"), [s.content for s in subtitles]),
+                             (("en", "fr"), [s.content for s in subtitles])]
+    for code in ["es", "fr"]:
+        translated = list(srt.parse((tmp_path / (code + ".srt")).read_text()))
+        assert [(s.index, s.start, s.end) for s in translated] == [(s.index, s.start, s.end) for s in subtitles]
+        assert [s.content for s in translated] == ["%s:%s" % (code, s.content) for s in subtitles]
+
+    # Up to date translations are not sent again
+    del calls[:]
+    batch.translate_subtitles_to_all_languages(subtitles, Manifest("."))
+    assert calls == []
+
+
+def test_audio_progress(batch, monkeypatch):
+    reported = []
+    monkeypatch.setattr(batch, "progress", lambda stage, percent: reported.append((stage, percent)))
+    blocks = [np.zeros(SAMPLE_RATE, np.int16)] * 4
+
+    assert len(list(batch.audio_progress(iter(blocks), 4 * SAMPLE_RATE))) == 4
+    # The probed length is an estimate, 100 is only reported once the last block was read
+    assert reported == [(batch.STAGE_AUDIO, 25), (batch.STAGE_AUDIO, 50), (batch.STAGE_AUDIO, 75),
+                        (batch.STAGE_AUDIO, 99), (batch.STAGE_AUDIO, 100)]
+
+    del reported[:]
+    assert len(list(batch.audio_progress(iter(blocks)))) == 4
+    assert reported == [(batch.STAGE_AUDIO, 100)]
+
+
+def transcript_windows():
+    """DeepSpeech transcripts of consecutive windows, tokens as [text, start_time]"""
+    with open(os.path.join(DATA, "transcript_windows.json")) as f:
+        windows = json.load(f)
+    return [SimpleNamespace(tokens=[SimpleNamespace(text=text, start_time=start_time) for text, start_time in tokens])
+            for tokens in windows]
+
+
+def test_srt_matches_expected_file(batch, monkeypatch, tmp_path):
+    # transcript.srt was written by the dict based words_from_candidate_transcript,
+    # build_srt_chunks and create_srt_file that WordList and SubtitleBuilder replaced
+    with open(os.path.join(DATA, "transcript.srt")) as f:
+        expected = f.read()
+    monkeypatch.chdir(tmp_path)
+
+    word_list = batch.WordList()
+    builder = batch.SubtitleBuilder()
+    for metadata in transcript_windows():
+        words = batch.words_from_candidate_transcript(metadata)
+        word_list.extend(words)
+        # Published after each window while transcribing
+        builder.add_words(words)
+        assert builder.compose() == srt.compose(builder.subtitles())
+    assert builder.compose() == expected
+
+    assert batch.create_srt_file(batch.build_srt_chunks(word_list)) == expected
+    assert (tmp_path / "en.srt").read_text() == expected
+    # Same cues from a words.json written by a previous run
+    reloaded = batch.WordList.from_json(json.loads(word_list.to_json()))
+    assert batch.build_srt_chunks(reloaded).compose() == expected
@@ -0,0 +1,117 @@
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from argostranslate.translate import CompositeTranslation, Language, PackageTranslation
+
+from app import batching
+from app.batching import make_batches, translate_batch
+
+
+class FakeSentencePiece:
+    def encode(self, text, out_type=str):
+        return ["▁" + word for word in text.split()]
+
+
+class FakeStanza:
+    """Splits sentences after each period, fails if called from two threads at once"""
+
+    def __init__(self):
+        self.running = False
+
+    def __call__(self, paragraph):
+        assert not self.running
+        self.running = True
+        time.sleep(0.001)
+        self.running = False
+        sentences = [s.strip() + "." for s in paragraph.split(".") if s.strip()]
+        return SimpleNamespace(sentences=[SimpleNamespace(text=s) for s in sentences])
+
+
+class FakeTranslator:
+    """Upper-cases tokens and records the batches it is called with"""
+
+    def __init__(self):
+        self.batches = []
+
+    def translate_batch(self, batch, **kwargs):
+        self.batches.append(batch)
+        return [[{'tokens': [token.upper() for token in tokens]}] for tokens in batch]
+
+
+@pytest.fixture
+def translation(monkeypatch):
+    en, es = Language("en", "English"), Language("es", "Spanish")
+    translation = PackageTranslation(en, es, SimpleNamespace(package_path=Path("/packages/en_es"), from_code="en"))
+    translation.translator = FakeTranslator()
+    processors = (FakeSentencePiece(), FakeStanza(), threading.Lock())
+    monkeypatch.setattr(batching, "get_processors", lambda pkg: processors)
+    return translation
+
+
+def tokens(*lengths):
+    return [["t"] * length for length in lengths]
+
+
+def test_make_batches_bound():
+    batches = make_batches(tokens(3, 1, 4, 2, 5), 6)
+    # Shortest sentences first, no batch over the bound
+    assert batches == [[1, 3, 0], [2], [4]]
+    assert sorted(i for batch in batches for i in batch) == list(range(5))
+
+
+def test_make_batches_long_sentence():
+    # A sentence over the bound is sent alone rather than dropped or split
+    assert make_batches(tokens(2, 10, 3), 4) == [[0], [2], [1]]
+    assert make_batches(tokens(10), 4) == [[0]]
+
+
+def test_make_batches_no_limit():
+    assert make_batches(tokens(300, 1, 700, 50), -1) == [[1, 3, 0, 2]]
+    assert make_batches([], -1) == []
+    assert make_batches([], 10) == []
+
+
+def test_translate_batch_keeps_order(translation):
+    texts = ["One two. Three four five.", "Six.\nSeven eight. Nine.", "", "Ten eleven twelve thirteen."]
+    assert translate_batch(translation, texts, max_batch_tokens=4) == [
+        "ONE TWO. THREE FOUR FIVE.",
+        "SIX.\nSEVEN EIGHT. NINE.",
+        "",
+        "TEN ELEVEN TWELVE THIRTEEN.",
+    ]
+    batches = translation.translator.batches
+    assert all(sum(len(sentence) for sentence in batch) <= 4 for batch in batches)
+    assert sum(len(batch) for batch in batches) == 6
+
+
+def test_translate_batch_single_call_without_limit(translation):
+    texts = ["One two. Three.", "Four five six.\nSeven."]
+    assert translate_batch(translation, texts, max_batch_tokens=-1) == ["ONE TWO. THREE.", "FOUR FIVE SIX.\nSEVEN."]
+    assert len(translation.translator.batches) == 1
+
+
+def test_translate_batch_composite(translation):
+    pivot = CompositeTranslation(translation, translation)
+    assert translate_batch(pivot, ["a b. c."]) == ["A B. C."]
+    assert len(translation.translator.batches) == 2
+
+
+def test_stanza_pipeline_is_not_shared_between_threads(translation):
+    errors = []
+
+    def run():
+        try:
+            for _ in range(20):
+                translate_batch(translation, ["One. Two.\nThree."])
+        except AssertionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
@@ -0,0 +1,90 @@
+import pytest
+
+from app.detect import CachedDetector, Detection, NgramDetector, group_by_language
+
+CODES = ["en", "es", "fr", "de"]
+TEXTS = {
+    "en": "Hello, how are you today? The weather is very nice.",
+    "es": "Hola, ¿cómo estás? El tiempo es muy bueno hoy.",
+    "fr": "Bonjour, comment allez-vous ? Il fait très beau aujourd'hui.",
+    "de": "Guten Tag, wie geht es Ihnen? Das Wetter ist heute sehr schön.",
+}
+
+
+@pytest.fixture(scope="module")
+def detector():
+    return NgramDetector(CODES)
+
+
+def langs(detections):
+    return [[d.lang for d in candidates] for candidates in detections]
+
+
+def test_batch_matches_detect(detector):
+    texts = [TEXTS["en"], "", TEXTS["es"], "12345 !!!", "", TEXTS["fr"], TEXTS["de"], ""]
+    batch = detector.detect_batch(texts)
+    assert len(batch) == len(texts)
+    for text, candidates in zip(texts, batch):
+        single = detector.detect(text)
+        assert [d.lang for d in candidates] == [d.lang for d in single]
+        assert [d.prob for d in candidates] == pytest.approx([d.prob for d in single])
+
+
+def test_texts_without_known_ngrams(detector):
+    assert detector.detect_batch([]) == []
+    assert detector.detect_batch([""]) == [[]]
+    assert detector.detect_batch(["", "12345", " "]) == [[], [], []]
+    # Unknown texts first, last and in between do not shift the others
+    assert langs(detector.detect_batch(["", TEXTS["es"]])) == [[], ["es"]]
+    assert langs(detector.detect_batch([TEXTS["es"], ""])) == [["es"], []]
+    assert langs(detector.detect_batch([TEXTS["en"], "", "", TEXTS["de"]])) == [["en"], [], [], ["de"]]
+    assert NgramDetector([]).detect_batch([TEXTS["en"]]) == [[]]
+
+
+class CountingBackend:
+    def __init__(self):
+        self.texts = []
+
+    def detect(self, text):
+        return self.detect_batch([text])[0]
+
+    def detect_batch(self, texts):
+        self.texts.extend(texts)
+        return [[Detection("en", 1.0)] if text else [] for text in texts]
+
+
+def test_cached_detector_hits_and_misses():
+    backend = CountingBackend()
+    detector = CachedDetector(backend, cache_size=2)
+
+    assert detector.detect_batch(["a", "b", "a", ""]) == [[Detection("en", 1.0)]] * 3 + [[]]
+    # Each missing text goes to the backend once
+    assert backend.texts == ["a", "b", ""]
+    assert detector.stats() == {'size': 2, 'hits': 0, 'misses': 4}
+
+    assert detector.detect("") == []
+    assert detector.detect_batch(["", "c"]) == [[], [Detection("en", 1.0)]]
+    assert backend.texts == ["a", "b", "", "c"]
+    assert detector.stats()['hits'] == 2
+
+
+def test_cached_detector_truncates_long_texts():
+    backend = CountingBackend()
+    detector = CachedDetector(backend, max_chars=10, cache_max_chars=5)
+    detector.detect_batch(["first second third", "first second third"])
+    assert backend.texts == ["first"]
+    assert detector.stats()['size'] == 0
+
+
+def test_mixed_language_batch_gets_source_per_item(detector):
+    texts = [TEXTS["es"], TEXTS["en"], TEXTS["es"], "", TEXTS["fr"]]
+    sources = [candidates[0].lang if candidates else "en" for candidates in detector.detect_batch(texts)]
+    assert sources == ["es", "en", "es", "en", "fr"]
+
+    groups = group_by_language(sources)
+    assert list(groups.items()) == [("es", [0, 2]), ("en", [1, 3]), ("fr", [4])]
+    translated = [None] * len(texts)
+    for lang, indices in groups.items():
+        for i in indices:
+            translated[i] = "%s:%s" % (lang, texts[i][:4])
+    assert translated == ["es:Hola", "en:Hell", "es:Hola", "en:", "fr:Bonj"]
@@ -0,0 +1,25 @@
+import os
+
+from app.downloads import DownloadCache
+from app.manifest import Manifest
+
+
+def test_lookup(tmp_path):
+    project_dir = tmp_path / "p1"
+    project_dir.mkdir()
+    (project_dir / "en.srt").write_text("subtitles")
+    (project_dir / "metadata.json").write_text("{}")
+
+    downloads = DownloadCache(str(tmp_path))
+    found = downloads.lookup("p1", "en.srt")
+    assert found.size == len("subtitles")
+    assert found.path == os.path.join(str(project_dir), "en.srt")
+    assert downloads.lookup("p1", "metadata.json") is None
+    assert downloads.lookup("p1", "es.srt") is None
+    assert downloads.lookup("p2", "en.srt") is None
+
+    # New files and manifest hashes are picked up
+    (project_dir / "es.srt").write_text("subtítulos")
+    digest = Manifest(str(project_dir)).record("en.srt", {})
+    assert downloads.lookup("p1", "es.srt") is not None
+    assert downloads.lookup("p1", "en.srt").etag == digest
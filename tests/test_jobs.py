@@ -0,0 +1,152 @@
+import os
+import sqlite3
+import threading
+
+from app import jobs as jobs_module
+from app.jobs import JobQueue, QUEUED, RUNNING, DONE, FAILED, STAGE_AUDIO, STAGE_STT
+
+
+def test_enqueue_once_per_project(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.db"))
+    job_id, created = jobs.enqueue("a", "/projects/a")
+    assert created
+    assert jobs.enqueue("a", "/projects/a") == (job_id, False)
+    assert jobs.enqueue("b", "/projects/b")[1]
+    assert jobs.queue_depth() == 2
+
+    # Running jobs are not queued twice either, finished ones are
+    assert jobs.claim(1)[0] == job_id
+    assert jobs.enqueue("a", "/projects/a") == (job_id, False)
+    jobs.finish(job_id)
+    assert jobs.enqueue("a", "/projects/a")[1]
+
+
+def test_claim_from_concurrent_workers(tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+    JobQueue(db_path)
+    for i in range(20):
+        JobQueue(db_path).enqueue("project %s" % i, "/projects/%s" % i)
+
+    # One connection per worker, as the worker processes have
+    claimed = []
+    claimed_lock = threading.Lock()
+
+    def worker(pid):
+        jobs = JobQueue(db_path)
+        while True:
+            job = jobs.claim(pid)
+            if job is None:
+                return
+            with claimed_lock:
+                claimed.append(job[0])
+
+    threads = [threading.Thread(target=worker, args=(pid, )) for pid in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(claimed) == list(range(1, 21))
+    c = sqlite3.connect(db_path)
+    assert c.execute('SELECT COUNT(*) FROM jobs WHERE status = ? AND attempts = 1', (RUNNING, )).fetchone()[0] == 20
+
+
+def test_requeue_until_max_attempts(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs_module, "pid_alive", lambda pid: False)
+    jobs = JobQueue(str(tmp_path / "jobs.db"), max_attempts=2)
+    job_id, _ = jobs.enqueue("a", "/projects/a")
+    other_id, _ = jobs.enqueue("b", "/projects/b")
+
+    assert jobs.claim(10)[0] == job_id
+    assert jobs.claim(11)[0] == other_id
+    jobs.requeue_worker(10)
+    assert jobs.status("a")['status'] == QUEUED
+    assert jobs.status("b")['status'] == RUNNING
+
+    # The respawned worker dies on it again
+    assert jobs.claim(12)[0] == job_id
+    jobs.requeue_worker(12)
+    status = jobs.status("a")
+    assert status['status'] == FAILED
+    assert "2 times" in status['error']
+    assert jobs.claim(13) is None
+
+    # Also counted when the server restarts after an unclean shutdown
+    jobs.requeue_running()
+    assert jobs.status("b")['status'] == QUEUED
+    assert jobs.claim(14)[0] == other_id
+    jobs.requeue_running()
+    assert jobs.status("b")['status'] == FAILED
+
+
+def test_requeue_running_keeps_live_and_remote_workers(tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+    local = JobQueue(db_path)
+    remote = JobQueue(db_path)
+    remote.host = "other-host"
+    for project_id in ["live", "dead", "remote"]:
+        local.enqueue(project_id, "/projects/" + project_id)
+
+    # A pid that is not running anymore
+    dead_pid = os.fork()
+    if dead_pid == 0:
+        os._exit(0)
+    os.waitpid(dead_pid, 0)
+    local.claim(os.getpid())
+    local.claim(dead_pid)
+    remote.claim(dead_pid)
+
+    local.requeue_running()
+    assert local.status("live")['status'] == RUNNING
+    assert local.status("dead")['status'] == QUEUED
+    assert local.status("remote")['status'] == RUNNING
+
+
+def test_status_percent(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.db"))
+    assert jobs.status("a") is None
+    job_id, _ = jobs.enqueue("a", "/projects/a")
+    assert jobs.status("a")['percent'] == 0
+
+    jobs.claim(1)
+    jobs.set_stages(job_id, [STAGE_AUDIO, STAGE_STT])
+    jobs.update_progress(job_id, STAGE_AUDIO, 100)
+    jobs.update_progress(job_id, STAGE_STT, 50)
+    status = jobs.status("a")
+    assert status['status'] == RUNNING
+    assert status['stage'] == STAGE_STT
+    assert status['percent'] == 75
+    assert status['stages'] == [{'name': STAGE_AUDIO, 'percent': 100}, {'name': STAGE_STT, 'percent': 50}]
+
+    jobs.finish(job_id)
+    status = jobs.status("a")
+    assert (status['status'], status['stage'], status['percent']) == (DONE, None, 100)
+
+
+def test_adds_attempts_to_old_queues(tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+    c = sqlite3.connect(db_path)
+    c.execute('''CREATE TABLE jobs ("id" INTEGER PRIMARY KEY AUTOINCREMENT, "project_id" TEXT NOT NULL,
+        "target_dir" TEXT NOT NULL, "status" TEXT NOT NULL, "stages" TEXT NOT NULL DEFAULT '[]',
+        "progress" TEXT NOT NULL DEFAULT '{}', "worker_pid" INTEGER, "error" TEXT,
+        "created" REAL NOT NULL, "updated" REAL NOT NULL)''')
+    c.execute('INSERT INTO jobs (project_id, target_dir, status, created, updated) VALUES (?, ?, ?, 0, 0)',
+              ("a", "/projects/a", QUEUED))
+    c.commit()
+
+    jobs = JobQueue(db_path)
+    assert jobs.claim(1)[1] == "a"
+
+
+def test_timings(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.db"))
+    assert jobs.last_timing_id() == 0
+    jobs.record_timings(1, [("load", 2.0), ("transcribe", 30.0)])
+    last_id = jobs.last_timing_id()
+    jobs.record_timings(2, [("transcribe", 10.0)])
+    assert [(stage, seconds) for timing_id, stage, seconds in jobs.timings_since(last_id)] == [("transcribe", 10.0)]
+
+    jobs.prune_timings(max_age=60)
+    assert len(jobs.timings_since(0)) == 3
+    jobs.prune_timings(max_age=-1)
+    assert jobs.timings_since(0) == []
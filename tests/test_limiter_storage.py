@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+from limits import RateLimitItemPerMinute
+from limits.strategies import MovingWindowRateLimiter
+
+from app.limiter_storage import MemoryCharacterCounter, RedisCharacterCounter, SQLiteCharacterCounter, SQLiteStorage
+
+
+def test_sqlite_storage_is_shared(tmp_path):
+    uri = "sqlite://%s" % (tmp_path / "limits.db")
+    item = RateLimitItemPerMinute(2)
+    # Two processes of the same host; limiters only keep a weak reference to their storage
+    storages = [SQLiteStorage(uri), SQLiteStorage(uri)]
+    first, second = [MovingWindowRateLimiter(storage) for storage in storages]
+
+    assert first.hit(item, "client")
+    assert second.hit(item, "client")
+    assert not first.hit(item, "client")
+    assert not second.hit(item, "client")
+    assert second.hit(item, "other")
+
+
+@pytest.mark.parametrize("counter", ["memory", "sqlite"])
+def test_character_counter(tmp_path, counter):
+    if counter == "memory":
+        chars = MemoryCharacterCounter()
+    else:
+        chars = SQLiteCharacterCounter("sqlite://%s" % (tmp_path / "limits.db"))
+
+    assert chars.hit("client", 60, 100)
+    assert not chars.hit("client", 50, 100)
+    assert chars.hit("client", 40, 100)
+    assert chars.hit("other", 100, 100)
+    # Hits older than the window no longer count
+    assert chars.hit("client", 100, 100, window=0)
+
+
+def test_redis_character_counter():
+    fakeredis = pytest.importorskip("fakeredis")
+    chars = RedisCharacterCounter("redis://localhost:6379", client=fakeredis.FakeRedis())
+
+    assert chars.hit("client", 60, 100)
+    assert not chars.hit("client", 50, 100)
+    assert chars.hit("client", 40, 100)
+
+
+def test_redis_character_counter_concurrent_replicas():
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    replicas = [RedisCharacterCounter("redis://localhost:6379", client=fakeredis.FakeRedis(server=server))
+                for _ in range(8)]
+    allowed = []
+
+    def hit(chars):
+        for _ in range(20):
+            allowed.append(chars.hit("client", 10, 100))
+
+    threads = [threading.Thread(target=hit, args=(chars, )) for chars in replicas]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert 0 < allowed.count(True) <= 10
+    # Rejected hits gave their characters back
+    client = fakeredis.FakeRedis(server=server)
+    assert sum(int(client.get(key)) for key in client.keys("LT/characters/client/*")) == 10 * allowed.count(True)
@@ -0,0 +1,38 @@
+import os
+
+from app.manifest import Manifest, file_hash
+
+
+def write(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def test_up_to_date_follows_inputs(tmp_path):
+    project_dir = str(tmp_path)
+    write(os.path.join(project_dir, "audio.wav"), "audio")
+    write(os.path.join(project_dir, "words.json"), "[]")
+
+    manifest = Manifest(project_dir)
+    inputs = {"audio.wav": manifest.hash("audio.wav")}
+    assert not manifest.up_to_date("words.json", inputs)
+    manifest.record("words.json", inputs)
+    assert manifest.up_to_date("words.json", inputs)
+
+    # Reloaded from disk
+    manifest = Manifest(project_dir)
+    assert manifest.up_to_date("words.json", {"audio.wav": manifest.hash("audio.wav")})
+
+    write(os.path.join(project_dir, "audio.wav"), "other audio")
+    assert not manifest.up_to_date("words.json", {"audio.wav": manifest.hash("audio.wav")})
+
+
+def test_hash(tmp_path):
+    project_dir = str(tmp_path)
+    path = os.path.join(project_dir, "en.srt")
+    write(path, "subtitles")
+
+    manifest = Manifest(project_dir)
+    assert manifest.hash("en.srt") == file_hash(path)
+    assert manifest.hash("missing.srt") is None
+    assert not manifest.up_to_date("missing.srt", {})
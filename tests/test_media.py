@@ -0,0 +1,80 @@
+import json
+import os
+
+import ffmpeg
+import pytest
+
+from app import media
+from app.media import MediaProbePool, PROBE_DONE, PROBE_FAILED
+
+AUDIO = {'codec_type': 'audio', 'duration': '12.5'}
+VIDEO = {'codec_type': 'video', 'width': 1280, 'height': 720, 'disposition': {'attached_pic': 0}}
+COVER_ART = {'codec_type': 'video', 'width': 600, 'height': 600, 'disposition': {'attached_pic': 1}}
+
+
+@pytest.fixture
+def project(tmp_path):
+    project_dir = tmp_path / "a"
+    project_dir.mkdir()
+    with open(str(project_dir / "metadata.json"), 'w') as f:
+        json.dump({"name": "A", "fileEnding": "mp3", "probe": "pending"}, f)
+    return tmp_path
+
+
+def probed(project_directory, monkeypatch, probe, thumbnails=None):
+    monkeypatch.setattr(media.ffmpeg, "probe", probe)
+    monkeypatch.setattr(media, "create_thumbnails", thumbnails or (lambda *args: {"512": "thumbnail.png"}))
+    done = []
+    MediaProbePool(str(project_directory), size=0, on_done=done.append).process("a")
+    assert done == ["a"]
+    with open(os.path.join(str(project_directory), "a", "metadata.json")) as f:
+        return json.load(f)
+
+
+def test_audio_only(project, monkeypatch):
+    metadata = probed(project, monkeypatch, lambda path: {'streams': [AUDIO], 'format': {}})
+    assert metadata['probe'] == PROBE_DONE
+    assert metadata['hasAudio'] and not metadata['hasVideo']
+    assert metadata['durationSeconds'] == 12.5
+    assert 'thumbnails' not in metadata
+
+
+def test_cover_art_is_not_video(project, monkeypatch):
+    metadata = probed(project, monkeypatch, lambda path: {'streams': [COVER_ART, AUDIO], 'format': {'duration': '13.0'}})
+    assert metadata['probe'] == PROBE_DONE
+    assert not metadata['hasVideo']
+    assert 'width' not in metadata and 'thumbnails' not in metadata
+
+
+def test_video(project, monkeypatch):
+    metadata = probed(project, monkeypatch, lambda path: {'streams': [COVER_ART, VIDEO, AUDIO], 'format': {}})
+    assert (metadata['hasVideo'], metadata['width'], metadata['height']) == (True, 1280, 720)
+    assert metadata['thumbnails'] == {"512": "thumbnail.png"}
+
+
+def test_failing_thumbnail_keeps_probe(project, monkeypatch):
+    def thumbnails(*args):
+        raise ffmpeg.Error("ffmpeg", b"", b"Invalid frame")
+
+    metadata = probed(project, monkeypatch, lambda path: {'streams': [VIDEO, AUDIO], 'format': {'duration': '5'}},
+                      thumbnails)
+    assert metadata['probe'] == PROBE_DONE
+    assert metadata['durationSeconds'] == 5.0
+    assert metadata['thumbnailError'] == "Invalid frame"
+    assert 'thumbnails' not in metadata
+
+
+def test_failing_probe(project, monkeypatch):
+    def probe(path):
+        raise ffmpeg.Error("ffprobe", b"", b"Invalid data found when processing input")
+
+    metadata = probed(project, monkeypatch, probe)
+    assert metadata['probe'] == PROBE_FAILED
+    assert metadata['probeError'] == "Invalid data found when processing input"
+
+
+def test_unexpected_probe_output(project, monkeypatch):
+    # A video stream without a frame size
+    metadata = probed(project, monkeypatch, lambda path: {'streams': [{'codec_type': 'video'}], 'format': {}})
+    assert metadata['probe'] == PROBE_FAILED
+    assert metadata['probeError'] == "'width'"
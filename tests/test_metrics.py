@@ -0,0 +1,38 @@
+from app.metrics import Registry, timeit
+
+
+def test_exposition():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ["route"])
+    latency = registry.histogram("latency_seconds", "Latency", ["route"], buckets=(0.1, 1))
+    registry.gauge("queue_depth", "Queue", lambda: 3)
+    assert registry.counter("requests_total", "Requests", ["route"]) is requests
+
+    requests.inc("/translate")
+    requests.inc("/translate", amount=2)
+    latency.observe(0.05, "/translate")
+    latency.observe(0.5, "/translate")
+    latency.observe(5, "/translate")
+
+    lines = registry.exposition().splitlines()
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{route="/translate"} 3' in lines
+    assert 'latency_seconds_bucket{route="/translate",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/translate",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{route="/translate",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{route="/translate"} 3' in lines
+    assert 'latency_seconds_sum{route="/translate"} 5.55' in lines
+    assert "queue_depth 3" in lines
+
+
+def test_timeit(monkeypatch):
+    timings = []
+    monkeypatch.setattr("app.metrics.timing_listeners", [lambda stage, seconds: timings.append(stage)])
+
+    @timeit
+    def build_srt_chunks():
+        return "chunks"
+
+    assert build_srt_chunks() == "chunks"
+    assert build_srt_chunks.__name__ == "build_srt_chunks"
+    assert timings == ["build_srt_chunks"]
@@ -0,0 +1,53 @@
+import json
+import os
+
+from app.projects import ProjectIndex
+
+
+def create_project(project_directory, project_id, name, created, subtitles=()):
+    project_dir = os.path.join(project_directory, project_id)
+    os.makedirs(project_dir)
+    with open(os.path.join(project_dir, "metadata.json"), 'w') as f:
+        json.dump({"name": name, "fileEnding": "mp4", "created": created, "durationSeconds": created}, f)
+    for file in subtitles:
+        open(os.path.join(project_dir, file), 'w').close()
+
+
+def test_list(tmp_path):
+    project_directory = str(tmp_path / "projects")
+    create_project(project_directory, "a", "Alpha", 1, ["en.srt", "subtitles.zip"])
+    create_project(project_directory, "b", "beta", 2)
+    create_project(project_directory, "c", "Gamma 100%", 3, ["en.srt"])
+    os.makedirs(os.path.join(project_directory, "not-a-project"))
+
+    index = ProjectIndex(str(tmp_path / "projects.db"), project_directory)
+    assert index.rebuild() == 3
+
+    projects, total = index.list()
+    assert total == 3
+    assert [p['id'] for p in projects] == ["c", "b", "a"]
+    assert projects[2]['subtitles'] == ["subtitles.zip", "en.srt"]
+
+    projects, total = index.list(offset=1, limit=1, sort='name', order='asc')
+    assert total == 3
+    assert [p['id'] for p in projects] == ["b"]
+
+    assert [p['id'] for p in index.list(q="100%")[0]] == ["c"]
+    assert [p['id'] for p in index.list(transcribed=False)[0]] == ["b"]
+
+
+def test_refresh_and_remove(tmp_path):
+    project_directory = str(tmp_path / "projects")
+    create_project(project_directory, "a", "Alpha", 1)
+    index = ProjectIndex(str(tmp_path / "projects.db"), project_directory)
+    index.rebuild()
+    assert index.get("a")['subtitles'] == []
+
+    open(os.path.join(project_directory, "a", "en.srt"), 'w').close()
+    index.refresh("a")
+    assert index.get("a")['subtitles'] == ["en.srt"]
+    assert index.list(transcribed=True)[1] == 1
+
+    index.remove("a")
+    assert index.get("a") is None
+    assert index.list()[1] == 0
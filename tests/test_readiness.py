@@ -0,0 +1,50 @@
+import threading
+
+import pytest
+
+from app.readiness import ModelLoader
+
+
+def test_models_load_in_parallel():
+    models = ModelLoader()
+    release = threading.Event()
+    models.submit("slow", lambda: release.wait(5) and "slow model")
+    models.submit("fast", lambda: "fast model")
+    models.skip("stt")
+
+    assert models.get("fast", timeout=5) == "fast model"
+    assert not models.ready()
+    assert models.status()["slow"] == {'state': "loading"}
+    assert models.status()["stt"] == {'state': "skipped"}
+
+    release.set()
+    assert models.get("slow", timeout=5) == "slow model"
+    assert models.ready()
+
+
+def test_failed_model():
+    models = ModelLoader()
+
+    def load():
+        raise IOError("missing model")
+
+    models.submit("broken", load)
+    with pytest.raises(IOError):
+        models.get("broken", timeout=5)
+    assert not models.ready()
+    assert models.status()["broken"] == {'state': "failed", 'error': "missing model"}
+
+
+def test_optional_model_does_not_hold_up_readiness():
+    models = ModelLoader()
+
+    def load():
+        raise IOError("missing model")
+
+    models.submit("languages", lambda: "languages")
+    models.submit("stt", load, required=False)
+    assert models.get("languages", timeout=5) == "languages"
+    with pytest.raises(IOError):
+        models.get("stt", timeout=5)
+    assert models.ready()
+    assert models.status()["stt"] == {'state': "failed", 'error': "missing model"}
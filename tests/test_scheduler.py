@@ -0,0 +1,75 @@
+import threading
+from app.scheduler import BatchScheduler
+
+
+def test_scheduler_coalesces_concurrent_requests():
+    """Test requests arriving within the window share one batch"""
+    batches = []
+
+    def translate_fn(translator, texts):
+        batches.append(list(texts))
+        return [translator + text for text in texts]
+
+    scheduler = BatchScheduler(translate_fn, window=0.2, max_batch_size=4)
+    results = {}
+
+    def request(text):
+        results[text] = scheduler.translate("en", "es", "es:", [text])
+
+    threads = [threading.Thread(target=request, args=(t, )) for t in ["a", "b", "c", "d"]]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == {"a": ["es:a"], "b": ["es:b"], "c": ["es:c"], "d": ["es:d"]}
+    assert len(batches) == 1
+    assert sorted(batches[0]) == ["a", "b", "c", "d"]
+
+
+def test_scheduler_queue_depth():
+    """Test requests waiting behind a running batch are reported per pair"""
+    started = threading.Event()
+    release = threading.Event()
+
+    def translate_fn(translator, texts):
+        started.set()
+        release.wait(5)
+        return texts
+
+    scheduler = BatchScheduler(translate_fn, window=0.01, max_batch_size=1)
+    assert scheduler.queue_depth() == {}
+    futures = [scheduler.submit("en", "es", None, [text]) for text in ["a", "b", "c"]]
+    started.wait(5)
+    assert scheduler.queue_depth() == {("en", "es"): 2}
+
+    release.set()
+    assert [f.result(5) for f in futures] == [["a"], ["b"], ["c"]]
+    assert scheduler.queue_depth() == {("en", "es"): 0}
+
+
+def test_scheduler_uses_translator_of_each_batch():
+    """Test a batch runs with the translator of its requests, not the first one seen for the pair"""
+    translators = []
+
+    def translate_fn(translator, texts):
+        translators.append(translator)
+        return texts
+
+    scheduler = BatchScheduler(translate_fn, window=0.01)
+    assert scheduler.translate("en", "es", "first", ["a"]) == ["a"]
+    assert scheduler.translate("en", "es", "reloaded", ["b"]) == ["b"]
+    assert translators == ["first", "reloaded"]
+
+
+def test_scheduler_stops_idle_pair_workers():
+    """Test the worker thread of a pair exits when idle and a new one starts on the next request"""
+    scheduler = BatchScheduler(lambda translator, texts: texts, window=0.01, idle_timeout=0.1)
+    assert scheduler.translate("en", "es", None, ["a"]) == ["a"]
+    worker = scheduler.workers[("en", "es")]
+
+    worker.thread.join(5)
+    assert not worker.thread.is_alive()
+    assert scheduler.queue_depth() == {}
+    assert scheduler.translate("en", "es", None, ["b"]) == ["b"]
+    assert scheduler.workers[("en", "es")] is not worker
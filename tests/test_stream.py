@@ -0,0 +1,63 @@
+import io
+import json
+
+from app.stream import SentenceSplitter, encode_stream_item, iter_text_chunks
+
+
+def split(chunks, **kwargs):
+    splitter = SentenceSplitter(**kwargs)
+    segments = []
+    for chunk in chunks:
+        segments += splitter.feed(chunk)
+    return segments + splitter.flush()
+
+
+def test_sentences_split_across_chunks():
+    text = "Hello world! How are you?\nFine, thanks. Bye."
+    expected = [("Hello world!", " "), ("How are you?", "\n"), ("Fine, thanks.", " "), ("Bye.", "")]
+    assert split([text]) == expected
+    # Same segments whatever the chunk boundaries, including inside the separators
+    assert split(list(text)) == expected
+    assert split(["Hello wor", "ld! ", "How are you?", "\nFine, thanks.", " Bye."]) == expected
+    assert "".join(t + s for t, s in split(list(text))) == text
+
+
+def test_sentences_wait_for_the_next_chunk():
+    splitter = SentenceSplitter()
+    # The whitespace may continue, the sentence is only complete with the next chunk
+    assert splitter.feed("One. ") == []
+    assert splitter.feed(" Two") == [("One.", "  ")]
+    assert splitter.flush() == [("Two", "")]
+
+
+def test_trailing_fragment_without_newline():
+    assert split(["First line.\nno end"]) == [("First line.", "\n"), ("no end", "")]
+    assert split(["text ", "  "]) == [("text", "   ")]
+    assert split(["   "]) == [("", "   ")]
+    assert split([]) == []
+
+
+def test_long_text_without_boundaries():
+    segments = split(["word " * 10], max_segment_chars=12)
+    assert all(len(text) <= 12 for text, _ in segments)
+    assert "".join(t + s for t, s in segments) == "word " * 10
+
+
+def test_iter_text_chunks_keeps_multibyte_characters():
+    data = "¡Olé! 你好。".encode('utf-8')
+    chunks = list(iter_text_chunks(io.BytesIO(data), chunk_size=1))
+    assert "".join(chunks) == "¡Olé! 你好。"
+    assert "�" not in "".join(chunks)
+
+
+def test_sse_framing():
+    item = {"index": 0, "translatedText": "Hola\nmundo", "separator": "\n"}
+    event = encode_stream_item(item, "sse")
+    assert event.startswith("data: ") and event.endswith("\n\n")
+    # Line breaks of the text are escaped, one event is one data line
+    assert event.count("\n") == 2
+    assert json.loads(event[len("data: "):]) == item
+
+    line = encode_stream_item(item, "ndjson")
+    assert line.endswith("\n") and line.count("\n") == 1
+    assert json.loads(line) == item
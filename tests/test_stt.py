@@ -0,0 +1,49 @@
+import importlib
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from app import stt
+
+
+class FakeModel:
+    def __init__(self, path):
+        if path.endswith(".tflite"):
+            raise RuntimeError("CreateModel failed with 'Error reading the proto buffer model file.'")
+        self.path = path
+
+    def enableExternalScorer(self, path):
+        self.scorer = path
+
+
+def test_model_files(tmp_path):
+    models_dir = str(tmp_path)
+    pbmm = os.path.join(models_dir, stt.MODEL_NAME + ".pbmm")
+    tflite = os.path.join(models_dir, stt.MODEL_NAME + ".tflite")
+    assert stt.model_files(models_dir, "auto") == [pbmm]
+    assert stt.model_files(models_dir, "tflite") == [tflite]
+
+    (tmp_path / (stt.MODEL_NAME + ".tflite")).write_bytes(b"")
+    assert stt.model_files(models_dir, "auto") == [tflite, pbmm]
+    assert stt.model_files(models_dir, "pbmm") == [pbmm]
+
+
+def test_auto_falls_back_to_pbmm(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "deepspeech", SimpleNamespace(Model=FakeModel))
+    (tmp_path / (stt.MODEL_NAME + ".tflite")).write_bytes(b"")
+
+    ds, path = stt.load_model(str(tmp_path), "auto")
+    assert path.endswith(".pbmm")
+    assert ds.scorer.endswith(".scorer")
+    assert not stt.shared_after_fork(path)
+
+
+def test_import_does_not_load_runtime(tmp_path, monkeypatch):
+    """Test the deepspeech runtime is only imported when a model is loaded"""
+    # None in sys.modules makes importing deepspeech fail
+    monkeypatch.setitem(sys.modules, "deepspeech", None)
+    importlib.reload(stt)
+    with pytest.raises(ImportError):
+        stt.load_model(str(tmp_path), "pbmm")
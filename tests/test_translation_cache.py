@@ -0,0 +1,46 @@
+import os
+from app.translation_cache import TranslationCache
+
+
+def test_translation_cache_only_translates_misses(tmpdir):
+    """Test cached texts are not sent to the model again, including after a restart"""
+    db_path = os.path.join(str(tmpdir), "cache.db")
+    calls = []
+
+    def translate_fn(texts):
+        calls.append(list(texts))
+        return [text.strip().upper() for text in texts]
+
+    cache = TranslationCache(max_size=10, ttl=-1, db_path=db_path)
+    assert cache.translate("en", "es", ["a", "b", "a"], translate_fn) == ["A", "B", "A"]
+    assert cache.translate("en", "es", ["b", " c"], translate_fn) == ["B", "C"]
+    assert cache.translate("en", "fr", ["a"], translate_fn) == ["A"]
+    assert calls == [["a", "b"], [" c"], ["a"]]
+    assert cache.stats()['memory']['hits'] == 1
+
+    restarted = TranslationCache(max_size=10, ttl=-1, db_path=db_path)
+    assert restarted.translate("en", "es", ["c", "a"], translate_fn) == ["C", "A"]
+    assert len(calls) == 3
+    assert restarted.stats()['disk']['hits'] == 2
+
+
+def test_translation_cache_disabled():
+    """Test a zero sized cache passes everything through"""
+    cache = TranslationCache(max_size=0)
+    assert not cache.enabled()
+    assert cache.translate("en", "es", ["a"], lambda texts: ["x"]) == ["x"]
+
+
+def test_sqlite_tier_counts_replaced_keys_once(tmpdir):
+    """Test storing keys again does not grow the count and evict early"""
+    db_path = os.path.join(str(tmpdir), "cache.db")
+    cache = TranslationCache(max_size=0, ttl=-1, db_path=db_path, db_max_size=3)
+    cache.disk.set_many([("a", "A"), ("b", "B"), ("a", "A2")])
+    cache.disk.set_many([("a", "A3"), ("b", "B2")])
+    cache.disk.set_many([("c", "C")])
+    assert cache.disk.size() == 3
+    assert [cache.disk.get(key) for key in ("a", "b", "c")] == ["A3", "B2", "C"]
+
+    cache.disk.set_many([("d", "D")])
+    assert cache.disk.size() == 3
+    assert cache.disk.get("d") == "D"
@@ -0,0 +1,103 @@
+from pathlib import Path
+from types import SimpleNamespace
+
+from argostranslate.translate import CompositeTranslation, Language, PackageTranslation
+
+from app import batching
+from app.batching import release_translation
+from app.translator_cache import TranslatorCache
+
+
+class FakeLanguage:
+    def __init__(self, code):
+        self.code = code
+        self.name = code
+        self.resolved = 0
+
+    def get_translation(self, to):
+        self.resolved += 1
+        return (self.code, to.code)
+
+
+def test_translator_cache_hits_and_eviction():
+    """Test pair lookups are cached and evicted in LRU order"""
+    en, es, fr = FakeLanguage("en"), FakeLanguage("es"), FakeLanguage("fr")
+    translators = TranslatorCache([en, es, fr], max_size=2)
+
+    assert translators.get("en", "es") == ("en", "es")
+    assert translators.get("en", "es") == ("en", "es")
+    assert en.resolved == 1
+
+    translators.get("en", "fr")
+    translators.get("es", "fr")
+    assert translators.get("xx", "es") is None
+
+    stats = translators.stats()
+    assert stats['size'] == 2
+    assert stats['hits'] == 1
+    assert stats['misses'] == 4
+    assert stats['evictions'] == 1
+
+    translators.get("en", "es")
+    assert en.resolved == 3
+
+
+def test_warm_loads_each_pair():
+    """Test warm resolves the pairs and loads their models, skipping pairs that fail"""
+    en, es, fr = FakeLanguage("en"), FakeLanguage("es"), FakeLanguage("fr")
+    translators = TranslatorCache([en, es, fr], max_size=-1)
+    loaded = []
+
+    def load(source, target, translator):
+        if (source, target) == ("es", "fr"):
+            raise RuntimeError("missing model")
+        loaded.append(translator)
+
+    translators.warm(load=load)
+    assert translators.stats()['size'] == 6
+    assert len(loaded) == 5
+    assert ("en", "es") in loaded and ("es", "fr") not in loaded
+
+    translators = TranslatorCache([en, es, fr], max_size=2)
+    translators.warm([("en", "es"), ("en", "fr"), ("fr", "es")])
+    assert translators.stats()['size'] == 2
+
+
+def package_translation(from_lang, to_lang):
+    pkg = SimpleNamespace(package_path=Path("/packages/%s_%s" % (from_lang.code, to_lang.code)), from_code=from_lang.code)
+    translation = PackageTranslation(from_lang, to_lang, pkg)
+    from_lang.translations_from.append(translation)
+    return translation
+
+
+def loaded(translation):
+    """Whether the model or the processors of a package are in memory"""
+    return translation.translator is not None or str(translation.pkg.package_path) in batching._processors
+
+
+def test_evicted_pairs_release_their_models(monkeypatch):
+    """Test evicting a pair unloads the models it does not share with the cached pairs"""
+    monkeypatch.setattr(batching, "_processors", {})
+    en, es, fr = Language("en", "English"), Language("es", "Spanish"), Language("fr", "French")
+    en_es = package_translation(en, es)
+    es_fr = package_translation(es, fr)
+    en.translations_from.append(CompositeTranslation(en_es, es_fr))
+    translators = TranslatorCache([en, es, fr], max_size=1, release=release_translation)
+
+    def load(translation):
+        translation.translator = object()
+        batching._processors[str(translation.pkg.package_path)] = (object(), object(), object())
+
+    # en -> fr pivots through es
+    translators.get("en", "fr")
+    load(en_es)
+    load(es_fr)
+
+    # es -> fr still uses its package, en -> es is unloaded
+    assert translators.get("es", "fr") is es_fr
+    assert not loaded(en_es)
+    assert loaded(es_fr)
+
+    assert translators.get("en", "es") is en_es
+    assert not loaded(es_fr)
+    assert translators.stats()['evictions'] == 2
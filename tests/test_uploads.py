@@ -0,0 +1,75 @@
+import hashlib
+import io
+import json
+import os
+
+import pytest
+
+from app.uploads import UploadStore, OffsetMismatch
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_resumable_upload(tmp_path):
+    store = UploadStore(str(tmp_path), {'mp4'}, chunk_size=4)
+    data = b"0123456789"
+    state = store.create("Lecture", "lecture.mp4", len(data))
+    project_id = state["id"]
+
+    state = store.write_chunk(project_id, 0, io.BytesIO(data[:4]), 4, sha256(data[:4]))
+    assert state["offset"] == 4
+
+    # A corrupted chunk is rolled back
+    with pytest.raises(ValueError):
+        store.write_chunk(project_id, 4, io.BytesIO(b"xxxx"), 4, sha256(data[4:8]))
+    # A chunk that does not start at the current offset is refused
+    with pytest.raises(OffsetMismatch) as e:
+        store.write_chunk(project_id, 8, io.BytesIO(data[8:]), 2, sha256(data[8:]))
+    assert e.value.offset == 4
+    assert store.state(project_id)["offset"] == 4
+
+    store.write_chunk(project_id, 4, io.BytesIO(data[4:8]), 4, sha256(data[4:8]))
+    state = store.write_chunk(project_id, 8, io.BytesIO(data[8:]), 2, sha256(data[8:]))
+    assert state["complete"]
+
+    project_dir = os.path.join(str(tmp_path), project_id)
+    with open(os.path.join(project_dir, "rawMedia.mp4"), 'rb') as f:
+        assert f.read() == data
+    with open(os.path.join(project_dir, "metadata.json")) as f:
+        assert json.load(f)["name"] == "Lecture"
+
+
+def test_invalid_uploads(tmp_path):
+    store = UploadStore(str(tmp_path), {'mp4'}, chunk_size=4)
+    with pytest.raises(ValueError):
+        store.create("Lecture", "lecture.exe", 10)
+    state = store.create("Lecture", "lecture.mp4", 2)
+    with pytest.raises(ValueError):
+        store.write_chunk(state["id"], 0, io.BytesIO(b"12345"), 5, sha256(b"12345"))
+    with pytest.raises(ValueError):
+        store.write_chunk(state["id"], 0, io.BytesIO(b"123"), 3, sha256(b"123"))
+    assert store.write_chunk("missing", 0, io.BytesIO(b"1"), 1, sha256(b"1")) is None
+
+
+def test_expire_abandoned_uploads(tmp_path):
+    store = UploadStore(str(tmp_path), {'mp4'}, chunk_size=4)
+    abandoned = store.create("Abandoned", "a.mp4", 8)["id"]
+    store.write_chunk(abandoned, 0, io.BytesIO(b"0123"), 4, sha256(b"0123"))
+    active = store.create("Active", "b.mp4", 8)["id"]
+    complete = store.create("Complete", "c.mp4", 4)["id"]
+    store.write_chunk(complete, 0, io.BytesIO(b"0123"), 4, sha256(b"0123"))
+    os.makedirs(os.path.join(str(tmp_path), "not-an-upload"))
+
+    # The abandoned upload and the complete one got their last chunk a day ago
+    day_ago = os.path.getmtime(os.path.join(str(tmp_path), active, "upload.json")) - 24 * 60 * 60
+    for project_id in (abandoned, complete):
+        os.utime(os.path.join(str(tmp_path), project_id, "upload.json"), (day_ago, day_ago))
+
+    assert store.expire(max_age=60 * 60) == [abandoned]
+    assert not os.path.exists(os.path.join(str(tmp_path), abandoned))
+    assert store.state(active)["offset"] == 0
+    assert os.path.exists(os.path.join(str(tmp_path), complete, "rawMedia.mp4"))
+    assert os.path.exists(os.path.join(str(tmp_path), "not-an-upload"))
+    assert store.expire(max_age=60 * 60) == []
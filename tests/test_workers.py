@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from app import batching, workers
+from app.workers import WorkerPool
+
+
+def echo_worker(conn, max_batch_tokens, detector, translator_cache_size):
+    """Answers every job with the pid of the process, exits on crash jobs"""
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        job_id, kind, payload = message
+        if kind == 'crash':
+            os._exit(1)
+        conn.send((job_id, True, (os.getpid(), payload)))
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(3, -1, None, target=echo_worker)
+    yield pool
+    pool.close()
+
+
+def test_pairs_always_go_to_the_same_worker(pool):
+    pairs = [("en", "es"), ("es", "en"), ("en", "fr"), ("fr", "de"), ("de", "en"), ("en", "it")]
+    pids = {}
+    for _ in range(3):
+        for source, target in pairs:
+            pid, payload = pool.translate(source, target, ["text"])
+            assert payload == (source, target, ["text"])
+            assert pids.setdefault((source, target), pid) == pid
+
+    # Routing only depends on the pair, not on the run (crc32 of "en-es")
+    assert pool.workers.index(pool.worker_for_pair("en", "es")) == 2904221127 % 3
+    assert len(set(pids.values())) > 1
+
+
+def test_crashed_worker_is_restarted(pool, monkeypatch):
+    monkeypatch.setattr(workers, "MIN_WORKER_LIFETIME", 0.5)
+    worker = pool.worker_for_pair("en", "es")
+    pid, _ = pool.translate("en", "es", ["a"])
+
+    started = time.time()
+    with pytest.raises(RuntimeError, match="exited"):
+        worker.submit(-1, 'crash', None).result(timeout=30)
+
+    # The worker died right after starting, it comes back after MIN_WORKER_LIFETIME
+    deadline = time.time() + 30
+    while True:
+        try:
+            new_pid, _ = pool.translate("en", "es", ["a"])
+            break
+        except RuntimeError:
+            assert time.time() < deadline
+            time.sleep(0.1)
+    assert new_pid != pid
+    assert time.time() - started >= 0.4
+
+
+def test_translator_is_created_once(monkeypatch):
+    created = []
+
+    def translator(path):
+        created.append(path)
+        time.sleep(0.1)
+        return SimpleNamespace(path=path)
+
+    monkeypatch.setattr(batching.ctranslate2, "Translator", translator)
+    translation = SimpleNamespace(translator=None, pkg=SimpleNamespace(package_path=Path("/packages/en_es")))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(batching.get_translator(translation))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert created == [str(Path("/packages/en_es") / "model")]
+    assert all(result is results[0] for result in results)